@@ -1,2 +1,14 @@
 from .test_single_layer_conv import *
 from .test_to_dense import *
+from .test_voxelize import *
+from .test_kernel_map import *
+from .test_quantize import *
+from .test_tensor_cache import *
+from .test_import import *
+from .test_segment import *
+from .test_fuse import *
+from .test_pooling import *
+from .test_bev import *
+from .test_operators import *
+from .test_streaming import *
+from .test_reorder import *
@@ -0,0 +1,104 @@
+from typing import Any, Dict, Tuple, Union, Optional, List
+
+import numpy as np
+import torch
+
+import torchsparse
+from torchsparse import nn as spnn
+
+from .test_utils import generate_feature_map, sort_rows
+
+__all__ = ["test_bev_modules"]
+
+
+def _compare_rows(outputs, ref_coords: torch.Tensor, ref_feats: torch.Tensor):
+    # (number of mismatched output coordinates, max abs diff of the features)
+    out_coords, out_feats = sort_rows(outputs.coords.cpu(), outputs.feats.cpu())
+    out_rows = set(map(tuple, out_coords.tolist()))
+    num_mismatch = len(out_rows.symmetric_difference(map(tuple, ref_coords.tolist())))
+    num_mismatch += out_coords.shape[0] - len(out_rows)
+    if num_mismatch > 0:
+        return num_mismatch, float("inf")
+    return 0, (out_feats - ref_feats).abs().max().item()
+
+
+def test_bev_modules(
+    batch_size: int = 2,
+    shape: Tuple[int, int, int] = (8, 8, 8),
+    num_points: int = 200,
+    in_channels: int = 8,
+    out_channels: int = 16,
+    device="cpu",
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    sparse_dict = generate_feature_map(
+        shape, [num_points] * batch_size, in_channels, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).double()
+    inputs = torchsparse.SparseTensor(feats.to(device), coords.to(device))
+
+    # references: coalesced COO tensors with a per-row kernel product
+    num_mismatch, max_adiff = 0, 0.0
+
+    reduction = spnn.ToBEVReduction(dim=1)
+    outputs = reduction(inputs)
+    ref_coords = coords.clone()
+    ref_coords[:, 1] = 0
+    ones = torch.ones_like(feats[:, :1])
+    ref = torch.sparse_coo_tensor(
+        ref_coords.t().long(), torch.cat([ones, feats], 1)
+    ).coalesce()
+    ref_feats = ref.values()[:, 1:] / ref.values()[:, :1]
+    mismatch, adiff = _compare_rows(outputs, ref.indices().t(), ref_feats)
+    num_mismatch, max_adiff = num_mismatch + mismatch, max(max_adiff, adiff)
+
+    conv = spnn.ToBEVConvolution(
+        in_channels, out_channels, shape[0], stride=2, dim=1, bias=True
+    ).double()
+    torch.nn.init.uniform_(conv.bias)
+    outputs = conv.to(device)(inputs)
+    kernels = conv.kernel.cpu()[coords[:, 1].long()]
+    ref_feats = (feats.unsqueeze(-1) * kernels).sum(1) + conv.bias.cpu()
+    ref_coords = coords.clone().long()
+    ref_coords[:, 1] = 0
+    ref_coords[:, 1:] = torch.div(ref_coords[:, 1:], 2, rounding_mode="floor")
+    ref = torch.sparse_coo_tensor(ref_coords.t(), ref_feats).coalesce()
+    mismatch, adiff = _compare_rows(outputs, ref.indices().t(), ref.values())
+    num_mismatch, max_adiff = num_mismatch + mismatch, max(max_adiff, adiff)
+
+    dense_conv = spnn.ToDenseBEVConvolution(
+        in_channels, out_channels, shape, dim=1
+    ).double()
+    outputs = dense_conv.to(device)(inputs).cpu()
+    kernels = dense_conv.kernel.cpu()[coords[:, 1].long()]
+    ref_feats = (feats.unsqueeze(-1) * kernels).sum(1)
+    ref_coords = coords.t()[[0] + dense_conv.bev_dims].long()
+    bev_shape = dense_conv.bev_shape.cpu()
+    indices = (
+        ref_coords[0] * int(bev_shape.prod())
+        + ref_coords[1] * int(bev_shape[1])
+        + ref_coords[2]
+    )
+    ref = torch.sparse_coo_tensor(
+        indices.unsqueeze(0),
+        ref_feats,
+        torch.Size([batch_size * int(bev_shape.prod()), out_channels]),
+    ).to_dense()
+    ref = ref.view(batch_size, *bev_shape.tolist(), -1).permute(0, 3, 1, 2)
+    max_adiff = max(max_adiff, (outputs - ref).abs().max().item())
+
+    # rows landing in the same cell are summed into a dense (Z x C)-channel map
+    compression = spnn.ToBEVHeightCompression(in_channels, shape, dim=1)
+    outputs = compression.to(device)(inputs).cpu()
+    dims = [0] + compression.bev_dims + [compression.dim]
+    ref_coords = coords.t()[dims].long()
+    dense_shape = compression.shape.cpu()[dims[1:]].tolist()
+    ref_coords[-1] = ref_coords[-1].clamp(0, dense_shape[-1] - 1)
+    ref = feats.new_zeros(batch_size, *dense_shape, in_channels)
+    ref.index_put_(tuple(ref_coords), feats, accumulate=True)
+    ref = ref.view(batch_size, *dense_shape[:2], -1).permute(0, 3, 1, 2)
+    max_adiff = max(max_adiff, (outputs - ref).abs().max().item())
+    return num_mismatch, max_adiff
@@ -0,0 +1,51 @@
+from typing import Any, Dict, Tuple, Union, Optional, List
+
+import numpy as np
+import torch
+from torch import nn
+
+import torchsparse
+from torchsparse import nn as spnn
+from torchsparse.backbones.modules import SparseConvBlock, SparseResBlock
+from torchsparse.nn.utils import fuse_modules
+
+from .test_utils import generate_feature_map
+
+__all__ = ["test_fuse_modules"]
+
+
+def test_fuse_modules(num_points: int = 200, device="cpu"):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    model = nn.Sequential(
+        SparseConvBlock(4, 16, 3),
+        SparseResBlock(16, 32, 3),
+        SparseConvBlock(32, 32, 2, stride=2),
+        nn.Sequential(
+            spnn.Conv3d(32, 16, 3, bias=True),
+            spnn.BatchNorm(16),
+            spnn.LeakyReLU(0.1, True),
+        ),
+    ).to(device)
+    # non-trivial statistics, as after training
+    for module in model.modules():
+        if isinstance(module, spnn.BatchNorm):
+            module.running_mean.uniform_(-1, 1)
+            module.running_var.uniform_(0.5, 2)
+            nn.init.uniform_(module.weight, 0.5, 2)
+            nn.init.uniform_(module.bias, -1, 1)
+    model.eval()
+    fused = fuse_modules(model)
+
+    sparse_dict = generate_feature_map((10, 10, 10), [num_points], 4, with_dense=False)
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).float()
+
+    with torch.no_grad():
+        outputs = fused(torchsparse.SparseTensor(feats, coords).to(device)).feats
+        ref_outputs = model(torchsparse.SparseTensor(feats, coords).to(device)).feats
+
+    num_bn = sum(isinstance(m, spnn.BatchNorm) for m in fused.modules())
+    max_adiff = (outputs - ref_outputs).abs().max().item()
+    return num_bn, max_adiff
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+__all__ = ["test_import_time"]
+
+_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import torch
+torch_time = time.perf_counter() - start
+# modules pulled in by torch itself (e.g. tqdm through torch.hub) do not count
+loaded = set(sys.modules)
+start = time.perf_counter()
+import torchsparse
+import_time = time.perf_counter() - start
+print(json.dumps({
+    "import_time": import_time,
+    "torch_time": torch_time,
+    "cuda_initialized": torch.cuda.is_initialized(),
+    "heavy_modules": [
+        name
+        for name in (
+            "tqdm",
+            "torchsparse.backend",
+            "torchsparse.nn",
+            "torchsparse.utils.tune",
+        )
+        if name in sys.modules and name not in loaded
+    ],
+}))
+"""
+
+
+def test_import_time():
+    # a fresh interpreter, as in a DataLoader worker or a CLI tool
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES="")
+    output = subprocess.check_output([sys.executable, "-c", _SCRIPT], env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    print(test_import_time())
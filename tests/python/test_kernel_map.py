@@ -0,0 +1,276 @@
+from typing import Any, Dict, Tuple, Union, Optional, List
+
+import numpy as np
+import torch
+
+import torchsparse
+from torchsparse import nn as spnn
+from torchsparse.nn import functional as F
+from torchsparse.nn.functional.conv.kmap.func import derive_gather_scatter_maps
+from torchsparse.nn.utils import get_kernel_offsets, get_kmap_signatures
+from torchsparse.utils import make_ntuple
+from torchsparse.utils.collate import sparse_collate_fn
+
+from .test_utils import generate_feature_map, make_conv_config
+
+__all__ = [
+    "test_build_kernel_map_hashmap",
+    "test_prebuild_kernel_maps",
+    "test_lazy_backward_kernel_map",
+    "test_spdownsample",
+    "test_compact_kernel_map",
+    "test_symmetric_kernel_map",
+]
+
+
+def test_build_kernel_map_hashmap(
+    batch_size: int = 2,
+    shape: Union[int, Tuple[int, ...]] = 6,
+    num_points: int = 100,
+    kernel_size: int = 3,
+    stride: int = 1,
+    device="cpu",
+):
+    np.random.seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    kernel_size = make_ntuple(kernel_size, ndim=3)
+    stride = make_ntuple(stride, ndim=3)
+    num_points = [min(num_points, int(np.prod(shape)))] * batch_size
+
+    sparse_dict = generate_feature_map(shape, num_points, 1, with_dense=False)
+    coords = np.ascontiguousarray(sparse_dict["coords"][:, [3, 0, 1, 2]])
+    coords_t = torch.from_numpy(coords).int().to(device)
+
+    kmap = F.build_kernel_map(
+        coords_t,
+        coords_t.shape[0],
+        kernel_size,
+        stride,
+        0,
+        mode="hashmap",
+        dataflow=F.Dataflow.ImplicitGEMM,
+    )
+    out_in_map = kmap["out_in_map"].cpu().numpy()
+    out_coords = kmap["coords"].cpu().numpy()
+
+    # brute-force reference with a python dict
+    table = {tuple(c): i for i, c in enumerate(coords.tolist())}
+    offsets = get_kernel_offsets(kernel_size, device="cpu").numpy()
+    ref = np.full(out_in_map.shape, -1, dtype=np.int32)
+    for i, c in enumerate(out_coords.tolist()):
+        for k, offset in enumerate(offsets.tolist()):
+            query = (c[0],) + tuple(
+                c[d + 1] * stride[d] + offset[d] for d in range(3)
+            )
+            ref[i, k] = table.get(query, -1)
+
+    return int(np.sum(out_in_map != ref))
+
+
+def test_prebuild_kernel_maps(batch_size: int = 2, num_points: int = 200):
+    np.random.seed(0)
+    model = torch.nn.Sequential(
+        spnn.Conv3d(4, 8, 3),
+        spnn.Conv3d(8, 8, 2, stride=2),
+        spnn.Conv3d(8, 8, 3),
+        spnn.Conv3d(8, 4, 2, stride=2, transposed=True),
+    ).eval()
+    signatures = get_kmap_signatures(model)
+
+    samples = []
+    for _ in range(batch_size):
+        sparse_dict = generate_feature_map(
+            (10, 10, 10), [num_points], 4, with_dense=False
+        )
+        coords = torch.from_numpy(sparse_dict["coords"][:, :3]).int()
+        feats = torch.from_numpy(sparse_dict["feats"]).float()
+        samples.append({"input": torchsparse.SparseTensor(feats, coords)})
+
+    prebuilt = sparse_collate_fn(samples, kmap_signatures=signatures)["input"]
+    reference = sparse_collate_fn(samples)["input"]
+    num_kmaps = len(prebuilt._caches.kmaps)
+
+    with torch.no_grad():
+        outputs = model(prebuilt).feats
+        ref_outputs = model(reference).feats
+    # the forward pass must not have built any additional kernel map
+    num_rebuilt = len(prebuilt._caches.kmaps) - num_kmaps
+    max_adiff = (outputs - ref_outputs).abs().max().item()
+    return len(signatures), num_rebuilt, max_adiff
+
+
+def test_lazy_backward_kernel_map(num_points: int = 200, kernel_size: int = 3):
+    np.random.seed(0)
+    torch.manual_seed(0)
+    sparse_dict = generate_feature_map(
+        (10, 10, 10), [num_points], 4, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).float()
+    conv = spnn.Conv3d(4, 8, kernel_size).train()
+    key = ((1, 1, 1), make_ntuple(kernel_size, 3), (1, 1, 1), (1, 1, 1))
+
+    grads = {}
+    for dataflow in [F.Dataflow.ImplicitGEMM, F.Dataflow.GatherScatter]:
+        conv._config = make_conv_config(dataflow)
+
+        inputs = torchsparse.SparseTensor(feats.clone().requires_grad_(), coords)
+        if dataflow == F.Dataflow.ImplicitGEMM:
+            # a no-grad forward in train mode must not build backward maps
+            with torch.no_grad():
+                conv(inputs)
+            kmap = inputs._caches.kmaps[key]
+            built_in_no_grad = kmap["out_in_map_bwd"] is not None
+
+        conv.zero_grad()
+        conv(inputs).feats.sum().backward()
+        grads[dataflow] = (inputs.feats.grad, conv.kernel.grad.clone())
+        if dataflow == F.Dataflow.ImplicitGEMM:
+            built_in_backward = kmap["out_in_map_bwd"] is not None
+    conv._config = None
+
+    max_adiff = max(
+        (a - b).abs().max().item()
+        for a, b in zip(
+            grads[F.Dataflow.ImplicitGEMM], grads[F.Dataflow.GatherScatter]
+        )
+    )
+    return built_in_no_grad, built_in_backward, max_adiff
+
+
+def test_spdownsample(
+    batch_size: int = 2,
+    shape: Union[int, Tuple[int, ...]] = 8,
+    num_points: int = 200,
+    kernel_size: int = 3,
+    stride: int = 2,
+    padding: int = 0,
+    device="cpu",
+):
+    np.random.seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    kernel_size = make_ntuple(kernel_size, ndim=3)
+    stride = make_ntuple(stride, ndim=3)
+    padding = make_ntuple(padding, ndim=3)
+    num_points = [min(num_points, int(np.prod(shape)))] * batch_size
+
+    sparse_dict = generate_feature_map(shape, num_points, 1, with_dense=False)
+    coords = np.ascontiguousarray(sparse_dict["coords"][:, [3, 0, 1, 2]])
+    coords_t = torch.from_numpy(coords).int().to(device)
+
+    out_coords = F.spdownsample(coords_t, stride, kernel_size, padding)
+    out_coords = out_coords.cpu().numpy().tolist()
+
+    # brute-force reference: every output window covering an input
+    ref = set()
+    cmax = coords.max(0)
+    upper = [
+        (cmax[d + 1] + 2 * padding[d] - (kernel_size[d] - 1)) // stride[d]
+        for d in range(3)
+    ]
+    for c in coords.tolist():
+        if stride == kernel_size:
+            ref.add((c[0],) + tuple(c[d + 1] // stride[d] for d in range(3)))
+            continue
+        for offset in np.ndindex(*kernel_size):
+            cur = [c[d + 1] - offset[d] + padding[d] for d in range(3)]
+            if any(cur[d] % stride[d] != 0 for d in range(3)):
+                continue
+            out = tuple(cur[d] // stride[d] for d in range(3))
+            if all(0 <= out[d] <= upper[d] for d in range(3)):
+                ref.add((c[0],) + out)
+
+    num_duplicates = len(out_coords) - len(set(map(tuple, out_coords)))
+    num_mismatch = len(ref.symmetric_difference(map(tuple, out_coords)))
+    return num_duplicates + num_mismatch
+
+
+def test_compact_kernel_map(num_points: int = 400):
+    np.random.seed(0)
+    torch.manual_seed(0)
+    sparse_dict = generate_feature_map(
+        (12, 12, 12), [num_points, num_points], 4, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).float()
+    model = torch.nn.Sequential(
+        spnn.Conv3d(4, 8, 3),
+        spnn.Conv3d(8, 8, 2, stride=2),
+        spnn.Conv3d(8, 8, 3),
+        spnn.Conv3d(8, 4, 2, stride=2, transposed=True),
+    ).train()
+    key = ((1, 1, 1), (3, 3, 3), (1, 1, 1), (1, 1, 1))
+
+    max_adiff, num_mismatch, memory_ratio = 0.0, 0, 0.0
+    for dataflow in [F.Dataflow.ImplicitGEMM, F.Dataflow.GatherScatter]:
+        results, kmaps = {}, {}
+        for kmap_format in ["dense", "compact"]:
+            config = make_conv_config(dataflow, kmap_format=kmap_format)
+            for conv in model:
+                conv._config = config
+
+            inputs = torchsparse.SparseTensor(feats.clone().requires_grad_(), coords)
+            model.zero_grad()
+            outputs = model(inputs).feats
+            outputs.square().sum().backward()
+            grads = [conv.kernel.grad.clone() for conv in model]
+            results[kmap_format] = [outputs, inputs.feats.grad] + grads
+            kmaps[kmap_format] = inputs._caches.kmaps[key]
+
+        decoded = F.decode_out_in_map(kmaps["compact"]["out_in_map"])
+        num_mismatch += int((decoded != kmaps["dense"]["out_in_map"]).sum())
+        memory = [F.kernel_map_memory(kmaps[k])["total"] for k in kmaps]
+        memory_ratio = max(memory_ratio, memory[1] / memory[0])
+        max_adiff = max(
+            max_adiff,
+            max(
+                (a - b).abs().max().item()
+                for a, b in zip(results["dense"], results["compact"])
+            ),
+        )
+    for conv in model:
+        conv._config = None
+    return max_adiff, num_mismatch, memory_ratio
+
+
+def test_symmetric_kernel_map(
+    kernel_size: Union[int, Tuple[int, ...]] = 3,
+    batch_size: int = 2,
+    num_points: int = 300,
+):
+    np.random.seed(0)
+    kernel_size = make_ntuple(kernel_size, ndim=3)
+    sparse_dict = generate_feature_map(
+        (10, 10, 10), [num_points] * batch_size, 1, with_dense=False
+    )
+    coords = np.ascontiguousarray(sparse_dict["coords"][:, [3, 0, 1, 2]])
+    coords_t = torch.from_numpy(coords).int()
+
+    kmap = F.build_kernel_map(
+        coords_t,
+        coords_t.shape[0],
+        kernel_size,
+        1,
+        0,
+        mode="hashmap",
+        dataflow=F.Dataflow.GatherScatter,
+    )
+    # neighbor lists derived from every offset of the same map
+    ref = derive_gather_scatter_maps(
+        {"out_in_map": kmap["out_in_map"], "sizes": kmap["sizes"]}
+    )
+    num_mismatch = int((kmap["nbsizes"] != ref["nbsizes"]).sum())
+    starts = torch.cumsum(ref["nbsizes"], 0) - ref["nbsizes"]
+    for k, size in enumerate(ref["nbsizes"].tolist()):
+        pairs, ref_pairs = [
+            set(map(tuple, x[starts[k] : starts[k] + size].tolist()))
+            for x in (kmap["nbmaps"], ref["nbmaps"])
+        ]
+        num_mismatch += len(pairs.symmetric_difference(ref_pairs))
+    return kmap["symmetric"], num_mismatch
+
+
+if __name__ == "__main__":
+    print(test_build_kernel_map_hashmap())
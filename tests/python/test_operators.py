@@ -0,0 +1,66 @@
+from typing import Any, Dict, Tuple, Union, Optional, List
+
+import numpy as np
+import torch
+
+import torchsparse
+
+from .test_utils import generate_feature_map
+
+__all__ = ["test_sparse_set_ops"]
+
+
+def test_sparse_set_ops(
+    batch_size: int = 2,
+    num_points: Tuple[int, int] = (200, 120),
+    channel: int = 4,
+    device="cpu",
+):
+    np.random.seed(0)
+
+    tensors = []
+    for n in num_points:
+        sparse_dict = generate_feature_map(
+            (8, 8, 8), [n] * batch_size, channel, with_dense=False
+        )
+        coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+        feats = torch.from_numpy(sparse_dict["feats"]).double()
+        tensors.append(torchsparse.SparseTensor(feats.to(device), coords.to(device)))
+    # b is the larger input, so that the outputs follow its order
+    b, a = tensors
+
+    rows_a = {tuple(c): i for i, c in enumerate(a.coords.tolist())}
+    rows_b = {tuple(c): i for i, c in enumerate(b.coords.tolist())}
+    ref_union = list(rows_b) + [c for c in rows_a if c not in rows_b]
+    ref_inter = [c for c in rows_b if c in rows_a]
+    ref_diff = [c for c in rows_a if c not in rows_b]
+
+    num_mismatch = 0
+    max_adiff = 0.0
+    for op, ref_coords in [
+        (torchsparse.sparse_union, ref_union),
+        (torchsparse.sparse_intersection, ref_inter),
+        (torchsparse.sparse_difference, ref_diff),
+    ]:
+        output, a_map, b_map = op(a, b)
+        out_coords = output.coords.cpu()
+        num_mismatch += int(out_coords.tolist() != [list(c) for c in ref_coords])
+
+        ref_feats = torch.zeros(len(ref_coords), channel, dtype=torch.double)
+        for input, rows, index in [(a, rows_a, a_map), (b, rows_b, b_map)]:
+            index = index.cpu()
+            kept = index >= 0
+            # the index maps send rows to outputs with the same coordinates
+            num_mismatch += int(
+                not torch.equal(out_coords[index[kept]], input.coords.cpu()[kept])
+            )
+            if op is not torchsparse.sparse_difference or input is a:
+                ref_feats[index[kept]] += input.feats.cpu()[kept]
+        max_adiff = max(
+            max_adiff, (output.feats.cpu() - ref_feats).abs().max().item()
+        )
+
+    # a subset adds no coordinates: the output keeps the tensor cache of b
+    output, _, _ = torchsparse.sparse_union(b, b)
+    num_mismatch += int(output._caches is not b._caches)
+    return num_mismatch, max_adiff
@@ -0,0 +1,66 @@
+from typing import Any, Dict, Tuple, Union, Optional, List
+
+import numpy as np
+import torch
+
+import torchsparse
+from torchsparse import nn as spnn
+
+from .test_utils import generate_feature_map
+
+__all__ = ["test_pool3d"]
+
+
+def test_pool3d(
+    mode: str = "max",
+    kernel_size: int = 2,
+    stride: int = 2,
+    padding: int = 0,
+    batch_size: int = 2,
+    num_points: int = 200,
+    channel: int = 8,
+    device="cpu",
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    sparse_dict = generate_feature_map(
+        (8, 8, 8), [num_points] * batch_size, channel, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    # continuous features: the half-precision ones tie, and the gradient of a
+    # tied maximum may go to either input
+    feats = torch.randn(coords.shape[0], channel, dtype=torch.double)
+
+    Pool = spnn.MaxPool3d if mode == "max" else spnn.AvgPool3d
+    pool = Pool(kernel_size, stride, padding)
+    inputs = torchsparse.SparseTensor(
+        feats.clone().to(device).requires_grad_(), coords.to(device)
+    )
+    outputs = pool(inputs)
+    grad_output = torch.randn_like(outputs.feats)
+    outputs.feats.backward(grad_output)
+
+    # brute-force reference over the output coordinates: the neighbors of
+    # output o are the inputs at o * stride + offset - (kernel_size - 1) // 2
+    out_coords = outputs.coords.cpu().long()
+    ref_feats = feats.clone().requires_grad_()
+    lo = (kernel_size - 1) // 2
+    ref_outputs = []
+    for c in out_coords:
+        delta = coords[:, 1:].long() - c[1:] * stride + lo
+        mask = (coords[:, 0] == c[0]) & ((delta >= 0) & (delta < kernel_size)).all(1)
+        if not mask.any():
+            ref_outputs.append(ref_feats.new_zeros(channel))
+        elif mode == "max":
+            ref_outputs.append(ref_feats[mask].max(0)[0])
+        else:
+            ref_outputs.append(ref_feats[mask].mean(0))
+    ref_outputs = torch.stack(ref_outputs)
+    ref_outputs.backward(grad_output.cpu())
+
+    max_adiff = max(
+        (outputs.feats.detach().cpu() - ref_outputs.detach()).abs().max().item(),
+        (inputs.feats.grad.cpu() - ref_feats.grad).abs().max().item(),
+    )
+    return max_adiff
@@ -0,0 +1,57 @@
+import numpy as np
+
+from torchsparse.utils.quantize import ravel_hash, sparse_quantize
+
+__all__ = ["test_sparse_quantize"]
+
+
+def test_sparse_quantize(
+    num_points: int = 10000,
+    num_channels: int = 4,
+    voxel_size: float = 0.2,
+    reduction: str = "mean",
+):
+    np.random.seed(0)
+    points = np.random.uniform(-5, 5, size=(num_points, 3))
+    feats = np.random.uniform(size=(num_points, num_channels)).astype(np.float32)
+
+    coords, out_feats, indices, inverse, counts = sparse_quantize(
+        points,
+        voxel_size,
+        features=feats,
+        reduction=reduction,
+        return_index=True,
+        return_inverse=True,
+        return_counts=True,
+    )
+
+    # reference with np.unique, reordered by first occurrence
+    ref_coords = np.floor(points / voxel_size).astype(np.int32)
+    _, ref_indices, ref_inverse = np.unique(
+        ravel_hash(ref_coords), return_index=True, return_inverse=True
+    )
+    order = np.argsort(ref_indices)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    ref_inverse = rank[ref_inverse.reshape(-1)]
+
+    ref_feats = np.zeros((len(order), num_channels), dtype=np.float64)
+    if reduction == "max":
+        ref_feats[:] = -np.inf
+        np.maximum.at(ref_feats, ref_inverse, feats)
+    else:
+        np.add.at(ref_feats, ref_inverse, feats)
+    ref_counts = np.bincount(ref_inverse, minlength=len(order))
+    if reduction == "mean":
+        ref_feats /= ref_counts[:, None]
+
+    num_mismatch = int(np.sum(coords != ref_coords[ref_indices[order]]))
+    num_mismatch += int(np.sum(indices != ref_indices[order]))
+    num_mismatch += int(np.sum(inverse != ref_inverse))
+    num_mismatch += int(np.sum(counts != ref_counts))
+    max_adiff = float(np.max(np.abs(out_feats - ref_feats)))
+    return num_mismatch, max_adiff
+
+
+if __name__ == "__main__":
+    print(test_sparse_quantize())
@@ -0,0 +1,103 @@
+from typing import Tuple
+
+import numpy as np
+import torch
+
+import torchsparse
+from torchsparse import nn as spnn
+from torchsparse.nn import functional as F
+from torchsparse.utils.curve import build_curve_permutation, curve_codes
+from torchsparse.utils.tensor_cache import (
+    TensorCacheMode,
+    clear_global_tensor_cache,
+    get_tensor_cache_mode,
+    set_tensor_cache_mode,
+)
+
+from .test_utils import generate_feature_map, make_conv_config
+
+__all__ = ["test_curve_codes", "test_reorder", "test_reorder_global_cache"]
+
+
+def test_curve_codes(curve: str = "hilbert", size: int = 8):
+    # every cell of a size^3 grid gets its own code, and consecutive cells
+    # of the Hilbert curve are face neighbors
+    grid = torch.stack(
+        torch.meshgrid(*[torch.arange(size)] * 3, indexing="ij"), -1
+    ).view(-1, 3)
+    codes = curve_codes(grid, curve)
+    num_duplicates = grid.shape[0] - torch.unique(codes).shape[0]
+    ordered = grid[torch.argsort(codes)]
+    max_step = (ordered[1:] - ordered[:-1]).abs().sum(1).max().item()
+    return num_duplicates, max_step
+
+
+def test_reorder(
+    curve: str = "morton",
+    dataflow=F.Dataflow.ImplicitGEMM,
+    batch_size: int = 2,
+    shape: Tuple[int, int, int] = (16, 16, 16),
+    num_points: int = 600,
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+    sparse_dict = generate_feature_map(
+        shape, [num_points] * batch_size, 4, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).float()
+
+    config = make_conv_config(dataflow)
+    model = torch.nn.Sequential(
+        spnn.Conv3d(4, 8, 3),
+        spnn.Conv3d(8, 8, 2, stride=2),
+        spnn.Conv3d(8, 8, 3, stride=2),
+        spnn.Conv3d(8, 8, 3),
+        spnn.Conv3d(8, 8, 3, stride=2, transposed=True),
+        spnn.Conv3d(8, 4, 2, stride=2, transposed=True),
+    ).eval()
+    for conv in model:
+        conv._config = config
+
+    inputs = torchsparse.SparseTensor(feats, coords)
+    reordered, perm = inputs.reorder(curve)
+    with torch.no_grad():
+        ref_outputs = model(inputs).feats
+        outputs = model(reordered).feats
+    for conv in model:
+        conv._config = None
+    max_adiff = (outputs - ref_outputs[perm]).abs().max().item()
+
+    # the rows of every stride are in curve order
+    num_unsorted = 0
+    for out_coords, _ in reordered._caches.cmaps.values():
+        order = build_curve_permutation(out_coords, curve)
+        num_unsorted += int((order != torch.arange(order.shape[0])).sum())
+    return max_adiff, num_unsorted, len(reordered._caches.cmaps)
+
+
+def test_reorder_global_cache(curve: str = "morton", num_points: int = 200):
+    # the reordered tensor must not reuse the kernel maps that the global
+    # cache holds for the original row order, nor pass its curve on
+    np.random.seed(0)
+    torch.manual_seed(0)
+    sparse_dict = generate_feature_map((8, 8, 8), [num_points], 4, with_dense=False)
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).float()
+    model = spnn.Conv3d(4, 8, 3).eval()
+
+    cache_mode = get_tensor_cache_mode()
+    set_tensor_cache_mode(TensorCacheMode.GLOBAL_TENSOR_CACHE)
+    try:
+        inputs = torchsparse.SparseTensor(feats, coords)
+        reordered, perm = inputs.reorder(curve)
+        with torch.no_grad():
+            ref_outputs = model(inputs).feats
+            outputs = model(reordered).feats
+        leaked_curve = torchsparse.SparseTensor(feats, coords)._caches.curve
+    finally:
+        set_tensor_cache_mode(cache_mode)
+        clear_global_tensor_cache()
+
+    max_adiff = (outputs - ref_outputs[perm]).abs().max().item()
+    return max_adiff, leaked_curve
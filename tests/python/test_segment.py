@@ -0,0 +1,174 @@
+from typing import Any, Dict, Tuple, Union, Optional, List
+
+import numpy as np
+import torch
+
+import torchsparse
+from torchsparse import nn as spnn
+from torchsparse.nn import functional as F
+
+from .test_utils import generate_feature_map
+
+__all__ = [
+    "test_batch_segments",
+    "test_segment_norm",
+    "test_instance_norm_running_stats",
+]
+
+
+def test_batch_segments(
+    batch_size: int = 3,
+    num_points: int = 50,
+    channel: int = 8,
+    num_groups: int = 4,
+    shuffle: bool = False,
+    device="cpu",
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    sparse_dict = generate_feature_map(
+        (8, 8, 8), [num_points] * batch_size, channel, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).float()
+    if shuffle:
+        perm = torch.randperm(coords.shape[0])
+        coords, feats = coords[perm], feats[perm]
+    inputs = torchsparse.SparseTensor(feats.to(device), coords.to(device))
+
+    norm = spnn.GroupNorm(num_groups, channel).to(device)
+    torch.nn.init.uniform_(norm.weight)
+    torch.nn.init.uniform_(norm.bias)
+    outputs = {
+        "avg": F.global_avg_pool(inputs),
+        "max": F.global_max_pool(inputs),
+        "norm": norm(inputs).feats,
+    }
+    # the index is cached and shared by tensors with the same coordinates
+    reused = spnn.ReLU()(inputs).batch_segments() is inputs.batch_segments()
+
+    # per-sample reference
+    ref_norm = torch.zeros_like(feats)
+    ref_avg, ref_max = [], []
+    for k in range(batch_size):
+        mask = coords[:, 0] == k
+        ref_avg.append(feats[mask].mean(0))
+        ref_max.append(feats[mask].max(0)[0])
+        ref_norm[mask] = torch.nn.functional.group_norm(
+            feats[mask].t().unsqueeze(0),
+            num_groups,
+            norm.weight.cpu(),
+            norm.bias.cpu(),
+            norm.eps,
+        )[0].t()
+    refs = {"avg": torch.stack(ref_avg), "max": torch.stack(ref_max), "norm": ref_norm}
+
+    max_adiff = max(
+        (outputs[name].cpu() - refs[name]).abs().max().item() for name in refs
+    )
+    return reused, max_adiff
+
+
+def test_segment_norm(
+    norm: str = "instance",
+    batch_size: int = 3,
+    num_points: int = 50,
+    channel: int = 8,
+    num_groups: int = 2,
+    device="cpu",
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    sparse_dict = generate_feature_map(
+        (8, 8, 8), [num_points] * batch_size, channel, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).double()
+    grad_output = torch.randn_like(feats)
+
+    if norm == "instance":
+        module = spnn.InstanceNorm(channel, affine=True)
+        ref_module = torch.nn.InstanceNorm1d(channel, affine=True)
+    else:
+        module = spnn.GroupNorm(num_groups, channel)
+        ref_module = torch.nn.GroupNorm(num_groups, channel)
+    module = module.double().to(device)
+    ref_module = ref_module.double()
+    torch.nn.init.uniform_(module.weight)
+    torch.nn.init.uniform_(module.bias)
+    ref_module.load_state_dict(module.state_dict())
+
+    inputs = torchsparse.SparseTensor(
+        feats.clone().to(device).requires_grad_(), coords.to(device)
+    )
+    outputs = module(inputs).feats
+    outputs.backward(grad_output.to(device))
+    results = [outputs, inputs.feats.grad, module.weight.grad, module.bias.grad]
+
+    # per-sample reference
+    ref_feats = feats.clone().requires_grad_()
+    ref_outputs = torch.zeros_like(feats)
+    for k in range(batch_size):
+        mask = coords[:, 0] == k
+        ref_outputs[mask] = ref_module(ref_feats[mask].t().unsqueeze(0))[0].t()
+    ref_outputs.backward(grad_output)
+    refs = [ref_outputs, ref_feats.grad, ref_module.weight.grad, ref_module.bias.grad]
+
+    max_adiff = max(
+        (x.detach().cpu() - y.detach()).abs().max().item()
+        for x, y in zip(results, refs)
+    )
+    return max_adiff
+
+
+def test_instance_norm_running_stats(
+    batch_size: int = 3,
+    num_points: int = 50,
+    channel: int = 8,
+    num_iters: int = 2,
+    empty_sample: bool = False,
+    device="cpu",
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    sparse_dict = generate_feature_map(
+        (8, 8, 8), [num_points] * batch_size, channel, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).double()
+    if empty_sample:
+        # the first sample has no rows, its batch index is still counted
+        mask = coords[:, 0] != 0
+        coords, feats = coords[mask], feats[mask]
+    samples = coords[:, 0].unique()
+
+    module = spnn.InstanceNorm(channel, affine=True, track_running_stats=True)
+    ref_module = torch.nn.InstanceNorm1d(channel, affine=True, track_running_stats=True)
+    module = module.double().to(device)
+    ref_module = ref_module.double()
+    torch.nn.init.uniform_(module.weight)
+    torch.nn.init.uniform_(module.bias)
+    ref_module.load_state_dict(module.state_dict())
+
+    # every sample has num_points rows: the reference sees them as one batch
+    ref_feats = torch.stack([feats[coords[:, 0] == k].t() for k in samples])
+    inputs = torchsparse.SparseTensor(feats.to(device), coords.to(device))
+    results, refs = [], []
+    for training in [True] * num_iters + [False]:
+        module.train(training)
+        ref_module.train(training)
+        outputs = module(inputs).feats.cpu()
+        ref_outputs = ref_module(ref_feats)
+        results.append(torch.cat([outputs[coords[:, 0] == k] for k in samples]))
+        refs.append(torch.cat(list(ref_outputs.transpose(1, 2))))
+    results += [module.running_mean.cpu(), module.running_var.cpu()]
+    refs += [ref_module.running_mean, ref_module.running_var]
+
+    # NaN statistics propagate into max_adiff
+    max_adiff = torch.stack(
+        [(x.detach() - y.detach()).abs().max() for x, y in zip(results, refs)]
+    ).max()
+    return max_adiff.item()
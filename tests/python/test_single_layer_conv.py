@@ -11,7 +11,13 @@ from torchsparse.utils import make_ntuple
 
 from .test_utils import *
 
-__all__ = ["test_single_layer_convolution_forward"]
+__all__ = [
+    "test_single_layer_convolution_forward",
+    "test_single_layer_convolution_backward",
+    "test_mixed_dtype_convolution",
+    "test_grouped_convolution",
+    "test_strided_convolution_same_size",
+]
 
 
 class TestSparseConv(nn.Module):
@@ -220,6 +226,174 @@ def test_single_layer_convolution_forward(
     return mean_adiff, max_rdiff
 
 
+def test_single_layer_convolution_backward(
+    dataflow=F.Dataflow.TorchNative,
+    ref_dataflow=F.Dataflow.GatherScatter,
+    batch_size: int = 1,
+    shape: Union[int, Tuple[int, ...]] = 5,
+    num_points: int = 20,
+    IC: int = 16,
+    OC: int = 32,
+    kernel_size: int = 3,
+    stride: int = 1,
+    transposed: bool = False,
+    device="cpu",
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    num_points = [min(num_points, int(np.prod(shape)))] * batch_size
+    sparse_dict = generate_feature_map(
+        shape, num_points, IC, dtype=np.float32, with_dense=False
+    )
+    coords_t = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats_t = torch.from_numpy(sparse_dict["feats"])
+    convs = [spnn.Conv3d(IC, OC, kernel_size, stride)]
+    if transposed:
+        # back to the input coordinates (cached by the submanifold layer)
+        # through the transposed map
+        convs.insert(0, spnn.Conv3d(IC, IC, 3))
+        convs.append(spnn.Conv3d(OC, IC, kernel_size, stride, transposed=True))
+    net = nn.Sequential(*convs).to(device).train()
+    num_out_channels = IC if transposed else OC
+
+    grads = []
+    for flow in [dataflow, ref_dataflow]:
+        for conv in convs:
+            conv._config = make_conv_config(flow)
+
+        feats = feats_t.clone().to(device).requires_grad_()
+        out = net(torchsparse.SparseTensor(feats, coords_t.to(device)))
+        net.zero_grad()
+        (out.feats * torch.arange(num_out_channels, device=device)).sum().backward()
+        grads.append((feats.grad, *[conv.kernel.grad.clone() for conv in convs]))
+    for conv in convs:
+        conv._config = None
+
+    max_adiff = max((a - b).abs().max().item() for a, b in zip(*grads))
+    return max_adiff
+
+
+def test_mixed_dtype_convolution(
+    dataflow=F.Dataflow.ImplicitGEMM,
+    dtype=torch.float16,
+    shape: Union[int, Tuple[int, ...]] = 5,
+    num_points: int = 20,
+    IC: int = 16,
+    OC: int = 32,
+    kernel_size: int = 3,
+    stride: int = 1,
+    device="cpu",
+):
+    # low-precision features through a float32 module are cast to the kernel
+    # dtype, so they match the same features given in float32
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    sparse_dict = generate_feature_map(
+        shape, [min(num_points, int(np.prod(shape)))], IC, with_dense=False
+    )
+    coords_t = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats_t = torch.from_numpy(sparse_dict["feats"]).to(dtype)
+    conv = spnn.Conv3d(IC, OC, kernel_size, stride).to(device).train()
+
+    conv._config = make_conv_config(dataflow)
+
+    results = []
+    for feats_dtype in [dtype, torch.float32]:
+        feats = feats_t.to(device, feats_dtype, copy=True).requires_grad_()
+        out = conv(torchsparse.SparseTensor(feats, coords_t.to(device)))
+        conv.zero_grad()
+        (out.feats * torch.arange(OC, device=device)).sum().backward()
+        grads = (feats.grad.to(dtype), conv.kernel.grad.clone())
+        results.append((out.feats.detach(), *grads))
+    conv._config = None
+
+    out_dtype = results[0][0].dtype
+    max_adiff = max((a - b).abs().max().item() for a, b in zip(*results))
+    return out_dtype, max_adiff
+
+
+def test_grouped_convolution(
+    dataflow=F.Dataflow.GatherScatter,
+    groups: int = 4,
+    batch_size: int = 1,
+    shape: Union[int, Tuple[int, ...]] = 5,
+    num_points: int = 20,
+    IC: int = 16,
+    OC: int = 32,
+    kernel_size: int = 3,
+    stride: int = 1,
+    device="cpu",
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    num_points = [min(num_points, int(np.prod(shape)))] * batch_size
+    sparse_dict = generate_feature_map(
+        shape, num_points, IC, dtype=np.float32, with_dense=False
+    )
+    coords_t = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats_t = torch.from_numpy(sparse_dict["feats"])
+
+    # reference: dense convolution with the block-diagonal kernel
+    conv = spnn.Conv3d(IC, OC, kernel_size, stride, groups=groups).to(device)
+    ref_conv = spnn.Conv3d(IC, OC, kernel_size, stride).to(device)
+    ref_conv.kernel.data[:] = F.expand_grouped_weight(conv.kernel.data, groups)
+
+    results = []
+    for module, flow in [(conv, dataflow), (ref_conv, F.Dataflow.GatherScatter)]:
+        module._config = make_conv_config(flow)
+
+        feats = feats_t.clone().to(device).requires_grad_()
+        out = module(torchsparse.SparseTensor(feats, coords_t.to(device)))
+        (out.feats * torch.arange(OC, device=device)).sum().backward()
+        results.append([out.feats.detach(), feats.grad, module.kernel.grad])
+        module._config = None
+
+    # gradients of the diagonal blocks of the dense kernel
+    ref_grad = results[1][2].reshape(
+        -1, groups, IC // groups, groups, OC // groups
+    )
+    eye = torch.eye(groups, device=device)
+    results[1][2] = torch.einsum("kgiho,gh->kigo", ref_grad, eye).reshape(
+        conv.kernel.shape
+    )
+
+    max_adiff = max((a - b).abs().max().item() for a, b in zip(*results))
+    return max_adiff
+
+
+def test_strided_convolution_same_size(
+    dataflow=F.Dataflow.GatherScatter, ref_dataflow=F.Dataflow.ImplicitGEMM
+):
+    # a strided convolution with as many outputs as inputs, whose center
+    # offset is not the identity map
+    torch.manual_seed(0)
+    coords = torch.tensor([[0, 0, 0, 0], [0, 1, 0, 0]], dtype=torch.int)
+    feats_t = torch.randn(2, 4)
+    conv = spnn.Conv3d(4, 6, 3, stride=2, padding=1).train()
+
+    results = []
+    for flow in [dataflow, ref_dataflow]:
+        conv._config = make_conv_config(flow, downsample_mode="spconv")
+
+        feats = feats_t.clone().requires_grad_()
+        input = torchsparse.SparseTensor(feats, coords, spatial_range=(1, 4, 4, 4))
+        out = conv(input)
+        conv.zero_grad()
+        (out.feats * torch.arange(6)).sum().backward()
+        results.append((out.feats.detach(), feats.grad, conv.kernel.grad.clone()))
+    conv._config = None
+
+    num_outputs = results[0][0].shape[0]
+    max_adiff = max((a - b).abs().max().item() for a, b in zip(*results))
+    return num_outputs, max_adiff
+
+
 if __name__ == "__main__":
     # Only support single conv layer
     # Cannot support even kernel sizes >= 4 (because of the different definition of anchor point)
@@ -0,0 +1,195 @@
+from typing import Any, Dict, Tuple, Union, Optional, List
+
+import numpy as np
+import torch
+
+import torchsparse
+from torchsparse import nn as spnn
+from torchsparse.backbones import SparseResUNet42
+from torchsparse.nn import functional as F
+from torchsparse.nn.utils import fuse_modules
+
+from .test_utils import generate_feature_map, make_conv_config, sort_rows
+
+__all__ = [
+    "test_streaming_update",
+    "test_streaming_update_arguments",
+    "test_incremental_inference",
+]
+
+
+def test_streaming_update(
+    dataflow=F.Dataflow.ImplicitGEMM,
+    num_frames: int = 3,
+    batch_size: int = 2,
+    shape: Tuple[int, int, int] = (16, 16, 16),
+    num_points: int = 400,
+    delta_ratio: float = 0.05,
+    channel: int = 4,
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    F.conv_config.set_global_conv_config(make_conv_config(dataflow))
+
+    sparse_dict = generate_feature_map(
+        shape, [num_points] * batch_size, channel, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).double()
+    spatial_range = (batch_size,) + tuple(shape)
+
+    # submanifold and downsampling layers at strides 1, 2 and 4, and a
+    # transposed convolution back to stride 2
+    layers = [
+        spnn.Conv3d(channel, channel, 3),
+        spnn.Conv3d(channel, channel, 2, stride=2),
+        spnn.Conv3d(channel, channel, 3),
+        spnn.Conv3d(channel, channel, 3, stride=2, padding=1),
+        spnn.Conv3d(channel, channel, 3, stride=2, transposed=True),
+    ]
+    layers = [layer.double().eval() for layer in layers]
+
+    def forward(x):
+        outputs = []
+        with torch.no_grad():
+            for layer in layers:
+                x = layer(x)
+                outputs.append(x)
+        return outputs
+
+    inputs = torchsparse.SparseTensor(feats, coords, spatial_range=spatial_range)
+    forward(inputs)
+
+    num_rebuilt = 0
+    max_adiff = 0.0
+    num_delta = int(delta_ratio * num_points * batch_size)
+    for _ in range(num_frames):
+        deleted = inputs.coords[torch.randperm(inputs.coords.shape[0])[:num_delta]]
+        existing = set(map(tuple, inputs.coords.tolist()))
+        inserted = []
+        while len(inserted) < num_delta:
+            c = (np.random.randint(batch_size),) + tuple(
+                np.random.randint(s) for s in shape
+            )
+            if c not in existing:
+                existing.add(c)
+                inserted.append(c)
+        inserted = torch.tensor(inserted, dtype=torch.int)
+        inputs = inputs.update(
+            inserted, torch.randn(num_delta, channel, dtype=torch.double), deleted
+        )
+
+        outputs = forward(inputs)
+        num_rebuilt += sum(
+            "updated_rows" not in kmap for kmap in inputs._caches.kmaps.values()
+        )
+        fresh = torchsparse.SparseTensor(
+            inputs.feats, inputs.coords, spatial_range=spatial_range
+        )
+        for output, ref in zip(outputs, forward(fresh)):
+            out_coords, out_feats = sort_rows(output.coords, output.feats)
+            ref_coords, ref_feats = sort_rows(ref.coords, ref.feats)
+            assert torch.equal(out_coords, ref_coords)
+            max_adiff = max(max_adiff, (out_feats - ref_feats).abs().max().item())
+
+    F.conv_config.clear_global_conv_config()
+    return num_rebuilt, max_adiff
+
+
+def test_streaming_update_arguments(num_points: int = 100, channel: int = 4):
+    np.random.seed(0)
+    sparse_dict = generate_feature_map(
+        (8, 8, 8), [num_points], channel, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).float()
+    inputs = torchsparse.SparseTensor(feats, coords)
+    inserted = torch.tensor([[0, 8, 8, 8], [0, 9, 9, 9]], dtype=torch.int)
+
+    invalid = [
+        (inserted, None, None),
+        (None, torch.randn(2, channel), None),
+        (inserted, torch.randn(3, channel), None),
+        (inserted, torch.randn(2, channel + 1), None),
+    ]
+    num_rejected = 0
+    for args in invalid:
+        try:
+            inputs.update(*args)
+        except ValueError:
+            num_rejected += 1
+    # the caches are only patched by valid updates
+    return num_rejected, inputs._caches.version
+
+
+def test_incremental_inference(
+    num_frames: int = 3,
+    batch_size: int = 2,
+    shape: Tuple[int, int, int] = (32, 32, 32),
+    num_points: int = 4000,
+    delta_ratio: float = 0.002,
+    channel: int = 4,
+    fused: bool = False,
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    F.conv_config.set_global_conv_config(make_conv_config(F.Dataflow.ImplicitGEMM))
+
+    sparse_dict = generate_feature_map(
+        shape, [num_points] * batch_size, channel, with_dense=False
+    )
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).float()
+    spatial_range = (batch_size,) + tuple(shape)
+
+    model = SparseResUNet42(in_channels=channel, width_multiplier=0.25).eval()
+    if fused:
+        model = fuse_modules(model)
+
+    def forward(x, incremental):
+        F.set_incremental_mode(incremental)
+        with torch.no_grad():
+            outputs = model(x)
+        F.set_incremental_mode(False)
+        return outputs
+
+    def count_mismatches(x):
+        # against an ordinary forward of the same tensor
+        num_mismatch = 0
+        for output, ref in zip(forward(x, True), forward(x, False)):
+            num_mismatch += int(
+                not torch.equal(output.coords, ref.coords)
+                or not torch.equal(output.feats, ref.feats)
+            )
+        return num_mismatch
+
+    inputs = torchsparse.SparseTensor(feats, coords, spatial_range=spatial_range)
+    num_mismatch = count_mismatches(inputs)
+
+    fractions = []
+    num_delta = max(int(delta_ratio * num_points * batch_size), 1)
+    for _ in range(num_frames):
+        deleted = inputs.coords[torch.randperm(inputs.coords.shape[0])[:num_delta]]
+        existing = set(map(tuple, inputs.coords.tolist()))
+        inserted = []
+        while len(inserted) < num_delta:
+            c = (np.random.randint(batch_size),) + tuple(
+                np.random.randint(s) for s in shape
+            )
+            if c not in existing:
+                existing.add(c)
+                inserted.append(c)
+        inserted = torch.tensor(inserted, dtype=torch.int)
+        inputs = inputs.update(inserted, torch.randn(num_delta, channel), deleted)
+        # features of kept voxels change as well
+        changed = torch.randperm(inputs.feats.shape[0])[:num_delta]
+        inputs.feats[changed] = torch.randn(num_delta, channel)
+
+        F.reset_incremental_stats()
+        num_mismatch += count_mismatches(inputs)
+        fractions.append(F.get_incremental_stats()["recomputed_fraction"])
+
+    F.conv_config.clear_global_conv_config()
+    return num_mismatch, max(fractions)
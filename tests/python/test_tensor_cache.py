@@ -0,0 +1,127 @@
+import numpy as np
+import torch
+
+import torchsparse
+from torchsparse import nn as spnn
+from torchsparse.utils.tensor_cache import (
+    PersistentTensorCache,
+    TensorCache,
+    TensorCacheMode,
+    get_tensor_cache_mode,
+    resize_cached_kmap,
+    set_persistent_tensor_cache,
+    set_tensor_cache_mode,
+)
+
+from .test_utils import generate_feature_map
+
+__all__ = [
+    "test_persistent_tensor_cache",
+    "test_tensor_cache_eviction",
+    "test_tensor_cache_shared_bytes",
+    "test_tensor_cache_growth",
+    "test_persistent_tensor_cache_budget",
+]
+
+
+def test_persistent_tensor_cache(num_iters: int = 3, device="cpu"):
+    np.random.seed(0)
+    sparse_dict = generate_feature_map((8, 8, 8), [100, 100], 4, with_dense=False)
+    coords = torch.from_numpy(sparse_dict["coords"][:, [3, 0, 1, 2]]).int()
+    feats = torch.from_numpy(sparse_dict["feats"]).float()
+    model = spnn.Conv3d(4, 8, 3).to(device).eval()
+
+    cache_mode = get_tensor_cache_mode()
+    cache = PersistentTensorCache()
+    set_persistent_tensor_cache(cache)
+    set_tensor_cache_mode(TensorCacheMode.PERSISTENT_TENSOR_CACHE)
+    try:
+        outputs = []
+        with torch.no_grad():
+            for _ in range(num_iters):
+                # a fresh coordinate tensor with the same content every frame
+                inputs = torchsparse.SparseTensor(
+                    feats.clone().to(device), coords.clone().to(device)
+                )
+                outputs.append(model(inputs).feats)
+    finally:
+        set_tensor_cache_mode(cache_mode)
+        set_persistent_tensor_cache(None)
+
+    max_adiff = max(
+        (outputs[i] - outputs[0]).abs().max().item() for i in range(num_iters)
+    )
+    return cache.stats(), max_adiff
+
+
+def test_tensor_cache_eviction(num_kmaps: int = 4, kmap_bytes: int = 1024):
+    _caches = TensorCache(max_bytes=3 * kmap_bytes)
+    coords = torch.zeros(16, 4, dtype=torch.int)
+    _caches.cmaps[(1, 1, 1)] = (coords, None)
+    for i in range(num_kmaps):
+        key = ((1, 1, 1), (3, 3, 3), (1, 1, 1), (i + 1,) * 3)
+        _caches.kmaps[key] = {
+            "out_in_map": torch.zeros(kmap_bytes // 4, dtype=torch.int)
+        }
+        # touching the first map keeps it the most recently used one
+        _caches.kmaps.get(((1, 1, 1), (3, 3, 3), (1, 1, 1), (1, 1, 1)))
+    return _caches.stats()
+
+
+def test_tensor_cache_shared_bytes(kmap_bytes: int = 1024):
+    _caches = TensorCache()
+    hashmap = (
+        torch.zeros(kmap_bytes // 8, dtype=torch.long),
+        torch.zeros(kmap_bytes // 4, dtype=torch.int),
+    )
+    _caches.hashmaps[(1, 1, 1)] = hashmap
+    _caches.kmaps[((1, 1, 1), (3, 3, 3), (1, 1, 1), (1, 1, 1))] = {
+        "out_in_map": torch.zeros(kmap_bytes // 4, dtype=torch.int),
+        "hashmap_keys": hashmap[0],
+        "hashmap_vals": hashmap[1],
+    }
+    shared_nbytes = _caches.nbytes()
+
+    # the hash table is still held by the kmap: evicting it alone frees
+    # nothing, so the kmap goes as well
+    _caches.max_bytes = 2 * kmap_bytes
+    _caches.kmaps[((1, 1, 1), (3, 3, 3), (1, 1, 1), (2, 2, 2))] = {
+        "out_in_map": torch.zeros(kmap_bytes // 4, dtype=torch.int)
+    }
+    return shared_nbytes, _caches.stats()
+
+
+def test_tensor_cache_growth(kmap_bytes: int = 1024):
+    _caches = TensorCache(max_bytes=3 * kmap_bytes)
+    kmaps = []
+    for i in range(2):
+        kmap = {"out_in_map": torch.zeros(kmap_bytes // 4, dtype=torch.int)}
+        _caches.kmaps[((1, 1, 1), (3, 3, 3), (1, 1, 1), (i + 1,) * 3)] = kmap
+        kmaps.append(kmap)
+
+    # a backward map added in place to the newest kmap, as in
+    # build_kernel_map_bwd, exceeds max_bytes right away
+    kmaps[1]["out_in_map_bwd"] = torch.zeros(kmap_bytes // 2, dtype=torch.int)
+    resize_cached_kmap(kmaps[1])
+    return _caches.stats()
+
+
+def test_persistent_tensor_cache_budget(kmap_bytes: int = 1024):
+    cache = PersistentTensorCache(max_bytes=3 * kmap_bytes)
+    coords = [torch.full((1, 4), i, dtype=torch.int) for i in range(2)]
+    coords_nbytes = coords[0].numel() * coords[0].element_size()
+    for i in range(2):
+        cache.lookup(coords[i], (1, 1, 1)).kmaps[
+            ((1, 1, 1), (3, 3, 3), (1, 1, 1), (1, 1, 1))
+        ] = {"out_in_map": torch.zeros(kmap_bytes // 4, dtype=torch.int)}
+
+    # the caches of a hit keep growing; the next lookup evicts the other entry
+    cache.lookup(coords[0], (1, 1, 1)).kmaps[
+        ((1, 1, 1), (3, 3, 3), (1, 1, 1), (2, 2, 2))
+    ] = {"out_in_map": torch.zeros(kmap_bytes // 2, dtype=torch.int)}
+    cache.lookup(coords[0], (1, 1, 1))
+    return cache.stats(), coords_nbytes
+
+
+if __name__ == "__main__":
+    print(test_persistent_tensor_cache())
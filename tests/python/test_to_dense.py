@@ -10,7 +10,7 @@ from torchsparse.utils import make_ntuple, to_dense
 
 from .test_utils import generate_feature_map
 
-__all__ = ["test_to_dense_forward"]
+__all__ = ["test_to_dense_forward", "test_to_dense_backward"]
 
 
 def test_to_dense_forward(
@@ -19,13 +19,15 @@ def test_to_dense_forward(
     num_points: int = 6,
     channel: int = 4,
     device="cuda:0",
+    dtype=torch.float16,
+    channel_first: bool = False,
 ):
 
     np.random.seed(0)
     torch.manual_seed(0)
 
-    torch_dtype = torch.float16
-    np_dtype = np.float16
+    torch_dtype = dtype
+    np_dtype = np.float16 if dtype == torch.float16 else np.float32
 
     shape = make_ntuple(shape, ndim=3)
     spatial_range = make_ntuple([batch_size, *shape], ndim=4)
@@ -40,12 +42,16 @@ def test_to_dense_forward(
 
     feats = np.ascontiguousarray(sparse_dict["feats"])
     coords = np.ascontiguousarray(sparse_dict["coords"][:, [3, 0, 1, 2]])  # batch first
-    ref_dense_feats = sparse_dict["dense_feats"].transpose(0, 2, 3, 4, 1)
+    ref_dense_feats = torch.from_numpy(sparse_dict["dense_feats"])
+    ref_dense_feats = ref_dense_feats.to(torch_dtype).float().numpy()
+    if not channel_first:
+        ref_dense_feats = ref_dense_feats.transpose(0, 2, 3, 4, 1)
 
     coords_t = torch.from_numpy(coords).int().to(device)
     feats_t = torch.from_numpy(feats).to(torch_dtype).to(device)
 
-    output = to_dense(feats_t, coords_t, spatial_range).cpu().numpy()
+    output = to_dense(feats_t, coords_t, spatial_range, channel_first)
+    output = output.float().cpu().numpy()
 
     # print(output)
     # print(ref_dense_feats)
@@ -54,6 +60,39 @@ def test_to_dense_forward(
     return max_adiff
 
 
+def test_to_dense_backward(
+    batch_size: int = 2,
+    shape: Union[int, Tuple[int, ...]] = 4,
+    num_points: int = 20,
+    channel: int = 4,
+    device="cpu",
+    channel_first: bool = False,
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    shape = make_ntuple(shape, ndim=3)
+    spatial_range = make_ntuple([batch_size, *shape], ndim=4)
+    num_points = [min(num_points, int(np.prod(shape)))] * batch_size
+
+    sparse_dict = generate_feature_map(
+        shape, num_points, channel, with_dense=False, dtype=np.float32
+    )
+    coords = np.ascontiguousarray(sparse_dict["coords"][:, [3, 0, 1, 2]])
+    coords_t = torch.from_numpy(coords).long().to(device)
+    feats_t = torch.from_numpy(sparse_dict["feats"]).to(device).requires_grad_()
+
+    output = to_dense(feats_t, coords_t, spatial_range, channel_first)
+    grad_output = torch.randn_like(output)
+    output.backward(grad_output)
+
+    if channel_first:
+        grad_output = grad_output.permute(0, 2, 3, 4, 1)
+    ref_grad = grad_output[tuple(coords_t.t())]
+    max_adiff = (feats_t.grad - ref_grad).abs().max().item()
+    return max_adiff
+
+
 if __name__ == "__main__":
     max_adiff = test_to_dense_forward()
     print(max_adiff)
@@ -3,6 +3,8 @@ from typing import Any, Dict, Tuple, Union, Optional, List
 import numpy as np
 import torch
 
+from torchsparse.nn import functional as F
+
 
 def generate_feature_map(
     shape,
@@ -107,3 +109,24 @@ def dense_pad(dense_feats_t, kernel_size):
         0,
     )
     return dense_feats_t
+
+
+def sort_rows(coords: torch.Tensor, feats: torch.Tensor):
+    # rows of a sparse tensor in lexicographic coordinate order
+    keys = torch.zeros(coords.shape[0], dtype=torch.long)
+    for k in range(coords.shape[1]):
+        keys = keys * 1024 + coords[:, k].long()
+    order = torch.argsort(keys)
+    return coords[order], feats[order]
+
+
+def make_conv_config(dataflow=None, **kwargs):
+    # default conv config with kernel maps built by the CPU hashmap; keyword
+    # arguments override any other field
+    config = F.conv_config.get_default_conv_config().copy()
+    if dataflow is not None:
+        config.dataflow = dataflow
+    config.kmap_mode = "hashmap"
+    for name, value in kwargs.items():
+        setattr(config, name, value)
+    return config
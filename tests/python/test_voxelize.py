@@ -0,0 +1,107 @@
+from typing import Any, Dict, Tuple, Union, Optional, List
+
+import numpy as np
+import torch
+
+from torchsparse.nn import functional as F
+
+__all__ = ["test_voxelize", "test_devoxelize", "test_devoxelize_backward_indexing"]
+
+
+def test_voxelize(
+    num_points: int = 200,
+    num_voxels: int = 30,
+    channel: int = 8,
+    device="cpu",
+    dtype=torch.float32,
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    # many points per voxel, and a few voxels without any point
+    idx = torch.randint(0, num_voxels - 3, (num_points,), device=device).int()
+    counts = torch.bincount(idx.long(), minlength=num_voxels).int()
+    feats = torch.randn(num_points, channel, device=device).to(dtype)
+    feats.requires_grad_()
+
+    output = F.spvoxelize(feats, idx, counts)
+    grad_output = torch.randn_like(output)
+    output.backward(grad_output)
+
+    denom = counts.clamp(min=1).double().unsqueeze(1)
+    ref_output = torch.zeros(num_voxels, channel, dtype=torch.float64, device=device)
+    ref_output.index_add_(0, idx.long(), feats.detach().double())
+    ref_output /= denom
+    ref_grad = (grad_output.double() / denom)[idx.long()]
+
+    fwd_adiff = (output.double() - ref_output).abs().max().item()
+    bwd_adiff = (feats.grad.double() - ref_grad).abs().max().item()
+    return fwd_adiff, bwd_adiff
+
+
+def test_devoxelize(
+    num_points: int = 200,
+    num_voxels: int = 30,
+    channel: int = 8,
+    device="cpu",
+    dtype=torch.float32,
+):
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    # corners repeat across and within points, -1 marks a missing corner
+    indices = torch.randint(0, num_voxels, (num_points, 8), device=device).int()
+    indices[torch.rand(num_points, 8, device=device) < 0.2] = -1
+    weights = torch.rand(num_points, 8, device=device)
+    weights[indices == -1] = 0
+    weights /= weights.sum(dim=1, keepdim=True) + 1e-8
+    feats = torch.randn(num_voxels, channel, device=device).to(dtype)
+    feats.requires_grad_()
+
+    output = F.spdevoxelize(feats, indices, weights)
+    grad_output = torch.randn_like(output)
+    output.backward(grad_output)
+
+    valid = indices >= 0
+    safe_indices = indices.long().clamp(min=0)
+    w = weights.double() * valid
+    ref_output = (feats.detach().double()[safe_indices] * w.unsqueeze(2)).sum(1)
+    ref_grad = torch.zeros(num_voxels, channel, dtype=torch.float64, device=device)
+    ref_grad.index_add_(
+        0,
+        safe_indices[valid],
+        (grad_output.double().unsqueeze(1) * w.unsqueeze(2))[valid],
+    )
+
+    fwd_adiff = (output.double() - ref_output).abs().max().item()
+    bwd_adiff = (feats.grad.double() - ref_grad).abs().max().item()
+    return fwd_adiff, bwd_adiff
+
+
+def test_devoxelize_backward_indexing(device="cpu"):
+    # 2 points interpolating from 4 voxels; the voxel ids exceed the number of
+    # points, so reading top_grad at a voxel id instead of at the point (the
+    # old CPU kernel) goes out of range or picks up the wrong row
+    indices = torch.tensor(
+        [[3, 3, 2, -1, -1, -1, -1, -1], [0, 3, -1, -1, -1, -1, -1, -1]],
+        dtype=torch.int,
+        device=device,
+    )
+    weights = torch.zeros(2, 8, device=device)
+    weights[0, :3] = torch.tensor([0.25, 0.25, 0.5])
+    weights[1, :2] = torch.tensor([0.5, 0.5])
+    top_grad = torch.tensor([[1.0, 2.0], [10.0, 20.0]], device=device)
+    feats = torch.zeros(4, 2, device=device, requires_grad=True)
+
+    output = F.spdevoxelize(feats, indices, weights)
+    output.backward(top_grad)
+    ref_grad = torch.tensor(
+        [[5.0, 10.0], [0.0, 0.0], [0.5, 1.0], [5.5, 11.0]], device=device
+    )
+    return (feats.grad - ref_grad).abs().max().item()
+
+
+if __name__ == "__main__":
+    print(test_voxelize())
+    print(test_devoxelize())
+    print(test_devoxelize_backward_indexing())
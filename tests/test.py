@@ -1,8 +1,45 @@
 import unittest
+
+import torch
 from torchsparse.nn import functional as F
+from python.test_utils import make_conv_config
 from python import (
     test_single_layer_convolution_forward,
+    test_single_layer_convolution_backward,
+    test_mixed_dtype_convolution,
+    test_grouped_convolution,
+    test_strided_convolution_same_size,
     test_to_dense_forward,
+    test_to_dense_backward,
+    test_voxelize,
+    test_devoxelize,
+    test_devoxelize_backward_indexing,
+    test_build_kernel_map_hashmap,
+    test_prebuild_kernel_maps,
+    test_lazy_backward_kernel_map,
+    test_spdownsample,
+    test_compact_kernel_map,
+    test_symmetric_kernel_map,
+    test_sparse_quantize,
+    test_persistent_tensor_cache,
+    test_persistent_tensor_cache_budget,
+    test_tensor_cache_eviction,
+    test_tensor_cache_shared_bytes,
+    test_tensor_cache_growth,
+    test_import_time,
+    test_batch_segments,
+    test_segment_norm,
+    test_instance_norm_running_stats,
+    test_fuse_modules,
+    test_pool3d,
+    test_bev_modules,
+    test_sparse_set_ops,
+    test_streaming_update,
+    test_streaming_update_arguments,
+    test_incremental_inference,
+    test_curve_codes,
+    test_reorder,
+    test_reorder_global_cache,
 )
 
 
@@ -46,6 +83,318 @@ class ToDenseTestCase(unittest.TestCase):
         max_adiff = test_to_dense_forward()
         self.assertLessEqual(max_adiff, 1e-5)
 
+    def test_to_dense_cpu(self):
+        for dtype in [torch.float32, torch.float16, torch.bfloat16]:
+            for channel_first in [False, True]:
+                max_adiff = test_to_dense_forward(
+                    device="cpu", dtype=dtype, channel_first=channel_first
+                )
+                self.assertEqual(max_adiff, 0.0)
+                max_adiff = test_to_dense_backward(channel_first=channel_first)
+                self.assertEqual(max_adiff, 0.0)
+
+
+class VoxelizeTestCase(unittest.TestCase):
+    # max abs diff against a float64 torch reference
+    tolerances = {
+        torch.float32: 1e-5,
+        torch.float64: 1e-10,
+        torch.float16: 1e-2,
+        torch.bfloat16: 5e-2,
+    }
+
+    def test_voxelize_cpu(self):
+        for dtype, tol in self.tolerances.items():
+            fwd_adiff, bwd_adiff = test_voxelize(dtype=dtype)
+            self.assertLessEqual(fwd_adiff, tol)
+            self.assertLessEqual(bwd_adiff, tol)
+
+    def test_devoxelize_cpu(self):
+        for dtype, tol in self.tolerances.items():
+            fwd_adiff, bwd_adiff = test_devoxelize(dtype=dtype)
+            self.assertLessEqual(fwd_adiff, tol)
+            self.assertLessEqual(bwd_adiff, tol)
+
+    def test_devoxelize_backward_indexing(self):
+        # gradients are read at the point, not at the voxel it interpolates
+        max_adiff = test_devoxelize_backward_indexing()
+        self.assertEqual(max_adiff, 0.0)
+
+
+class CPUKernelMapTestCase(unittest.TestCase):
+    def test_build_kernel_map_hashmap(self):
+        for kernel_size, stride in [(2, 1), (3, 1), (5, 1), (2, 2), (3, 3), (3, 2)]:
+            num_mismatch = test_build_kernel_map_hashmap(
+                kernel_size=kernel_size, stride=stride, device="cpu"
+            )
+            self.assertEqual(num_mismatch, 0)
+
+    def test_prebuild_kernel_maps(self):
+        F.conv_config.set_global_conv_config(make_conv_config())
+        num_signatures, num_rebuilt, max_adiff = test_prebuild_kernel_maps()
+        F.conv_config.clear_global_conv_config()
+        self.assertEqual(num_signatures, 3)
+        self.assertEqual(num_rebuilt, 0)
+        self.assertEqual(max_adiff, 0.0)
+
+    def test_lazy_backward_kernel_map(self):
+        built_in_no_grad, built_in_backward, max_adiff = (
+            test_lazy_backward_kernel_map()
+        )
+        self.assertFalse(built_in_no_grad)
+        self.assertTrue(built_in_backward)
+        self.assertLessEqual(max_adiff, 1e-4)
+
+    def test_spdownsample(self):
+        cases = [(2, 2, 0), (3, 2, 0), (3, 2, 1), (5, 3, 1)]
+        for kernel_size, stride, padding in cases:
+            num_mismatch = test_spdownsample(
+                kernel_size=kernel_size, stride=stride, padding=padding
+            )
+            self.assertEqual(num_mismatch, 0)
+
+    def test_compact_kernel_map(self):
+        max_adiff, num_mismatch, memory_ratio = test_compact_kernel_map()
+        self.assertLessEqual(max_adiff, 1e-4)
+        self.assertEqual(num_mismatch, 0)
+        self.assertLess(memory_ratio, 0.5)
+
+    def test_symmetric_kernel_map(self):
+        for kernel_size in [3, 5, (3, 1, 5)]:
+            symmetric, num_mismatch = test_symmetric_kernel_map(kernel_size)
+            self.assertTrue(symmetric)
+            self.assertEqual(num_mismatch, 0)
+
+
+class SparseQuantizeTestCase(unittest.TestCase):
+    def test_sparse_quantize(self):
+        for reduction in ["mean", "max", "sum"]:
+            num_mismatch, max_adiff = test_sparse_quantize(reduction=reduction)
+            self.assertEqual(num_mismatch, 0)
+            self.assertLessEqual(max_adiff, 1e-5)
+
+
+class TensorCacheTestCase(unittest.TestCase):
+    def test_persistent_tensor_cache(self):
+        stats, max_adiff = test_persistent_tensor_cache(num_iters=3)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+        self.assertGreater(stats["nbytes"], 0)
+        self.assertEqual(max_adiff, 0.0)
+
+    def test_tensor_cache_eviction(self):
+        stats = test_tensor_cache_eviction(num_kmaps=4, kmap_bytes=1024)
+        self.assertLessEqual(stats["nbytes"], stats["max_bytes"])
+        kmap_stats = stats["per_stride"][("kmaps", (1, 1, 1))]
+        self.assertEqual(kmap_stats["evictions"], 2)
+        self.assertEqual(kmap_stats["entries"], 2)
+        self.assertEqual(kmap_stats["hits"], 4)
+        # cmaps are never evicted
+        self.assertEqual(stats["per_stride"][("cmaps", (1, 1, 1))]["entries"], 1)
+
+    def test_tensor_cache_shared_bytes(self):
+        shared_nbytes, stats = test_tensor_cache_shared_bytes(kmap_bytes=1024)
+        # the hash table held by the kmap is counted once
+        self.assertEqual(shared_nbytes, 3 * 1024)
+        self.assertEqual(stats["nbytes"], 1024)
+        self.assertEqual(stats["entries"], 1)
+
+    def test_tensor_cache_growth(self):
+        stats = test_tensor_cache_growth(kmap_bytes=1024)
+        self.assertEqual(stats["nbytes"], 3 * 1024)
+        kmap_stats = stats["per_stride"][("kmaps", (1, 1, 1))]
+        self.assertEqual(kmap_stats["evictions"], 1)
+        self.assertEqual(kmap_stats["entries"], 1)
+
+    def test_persistent_tensor_cache_budget(self):
+        stats, coords_nbytes = test_persistent_tensor_cache_budget(kmap_bytes=1024)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["nbytes"], 3 * 1024 + coords_nbytes)
+
+
+class CPUConvTestCase(unittest.TestCase):
+    def _test_forward(self, dataflow):
+        F.conv_config.set_global_conv_config(make_conv_config(dataflow))
+        for kernel_size, stride in [(2, 1), (3, 1), (5, 1), (2, 2), (3, 3), (3, 2)]:
+            mean_adiff, max_rdiff = test_single_layer_convolution_forward(
+                kernel_size=kernel_size, stride=stride, device="cpu", is_half=False
+            )
+            self.assertLessEqual(mean_adiff, 1e-4)
+            self.assertLessEqual(max_rdiff, 1e-2)
+        F.conv_config.clear_global_conv_config()
+
+    def test_implicit_gemm_forward(self):
+        self._test_forward(F.Dataflow.ImplicitGEMM)
+
+    def test_gather_scatter_forward(self):
+        self._test_forward(F.Dataflow.GatherScatter)
+
+    def test_torch_native_forward(self):
+        self._test_forward(F.Dataflow.TorchNative)
+
+    def _test_backward(self, dataflow):
+        for kernel_size, stride in [(2, 1), (3, 1), (2, 2), (3, 3), (3, 2)]:
+            # transposed layers only undo a downsampling
+            for transposed in [False, True] if stride > 1 else [False]:
+                max_adiff = test_single_layer_convolution_backward(
+                    dataflow,
+                    F.Dataflow.GatherScatter,
+                    kernel_size=kernel_size,
+                    stride=stride,
+                    transposed=transposed,
+                )
+                self.assertLessEqual(max_adiff, 1e-3)
+
+    def test_implicit_gemm_backward(self):
+        self._test_backward(F.Dataflow.ImplicitGEMM)
+
+    def test_torch_native_backward(self):
+        self._test_backward(F.Dataflow.TorchNative)
+
+    def test_mixed_dtype_convolution(self):
+        for dtype in [torch.float16, torch.bfloat16]:
+            for kernel_size, stride in [(3, 1), (2, 2)]:
+                out_dtype, max_adiff = test_mixed_dtype_convolution(
+                    F.Dataflow.ImplicitGEMM,
+                    dtype,
+                    kernel_size=kernel_size,
+                    stride=stride,
+                )
+                self.assertEqual(out_dtype, torch.float32)
+                self.assertEqual(max_adiff, 0.0)
+
+    def test_grouped_convolution(self):
+        for dataflow in [F.Dataflow.GatherScatter, F.Dataflow.TorchNative]:
+            # grouped, depthwise, depthwise with channel multiplier
+            for groups, IC, OC in [(4, 16, 32), (16, 16, 16), (16, 16, 32)]:
+                for kernel_size, stride in [(3, 1), (2, 2), (1, 1)]:
+                    max_adiff = test_grouped_convolution(
+                        dataflow,
+                        groups=groups,
+                        IC=IC,
+                        OC=OC,
+                        kernel_size=kernel_size,
+                        stride=stride,
+                    )
+                    self.assertLessEqual(max_adiff, 1e-3)
+
+    def test_strided_convolution_same_size(self):
+        for dataflow in [F.Dataflow.GatherScatter, F.Dataflow.TorchNative]:
+            num_outputs, max_adiff = test_strided_convolution_same_size(dataflow)
+            self.assertEqual(num_outputs, 2)
+            self.assertLessEqual(max_adiff, 1e-5)
+
+
+class SegmentTestCase(unittest.TestCase):
+    def test_batch_segments(self):
+        for shuffle in [False, True]:
+            reused, max_adiff = test_batch_segments(shuffle=shuffle)
+            self.assertTrue(reused)
+            self.assertLessEqual(max_adiff, 1e-5)
+
+    def test_segment_norm(self):
+        for norm in ["instance", "group"]:
+            max_adiff = test_segment_norm(norm=norm)
+            self.assertLessEqual(max_adiff, 1e-8)
+
+    def test_instance_norm_running_stats(self):
+        for empty_sample in [False, True]:
+            max_adiff = test_instance_norm_running_stats(empty_sample=empty_sample)
+            self.assertLessEqual(max_adiff, 1e-8)
+
+
+class FuseModulesTestCase(unittest.TestCase):
+    def test_fuse_modules(self):
+        num_bn, max_adiff = test_fuse_modules()
+        # every batch norm follows a Conv3d in a Sequential
+        self.assertEqual(num_bn, 0)
+        self.assertLessEqual(max_adiff, 1e-4)
+
+
+class PoolingTestCase(unittest.TestCase):
+    def test_pool3d(self):
+        for mode in ["max", "avg"]:
+            for kernel_size, stride, padding in [(3, 1, 1), (2, 2, 0), (3, 2, 1)]:
+                max_adiff = test_pool3d(
+                    mode, kernel_size=kernel_size, stride=stride, padding=padding
+                )
+                self.assertLessEqual(max_adiff, 1e-8)
+
+
+class BEVTestCase(unittest.TestCase):
+    def test_bev_modules(self):
+        num_mismatch, max_adiff = test_bev_modules()
+        self.assertEqual(num_mismatch, 0)
+        self.assertLessEqual(max_adiff, 1e-10)
+
+
+class OperatorsTestCase(unittest.TestCase):
+    def test_sparse_set_ops(self):
+        num_mismatch, max_adiff = test_sparse_set_ops()
+        self.assertEqual(num_mismatch, 0)
+        self.assertLessEqual(max_adiff, 1e-10)
+
+
+class StreamingTestCase(unittest.TestCase):
+    def test_streaming_update(self):
+        for dataflow in [F.Dataflow.ImplicitGEMM, F.Dataflow.GatherScatter]:
+            num_rebuilt, max_adiff = test_streaming_update(dataflow)
+            # every kernel map was patched instead of rebuilt
+            self.assertEqual(num_rebuilt, 0)
+            self.assertLessEqual(max_adiff, 1e-10)
+
+    def test_streaming_update_arguments(self):
+        num_rejected, version = test_streaming_update_arguments()
+        self.assertEqual(num_rejected, 4)
+        self.assertEqual(version, 0)
+
+    def test_incremental_inference(self):
+        num_mismatch, fraction = test_incremental_inference()
+        # bit-identical to an ordinary forward, without recomputing every row
+        self.assertEqual(num_mismatch, 0)
+        self.assertLess(fraction, 1.0)
+
+    def test_incremental_inference_fused(self):
+        _, fraction = test_incremental_inference()
+        num_mismatch, fused_fraction = test_incremental_inference(fused=True)
+        # the fused activations keep the stored outputs intact
+        self.assertEqual(num_mismatch, 0)
+        self.assertEqual(fused_fraction, fraction)
+
+
+class ReorderTestCase(unittest.TestCase):
+    def test_curve_codes(self):
+        num_duplicates, max_step = test_curve_codes("hilbert")
+        self.assertEqual(num_duplicates, 0)
+        self.assertEqual(max_step, 1)
+        num_duplicates, _ = test_curve_codes("morton")
+        self.assertEqual(num_duplicates, 0)
+
+    def test_reorder(self):
+        for curve in ["morton", "hilbert"]:
+            for dataflow in [F.Dataflow.ImplicitGEMM, F.Dataflow.GatherScatter]:
+                max_adiff, num_unsorted, num_strides = test_reorder(curve, dataflow)
+                self.assertLessEqual(max_adiff, 1e-4)
+                # rows stay in curve order through every downsampling
+                self.assertEqual(num_unsorted, 0)
+                self.assertEqual(num_strides, 3)
+
+    def test_reorder_global_cache(self):
+        max_adiff, leaked_curve = test_reorder_global_cache()
+        self.assertLessEqual(max_adiff, 1e-4)
+        self.assertIsNone(leaked_curve)
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_import_time(self):
+        stats = test_import_time()
+        # importing torchsparse on top of torch must stay cheap and lazy
+        self.assertLessEqual(stats["import_time"], 1.0)
+        self.assertFalse(stats["cuda_initialized"])
+        self.assertEqual(stats["heavy_modules"], [])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,7 +2,13 @@ import torchsparse.backends as backends
 
 from .operators import *
 from .tensor import *
-from .utils.tune import tune
 from .version import __version__
 
-backends.init()
+
+def __getattr__(name: str):
+    # the tuner pulls in tqdm and the whole nn tree; import it on first use
+    if name == "tune":
+        from .utils.tune import tune
+
+        return tune
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,183 +1,340 @@
 #include "convolution_gather_scatter_cpu.h"
 
+#include <ATen/OpMathType.h>
 #include <torch/extension.h>
 
 #include <algorithm>
-#include <chrono>
+#include <vector>
 
-void scatter_cpu(const int n_in, const int n_out, const int c,
-                 const float *in_feat, float *out_feat, const int *kmap,
-                 const bool transpose) {
-  for (int i = 0; i < n_in; i++) {
-    int out_pos = kmap[2 * i + 1 - transpose];
-    if (out_pos < 0) {
+#include "../utils/segment_cpu.h"
+
+// Upper bound on the number of buffered elements (rows x (c_in + c_out)) for
+// one group of kernel offsets. Offsets are processed group by group so that a
+// single gather / scatter pass and a single batched GEMM cover many offsets.
+#define GROUP_ELEMENTS (1 << 24)
+
+// out_feat[i] = in_feat[kmap[i][transpose]], parallel over the n_k map rows.
+template <typename scalar_t>
+void gather_cpu(const int n_k, const int c, const scalar_t *in_feat,
+                scalar_t *out_feat, const int *kmap, const bool transpose) {
+#pragma omp parallel for
+  for (int i = 0; i < n_k; i++) {
+    int in_pos = kmap[2 * i + transpose];
+    scalar_t *dst = out_feat + (int64_t)i * c;
+    if (in_pos < 0) {
+      std::fill(dst, dst + c, (scalar_t)0);
       continue;
     }
-#pragma omp parallel for
-    for (int j = 0; j < c; j++) {
-      out_feat[out_pos * c + j] += in_feat[i * c + j];
+    const scalar_t *src = in_feat + (int64_t)in_pos * c;
+    std::copy(src, src + c, dst);
+  }
+}
+
+// out_feat[kmap[i][1 - transpose]] += in_feat[i] for the n_k map rows.
+// Map rows are first bucketed by output position (counting sort), so every
+// output row is owned by exactly one thread and accumulated without atomics.
+template <typename scalar_t>
+void scatter_cpu(const int n_k, const int n_out, const int c,
+                 const scalar_t *in_feat, scalar_t *out_feat, const int *kmap,
+                 const bool transpose) {
+  using acc_t = at::opmath_type<scalar_t>;
+  std::vector<int> seg_ptr, seg_rows;
+  build_segments_cpu(
+      n_k, n_out, [&](int i) { return kmap[2 * i + 1 - transpose]; }, seg_ptr,
+      seg_rows);
+
+#pragma omp parallel
+  {
+    std::vector<acc_t> acc(c);
+#pragma omp for schedule(static)
+    for (int o = 0; o < n_out; o++) {
+      if (seg_ptr[o] == seg_ptr[o + 1]) continue;
+      scalar_t *dst = out_feat + (int64_t)o * c;
+      for (int j = 0; j < c; j++) acc[j] = dst[j];
+      for (int s = seg_ptr[o]; s < seg_ptr[o + 1]; s++) {
+        const scalar_t *src = in_feat + (int64_t)seg_rows[s] * c;
+        for (int j = 0; j < c; j++) acc[j] += src[j];
+      }
+      for (int j = 0; j < c; j++) dst[j] = acc[j];
     }
   }
 }
 
-void gather_cpu(const int n_k, const int n_in, const int c,
-                const float *in_feat, float *out_feat, const int *kmap,
-                const bool transpose) {
-  for (int i = 0; i < n_k; i++) {
-    int in_pos = kmap[2 * i + transpose];
-    if (in_pos < 0) {
+// Kernel offsets [begin, end), whose map rows are buffered as one (end -
+// begin, pad, c) batch: offset k at rows [(k - begin) * pad, (k - begin) *
+// pad + nbsizes[k]), followed by zero padding.
+struct OffsetGroup {
+  int begin, end;
+  int64_t pad;
+};
+
+// Splits the kernel offsets into consecutive groups whose padded batch fits
+// in max_rows. Offsets of very different sizes are not batched together, so
+// that at most half of a batch is padding. The center offset of a submanifold
+// convolution is handled with a dense GEMM and never enters a group.
+static std::vector<OffsetGroup> get_offset_groups(const int *nbsizes,
+                                                  const int kernel_volume,
+                                                  const bool skip_center,
+                                                  const int64_t max_rows) {
+  std::vector<OffsetGroup> groups;
+  int k = 0;
+  while (k < kernel_volume) {
+    if (skip_center && k == kernel_volume / 2) {
+      k++;
       continue;
     }
-#pragma omp parallel for
-    for (int j = 0; j < c; j++) {
-      out_feat[i * c + j] = in_feat[in_pos * c + j];
+    int k_end = k;
+    int64_t rows = 0, pad = 0;
+    while (k_end < kernel_volume &&
+           !(skip_center && k_end == kernel_volume / 2)) {
+      const int64_t next_pad = std::max<int64_t>(pad, nbsizes[k_end]);
+      const int64_t padded = (k_end - k + 1) * next_pad;
+      if (k_end > k &&
+          (padded > max_rows || padded > 2 * (rows + nbsizes[k_end]))) {
+        break;
+      }
+      rows += nbsizes[k_end];
+      pad = next_pad;
+      k_end++;
     }
+    if (rows > 0) groups.push_back({k, k_end, pad});
+    k = k_end;
+  }
+  return groups;
+}
+
+// The map rows of a group in its padded batch layout; padding rows are -1
+// on both sides, so they gather zeros and are never scattered.
+static std::vector<int> get_group_map(const OffsetGroup &group,
+                                      const int *nbmap, const int *nbsizes,
+                                      const std::vector<int64_t> &starts) {
+  std::vector<int> group_map(2 * (group.end - group.begin) * group.pad, -1);
+  for (int k = group.begin; k < group.end; k++) {
+    std::copy(nbmap + 2 * starts[k], nbmap + 2 * starts[k + 1],
+              group_map.begin() + 2 * (k - group.begin) * group.pad);
+  }
+  return group_map;
+}
+
+static int64_t get_group_rows(const int *nbsizes, const int kernel_volume,
+                              const int channels) {
+  int64_t max_size = *std::max_element(nbsizes, nbsizes + kernel_volume);
+  return std::max<int64_t>(std::max<int64_t>(max_size, 1),
+                           GROUP_ELEMENTS / std::max(channels, 1));
+}
+
+// out[b] = in[b] x kernel[b] with block-diagonal channel groups: in (B, rows,
+// c_in), kernel (B, c_in / groups, c_out), output channel group g only reads
+// input channel group g. Depthwise kernels (one input channel per group) are
+// elementwise products.
+static void grouped_bmm_out(at::Tensor out, const at::Tensor &in,
+                            const at::Tensor &kernel, const int groups) {
+  if (groups == 1) {
+    torch::bmm_out(out, in, kernel);
+    return;
   }
+  const int64_t batch = in.size(0);
+  const int64_t rows = in.size(1);
+  const int64_t c_in_g = kernel.size(1);
+  const int64_t c_out_g = kernel.size(2) / groups;
+  auto out_g = out.view({batch, rows, groups, c_out_g});
+  if (c_in_g == 1) {
+    torch::mul_out(out_g, in.view({batch, rows, groups, 1}),
+                   kernel.view({batch, 1, groups, c_out_g}));
+    return;
+  }
+  auto in_g = in.view({batch, rows, groups, c_in_g})
+                  .permute({0, 2, 1, 3})
+                  .reshape({batch * groups, rows, c_in_g});
+  auto kernel_g = kernel.view({batch, c_in_g, groups, c_out_g})
+                      .permute({0, 2, 1, 3})
+                      .reshape({batch * groups, c_in_g, c_out_g});
+  out_g.copy_(torch::bmm(in_g, kernel_g)
+                  .view({batch, groups, rows, c_out_g})
+                  .permute({0, 2, 1, 3}));
+}
+
+// grad_kernel[b] = in[b]^T x grad_out[b] restricted to the channel groups,
+// in the (B, c_in / groups, c_out) layout of grouped_bmm_out.
+static void grouped_wgrad_bmm_out(at::Tensor grad_kernel, const at::Tensor &in,
+                                  const at::Tensor &grad_out,
+                                  const int groups) {
+  if (groups == 1) {
+    torch::bmm_out(grad_kernel, in.transpose(1, 2), grad_out);
+    return;
+  }
+  const int64_t batch = in.size(0);
+  const int64_t rows = in.size(1);
+  const int64_t c_in_g = grad_kernel.size(1);
+  const int64_t c_out_g = grad_kernel.size(2) / groups;
+  auto in_g = in.view({batch, rows, groups, c_in_g})
+                  .permute({0, 2, 3, 1})
+                  .reshape({batch * groups, c_in_g, rows});
+  auto grad_out_g = grad_out.view({batch, rows, groups, c_out_g})
+                        .permute({0, 2, 1, 3})
+                        .reshape({batch * groups, rows, c_out_g});
+  grad_kernel.view({batch, c_in_g, groups, c_out_g})
+      .copy_(torch::bmm(in_g, grad_out_g)
+                 .view({batch, groups, c_in_g, c_out_g})
+                 .permute({0, 2, 1, 3}));
 }
 
 void conv_forward_gather_scatter_cpu(at::Tensor in_feat, at::Tensor out_feat,
-                             at::Tensor kernel, at::Tensor neighbor_map,
-                             at::Tensor neighbor_offset, const bool transpose) {
-  if (in_feat.size(1) != kernel.size(1)) {
+                                     at::Tensor kernel, at::Tensor neighbor_map,
+                                     at::Tensor neighbor_offset,
+                                     const bool transpose, const int groups,
+                                     const bool submanifold) {
+  if (in_feat.size(1) != kernel.size(1) * groups ||
+      kernel.size(2) % groups != 0) {
     throw std::invalid_argument("Input feature size and kernel size mismatch");
   }
+  in_feat = in_feat.contiguous();
+  kernel = kernel.contiguous();
+  neighbor_map = neighbor_map.contiguous();
 
   int out_nrows = out_feat.size(0);
   out_feat.resize_({out_nrows, kernel.size(2)});
   out_feat.zero_();
 
-  int kernel_volume = kernel.size(0);
-  int in_buffer_size = 1;
-  bool flag = false;
-  // memory optimization
-  if (kernel_volume % 2 && out_nrows == in_feat.size(0)) {
-    flag = true;
-    in_buffer_size =
-        *std::max_element(neighbor_offset.data_ptr<int>(),
-                          neighbor_offset.data_ptr<int>() + kernel_volume / 2);
-    in_buffer_size =
-        std::max(in_buffer_size,
-                 *std::max_element(
-                     neighbor_offset.data_ptr<int>() + kernel_volume / 2 + 1,
-                     neighbor_offset.data_ptr<int>() + kernel_volume));
-    in_buffer_size = std::max(in_buffer_size, 1);
-
-    torch::mm_out(out_feat, in_feat, kernel[kernel_volume / 2]);
-  } else {
-    in_buffer_size =
-        *std::max_element(neighbor_offset.data_ptr<int>(),
-                          neighbor_offset.data_ptr<int>() + kernel_volume);
+  const int kernel_volume = kernel.size(0);
+  const int c_in = in_feat.size(1);
+  const int c_out = kernel.size(2);
+  const int *nbsizes = neighbor_offset.data_ptr<int>();
+  const int *nbmap = neighbor_map.data_ptr<int>();
+
+  // memory optimization: the center offset of a submanifold convolution
+  // (unit strides, same coordinates in and out) is the identity map.
+  const bool skip_center = submanifold && kernel_volume % 2;
+  if (skip_center) {
+    grouped_bmm_out(out_feat.unsqueeze(0), in_feat.unsqueeze(0),
+                    kernel.narrow(0, kernel_volume / 2, 1), groups);
   }
 
-  auto options =
-      torch::TensorOptions().dtype(in_feat.dtype()).device(in_feat.device());
-  auto in_buffer = torch::zeros({in_buffer_size, in_feat.size(1)}, options);
-  auto out_buffer = torch::zeros({in_buffer_size, kernel.size(2)}, options);
-  int cur_offset = 0;
-  for (int i = 0; i < kernel_volume; i++) {
-    if (flag && (i == kernel_volume / 2)) {
-      cur_offset += 2 * neighbor_offset.data_ptr<int>()[i];
-      continue;
-    }
+  std::vector<int64_t> starts(kernel_volume + 1, 0);
+  for (int k = 0; k < kernel_volume; k++) starts[k + 1] = starts[k] + nbsizes[k];
 
-    if (neighbor_offset.data_ptr<int>()[i] == 0) {
-      continue;
-    }
+  const int64_t max_rows =
+      std::min(get_group_rows(nbsizes, kernel_volume, c_in + c_out),
+               std::max<int64_t>(starts[kernel_volume], 1));
+  auto offset_groups =
+      get_offset_groups(nbsizes, kernel_volume, skip_center, max_rows);
+  if (offset_groups.empty()) return;
 
-    auto out_buffer_activated = torch::from_blob(
-        out_buffer.data_ptr<float>(),
-        {neighbor_offset.data_ptr<int>()[i], kernel.size(2)}, options);
-    auto in_buffer_activated = torch::from_blob(
-        in_buffer.data_ptr<float>(),
-        {neighbor_offset.data_ptr<int>()[i], in_feat.size(1)}, options);
-
-    // gather
-    gather_cpu(in_buffer_activated.size(0), in_feat.size(0), kernel.size(1),
-               in_feat.data_ptr<float>(), in_buffer_activated.data_ptr<float>(),
-               neighbor_map.data_ptr<int>() + cur_offset, transpose);
-
-    // matmul
-    torch::mm_out(out_buffer_activated, in_buffer_activated, kernel[i]);
-
-    // scatter
-    scatter_cpu(neighbor_offset.data_ptr<int>()[i], out_nrows, kernel.size(2),
-                out_buffer_activated.data_ptr<float>(),
-                out_feat.data_ptr<float>(),
-                neighbor_map.data_ptr<int>() + cur_offset, transpose);
-    cur_offset += 2 * neighbor_offset.data_ptr<int>()[i];
-  }
+  auto in_buffer = torch::empty({max_rows, c_in}, in_feat.options());
+  auto out_buffer = torch::empty({max_rows, c_out}, in_feat.options());
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, in_feat.scalar_type(),
+      "conv_forward_gather_scatter_cpu", ([&] {
+        for (auto &group : offset_groups) {
+          const int n_offsets = group.end - group.begin;
+          const int rows = n_offsets * group.pad;
+          auto group_map = get_group_map(group, nbmap, nbsizes, starts);
+
+          // gather
+          gather_cpu<scalar_t>(rows, c_in, in_feat.data_ptr<scalar_t>(),
+                               in_buffer.data_ptr<scalar_t>(),
+                               group_map.data(), transpose);
+
+          // matmul, one batched GEMM over the offsets of the group
+          auto out_buffer_activated =
+              out_buffer.narrow(0, 0, rows).view({n_offsets, group.pad, c_out});
+          grouped_bmm_out(
+              out_buffer_activated,
+              in_buffer.narrow(0, 0, rows).view({n_offsets, group.pad, c_in}),
+              kernel.narrow(0, group.begin, n_offsets), groups);
+
+          // scatter
+          scatter_cpu<scalar_t>(rows, out_nrows, c_out,
+                                out_buffer.data_ptr<scalar_t>(),
+                                out_feat.data_ptr<scalar_t>(),
+                                group_map.data(), transpose);
+        }
+      }));
 }
 
-void conv_backward_gather_scatter_cpu(at::Tensor in_feat, at::Tensor grad_in_feat,
-                              at::Tensor grad_out_feat, at::Tensor kernel,
-                              at::Tensor grad_kernel, at::Tensor neighbor_map,
-                              at::Tensor neighbor_offset,
-                              const bool transpose) {
+void conv_backward_gather_scatter_cpu(at::Tensor in_feat,
+                                      at::Tensor grad_in_feat,
+                                      at::Tensor grad_out_feat,
+                                      at::Tensor kernel,
+                                      at::Tensor grad_kernel,
+                                      at::Tensor neighbor_map,
+                                      at::Tensor neighbor_offset,
+                                      const bool transpose, const int groups,
+                                      const bool submanifold) {
+  in_feat = in_feat.contiguous();
+  grad_out_feat = grad_out_feat.contiguous();
+  kernel = kernel.contiguous();
+  neighbor_map = neighbor_map.contiguous();
+
   grad_in_feat.resize_as_(in_feat);
-  grad_in_feat.zero_();
   grad_kernel.resize_as_(kernel);
   grad_kernel.zero_();
 
-  int kernel_volume = kernel.size(0);
-  bool flag = false;
-  int in_buffer_size;
-  in_buffer_size =
-      *std::max_element(neighbor_offset.data_ptr<int>(),
-                        neighbor_offset.data_ptr<int>() + kernel_volume);
-
-  auto options =
-      torch::TensorOptions().dtype(in_feat.dtype()).device(in_feat.device());
-  auto in_buffer = torch::zeros({in_buffer_size, in_feat.size(1)}, options);
-  auto in_grad_buffer =
-      torch::zeros({in_buffer_size, in_feat.size(1)}, options);
-  auto out_grad_buffer =
-      torch::zeros({in_buffer_size, kernel.size(2)}, options);
-
-  int cur_offset = 0;
-  for (int i = 0; i < kernel_volume; i++) {
-    auto kernel_grad_buffer = grad_kernel[i];
-    if (flag && (i == kernel_volume / 2)) {
-      cur_offset += 2 * neighbor_offset.data_ptr<int>()[i];
-      continue;
-    }
+  const int kernel_volume = kernel.size(0);
+  const int c_in = in_feat.size(1);
+  const int c_out = kernel.size(2);
 
-    if (neighbor_offset.data_ptr<int>()[i] == 0) {
-      continue;
-    }
+  // dgrad: a forward pass with the roles of the two map columns swapped and
+  // the kernel of every channel group transposed, i.e.
+  // (K, c_in / g, g, c_out / g) -> (K, c_out / g, g, c_in / g)
+  auto kernel_t = kernel.view({kernel_volume, c_in / groups, groups,
+                               c_out / groups})
+                      .permute({0, 3, 2, 1})
+                      .reshape({kernel_volume, c_out / groups, c_in})
+                      .contiguous();
+  conv_forward_gather_scatter_cpu(grad_out_feat, grad_in_feat, kernel_t,
+                                  neighbor_map, neighbor_offset, !transpose,
+                                  groups, submanifold);
+
+  // wgrad
+  const int *nbsizes = neighbor_offset.data_ptr<int>();
+  const int *nbmap = neighbor_map.data_ptr<int>();
 
-    auto out_grad_buffer_activated = torch::from_blob(
-        out_grad_buffer.data_ptr<float>(),
-        {neighbor_offset.data_ptr<int>()[i], kernel.size(2)}, options);
-    auto in_grad_buffer_activated = torch::from_blob(
-        in_grad_buffer.data_ptr<float>(),
-        {neighbor_offset.data_ptr<int>()[i], in_feat.size(1)}, options);
-    auto in_buffer_activated = torch::from_blob(
-        in_buffer.data_ptr<float>(),
-        {neighbor_offset.data_ptr<int>()[i], in_feat.size(1)}, options);
-
-    // gather
-    gather_cpu(out_grad_buffer_activated.size(0), grad_out_feat.size(0),
-               kernel.size(2), grad_out_feat.data_ptr<float>(),
-               out_grad_buffer_activated.data_ptr<float>(),
-               neighbor_map.data_ptr<int>() + cur_offset, !transpose);
-
-    gather_cpu(in_buffer_activated.size(0), in_feat.size(0), kernel.size(1),
-               in_feat.data_ptr<float>(), in_buffer_activated.data_ptr<float>(),
-               neighbor_map.data_ptr<int>() + cur_offset, transpose);
-
-    // matmul
-    torch::mm_out(in_grad_buffer_activated, out_grad_buffer_activated,
-                  torch::transpose(kernel[i], 0, 1));
-    torch::mm_out(kernel_grad_buffer,
-                  torch::transpose(in_buffer_activated, 0, 1),
-                  out_grad_buffer_activated);
-
-    // scatter
-    scatter_cpu(neighbor_offset.data_ptr<int>()[i], in_feat.size(0),
-                kernel.size(1), in_grad_buffer_activated.data_ptr<float>(),
-                grad_in_feat.data_ptr<float>(),
-                neighbor_map.data_ptr<int>() + cur_offset, !transpose);
-
-    cur_offset += 2 * neighbor_offset.data_ptr<int>()[i];
+  const bool skip_center = submanifold && kernel_volume % 2;
+  if (skip_center) {
+    auto grad_kernel_center = grad_kernel.narrow(0, kernel_volume / 2, 1);
+    grouped_wgrad_bmm_out(grad_kernel_center, in_feat.unsqueeze(0),
+                          grad_out_feat.unsqueeze(0), groups);
   }
+
+  std::vector<int64_t> starts(kernel_volume + 1, 0);
+  for (int k = 0; k < kernel_volume; k++) starts[k + 1] = starts[k] + nbsizes[k];
+
+  const int64_t max_rows =
+      std::min(get_group_rows(nbsizes, kernel_volume, c_in + c_out),
+               std::max<int64_t>(starts[kernel_volume], 1));
+  auto offset_groups =
+      get_offset_groups(nbsizes, kernel_volume, skip_center, max_rows);
+  if (offset_groups.empty()) return;
+
+  auto in_buffer = torch::empty({max_rows, c_in}, in_feat.options());
+  auto out_grad_buffer = torch::empty({max_rows, c_out}, in_feat.options());
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, in_feat.scalar_type(),
+      "conv_backward_gather_scatter_cpu", ([&] {
+        for (auto &group : offset_groups) {
+          const int n_offsets = group.end - group.begin;
+          const int rows = n_offsets * group.pad;
+          auto group_map = get_group_map(group, nbmap, nbsizes, starts);
+
+          // gather; padding rows are zeros and add nothing to the gradient
+          gather_cpu<scalar_t>(rows, c_out, grad_out_feat.data_ptr<scalar_t>(),
+                               out_grad_buffer.data_ptr<scalar_t>(),
+                               group_map.data(), !transpose);
+          gather_cpu<scalar_t>(rows, c_in, in_feat.data_ptr<scalar_t>(),
+                               in_buffer.data_ptr<scalar_t>(),
+                               group_map.data(), transpose);
+
+          // matmul, one batched GEMM over the offsets of the group
+          auto kernel_grad_buffer = grad_kernel.narrow(0, group.begin, n_offsets);
+          grouped_wgrad_bmm_out(
+              kernel_grad_buffer,
+              in_buffer.narrow(0, 0, rows).view({n_offsets, group.pad, c_in}),
+              out_grad_buffer.narrow(0, 0, rows)
+                  .view({n_offsets, group.pad, c_out}),
+              groups);
+        }
+      }));
 }
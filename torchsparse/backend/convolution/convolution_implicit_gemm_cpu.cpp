@@ -0,0 +1,371 @@
+#include "convolution_implicit_gemm_cpu.h"
+
+#include <torch/extension.h>
+
+#include <algorithm>
+#include <map>
+#include <utility>
+#include <vector>
+
+#include "../utils/compact_map_cpu.h"
+
+// Number of gathered elements (rows x offsets x channels) per tile.
+// Keeps the im2col buffer of one tile roughly cache sized.
+#define TILE_ELEMENTS (1 << 20)
+#define TILE_M_MIN 128
+
+static int get_tile_rows(const int n_rows, const int kernel_volume,
+                         const int c) {
+  int max_rows = TILE_ELEMENTS / std::max(kernel_volume * c, 1);
+  max_rows = std::max(max_rows / TILE_M_MIN * TILE_M_MIN, TILE_M_MIN);
+  if (n_rows <= max_rows) return std::max(n_rows, 1);
+  // tiles of (almost) equal size
+  int n_tiles = (n_rows + max_rows - 1) / max_rows;
+  int tile_rows = (n_rows + n_tiles - 1) / n_tiles;
+  return (tile_rows + TILE_M_MIN - 1) / TILE_M_MIN * TILE_M_MIN;
+}
+
+// Collect the kernel offsets that have at least one valid neighbor inside
+// rows [start, start + n_rows) of the map.
+template <typename map_t>
+static int get_active_offsets(const map_t &map, const int start,
+                              const int n_rows, const int kernel_volume,
+                              std::vector<int64_t> &active) {
+  std::vector<char> flags(kernel_volume, 0);
+  int n_found = 0;
+  for (int i = start; i < start + n_rows && n_found < kernel_volume; i++) {
+    for (int k = 0; k < kernel_volume; k++) {
+      if (!flags[k] && map.has(i, k)) {
+        flags[k] = 1;
+        n_found++;
+      }
+    }
+  }
+  active.clear();
+  for (int k = 0; k < kernel_volume; k++) {
+    if (flags[k]) active.push_back(k);
+  }
+  return active.size();
+}
+
+// buffer[i, a * c : (a + 1) * c] = in_feat[map[row_i, active[a]]] and zeros
+// for missing neighbors, where row_i is rows[start + i], or start + i
+// without rows.
+template <typename scalar_t, typename map_t>
+static void gather_tile_cpu(const int start, const int n_rows,
+                            const int kernel_volume, const int c,
+                            const scalar_t *in_feat, const map_t &map,
+                            const std::vector<int64_t> &active,
+                            scalar_t *buffer, const int64_t *rows = nullptr) {
+  const int n_active = active.size();
+#pragma omp parallel
+  {
+    std::vector<int> scratch(kernel_volume);
+#pragma omp for
+    for (int i = 0; i < n_rows; i++) {
+      const int64_t row = rows == nullptr ? start + i : rows[start + i];
+      const int *nbrs = map.row(row, scratch.data());
+      scalar_t *dst = buffer + (int64_t)i * n_active * c;
+      for (int a = 0; a < n_active; a++) {
+        int in_pos = nbrs[active[a]];
+        if (in_pos < 0) {
+          std::fill(dst + a * c, dst + (a + 1) * c, (scalar_t)0);
+        } else {
+          const scalar_t *src = in_feat + (int64_t)in_pos * c;
+          std::copy(src, src + c, dst + a * c);
+        }
+      }
+    }
+  }
+}
+
+// Whether active differs from the row of active_masks (n_tiles, K) of tile,
+// which is set to active.
+static bool update_active_mask(at::Tensor active_masks, const int64_t tile,
+                               const std::vector<int64_t> &active) {
+  const int kernel_volume = active_masks.size(1);
+  uint8_t *mask = active_masks.data_ptr<uint8_t>() + tile * kernel_volume;
+  std::vector<uint8_t> flags(kernel_volume, 0);
+  for (auto k : active) flags[k] = 1;
+  const bool changed = !std::equal(flags.begin(), flags.end(), mask);
+  std::copy(flags.begin(), flags.end(), mask);
+  return changed;
+}
+
+// Rows of out_feat[o] = sum_k in_feat[map[o, k]] @ kernel[k], computed as one
+// (tile_rows, n_active * c_in) x (n_active * c_in, c_out) GEMM per tile over
+// the offsets with a neighbor in the tile. The tiles only depend on the size
+// of out_feat, which must be zero-initialized.
+//
+// With rows (sorted), only those rows are recomputed, and the other rows are
+// left untouched: the rows of the tiles with the same number of rows and
+// active offsets are packed into GEMMs of that shape, zero-padded, which
+// compute every row as the GEMM of its whole tile does. active_masks
+// (n_tiles, kernel_volume) uint8 holds the active offsets of every tile, and
+// is filled if given without rows. A tile whose active offsets changed since
+// is recomputed whole, as its rows go through a GEMM of another shape.
+// Returns the recomputed rows (all rows without rows).
+template <typename map_t>
+static at::Tensor conv_forward_tiles_cpu(at::Tensor in_feat, at::Tensor out_feat,
+                                   at::Tensor kernel, const map_t &map,
+                                   c10::optional<at::Tensor> rows,
+                                   c10::optional<at::Tensor> active_masks) {
+  if (in_feat.size(1) != kernel.size(1)) {
+    throw std::invalid_argument("Input feature size and kernel size mismatch");
+  }
+  in_feat = in_feat.contiguous();
+  kernel = kernel.contiguous();
+
+  const int n_out = out_feat.size(0);
+  const int kernel_volume = kernel.size(0);
+  const int c_in = kernel.size(1);
+  const int c_out = kernel.size(2);
+  auto long_options = out_feat.options().dtype(torch::kLong);
+  if (n_out == 0) return torch::empty({0}, long_options);
+
+  const int tile_rows = get_tile_rows(n_out, kernel_volume, c_in);
+  const int n_tiles = (n_out + tile_rows - 1) / tile_rows;
+  TORCH_CHECK(!rows.has_value() || active_masks.has_value(),
+              "recomputing rows requires the active offsets of the tiles");
+  if (active_masks.has_value()) {
+    TORCH_CHECK(active_masks->scalar_type() == at::ScalarType::Byte &&
+                    active_masks->is_contiguous() &&
+                    active_masks->size(0) == n_tiles &&
+                    active_masks->size(1) == kernel_volume,
+                "active_masks must be a contiguous (n_tiles, kernel_volume) "
+                "uint8 tensor");
+  }
+  auto buffer = torch::empty({(int64_t)tile_rows * kernel_volume * c_in},
+                             in_feat.options());
+  auto kernel_flat = kernel.view({kernel_volume * c_in, c_out});
+  std::vector<int64_t> active;
+
+  // rows to recompute, grouped by the shape of the GEMM of their tile
+  std::map<std::pair<int, std::vector<int64_t>>, std::vector<int64_t>> groups;
+  std::vector<at::Tensor> recomputed;
+  if (rows.has_value()) {
+    auto rows_long = rows->to(torch::kLong).contiguous();
+    const int64_t *rows_ptr = rows_long.data_ptr<int64_t>();
+    const int64_t n_rows_total = rows_long.size(0);
+    for (int64_t i = 0; i < n_rows_total;) {
+      const int64_t tile = rows_ptr[i] / tile_rows;
+      TORCH_CHECK(rows_ptr[i] >= 0 && tile < n_tiles, "row out of range");
+      int64_t j = i;
+      while (j < n_rows_total && rows_ptr[j] / tile_rows == tile) j++;
+      const int start = tile * tile_rows;
+      const int n_rows = std::min(tile_rows, n_out - start);
+      get_active_offsets(map, start, n_rows, kernel_volume, active);
+      auto &group = groups[{n_rows, active}];
+      if (update_active_mask(*active_masks, tile, active)) {
+        for (int r = start; r < start + n_rows; r++) group.push_back(r);
+      } else {
+        group.insert(group.end(), rows_ptr + i, rows_ptr + j);
+      }
+      i = j;
+    }
+  }
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, in_feat.scalar_type(),
+      "conv_forward_implicit_gemm_cpu", ([&] {
+        if (!rows.has_value()) {
+          for (int start = 0; start < n_out; start += tile_rows) {
+            const int n_rows = std::min(tile_rows, n_out - start);
+            const int n_active = get_active_offsets(map, start, n_rows,
+                                                    kernel_volume, active);
+            if (active_masks.has_value()) {
+              update_active_mask(*active_masks, start / tile_rows, active);
+            }
+            if (n_active == 0) continue;
+            gather_tile_cpu<scalar_t>(start, n_rows, kernel_volume, c_in,
+                                      in_feat.data_ptr<scalar_t>(), map,
+                                      active, buffer.data_ptr<scalar_t>());
+            auto tile = buffer.narrow(0, 0, (int64_t)n_rows * n_active * c_in)
+                            .view({n_rows, n_active * c_in});
+            auto tile_kernel =
+                n_active == kernel_volume
+                    ? kernel_flat
+                    : kernel
+                          .index_select(0, torch::tensor(active, torch::kLong))
+                          .view({n_active * c_in, c_out});
+            auto out = out_feat.narrow(0, start, n_rows);
+            torch::mm_out(out, tile, tile_kernel);
+          }
+          return;
+        }
+
+        auto tile_out = torch::empty({tile_rows, c_out}, out_feat.options());
+        for (auto &item : groups) {
+          const int n_rows = item.first.first;
+          const std::vector<int64_t> &group_active = item.first.second;
+          const std::vector<int64_t> &group_rows = item.second;
+          const int n_active = group_active.size();
+          auto group_rows_t = torch::tensor(group_rows, torch::kLong);
+          recomputed.push_back(group_rows_t);
+          if (n_active == 0) {
+            out_feat.index_fill_(0, group_rows_t, 0);
+            continue;
+          }
+          auto tile = buffer.narrow(0, 0, (int64_t)n_rows * n_active * c_in)
+                          .view({n_rows, n_active * c_in});
+          auto tile_kernel =
+              n_active == kernel_volume
+                  ? kernel_flat
+                  : kernel
+                        .index_select(0,
+                                      torch::tensor(group_active, torch::kLong))
+                        .view({n_active * c_in, c_out});
+          auto out = tile_out.narrow(0, 0, n_rows);
+          const int n_group = group_rows.size();
+          for (int start = 0; start < n_group; start += n_rows) {
+            const int n_chunk = std::min(n_rows, n_group - start);
+            gather_tile_cpu<scalar_t>(start, n_chunk, kernel_volume, c_in,
+                                      in_feat.data_ptr<scalar_t>(), map,
+                                      group_active, buffer.data_ptr<scalar_t>(),
+                                      group_rows.data());
+            if (n_chunk < n_rows) {
+              tile.narrow(0, n_chunk, n_rows - n_chunk).zero_();
+            }
+            torch::mm_out(out, tile, tile_kernel);
+            out_feat.index_copy_(0, group_rows_t.narrow(0, start, n_chunk),
+                                 out.narrow(0, 0, n_chunk));
+          }
+        }
+      }));
+  if (!rows.has_value()) return torch::arange(n_out, long_options);
+  if (recomputed.empty()) return torch::empty({0}, long_options);
+  return torch::cat(recomputed);
+}
+
+// grad_kernel[k] = sum_o in_feat[map[o, k]]^T @ grad_out_feat[o],
+// accumulated tile by tile from the same gathered buffer as the forward pass.
+template <typename map_t>
+static void conv_backward_wgrad_tiles_cpu(at::Tensor in_feat,
+                                          at::Tensor grad_out_feat,
+                                          at::Tensor grad_kernel,
+                                          const map_t &map) {
+  in_feat = in_feat.contiguous();
+  grad_out_feat = grad_out_feat.contiguous();
+
+  const int n_out = grad_out_feat.size(0);
+  const int kernel_volume = grad_kernel.size(0);
+  const int c_in = grad_kernel.size(1);
+  const int c_out = grad_kernel.size(2);
+  grad_kernel.zero_();
+  if (n_out == 0) return;
+
+  const int tile_rows = get_tile_rows(n_out, kernel_volume, c_in);
+  auto buffer = torch::empty({(int64_t)tile_rows * kernel_volume * c_in},
+                             in_feat.options());
+  auto grad_kernel_flat = grad_kernel.view({kernel_volume * c_in, c_out});
+  std::vector<int64_t> active;
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, in_feat.scalar_type(),
+      "conv_backward_wgrad_implicit_gemm_cpu", ([&] {
+        for (int start = 0; start < n_out; start += tile_rows) {
+          const int n_rows = std::min(tile_rows, n_out - start);
+          const int n_active = get_active_offsets(map, start, n_rows,
+                                                  kernel_volume, active);
+          if (n_active == 0) continue;
+          gather_tile_cpu<scalar_t>(start, n_rows, kernel_volume, c_in,
+                                    in_feat.data_ptr<scalar_t>(), map,
+                                    active, buffer.data_ptr<scalar_t>());
+          auto tile = buffer.narrow(0, 0, (int64_t)n_rows * n_active * c_in)
+                          .view({n_rows, n_active * c_in});
+          auto tile_grad_out = grad_out_feat.narrow(0, start, n_rows);
+          if (n_active == kernel_volume) {
+            grad_kernel_flat.addmm_(tile.t(), tile_grad_out);
+          } else {
+            auto partial = torch::mm(tile.t(), tile_grad_out);
+            grad_kernel.view({kernel_volume, c_in * c_out})
+                .index_add_(0, torch::tensor(active, torch::kLong),
+                            partial.view({n_active, c_in * c_out}));
+          }
+        }
+      }));
+}
+
+// Calls fn with the map view of a compact out_in_map (see
+// compact_out_in_map), for int16 or int32 neighbor deltas.
+template <typename Fn>
+static void with_compact_map_cpu(at::Tensor masks, at::Tensor block_ptr,
+                                 at::Tensor ranks, at::Tensor nbrs,
+                                 at::Tensor bases, const int kernel_volume,
+                                 Fn fn) {
+  masks = masks.contiguous();
+  block_ptr = block_ptr.contiguous();
+  ranks = ranks.contiguous();
+  nbrs = nbrs.contiguous();
+  bases = bases.contiguous();
+  if (nbrs.scalar_type() == at::ScalarType::Short) {
+    fn(CompactMapCPU<int16_t>{masks.data_ptr<int>(), (int)masks.size(1),
+                              block_ptr.data_ptr<int64_t>(),
+                              ranks.data_ptr<int>(), nbrs.data_ptr<int16_t>(),
+                              bases.data_ptr<int>(), kernel_volume});
+  } else {
+    fn(CompactMapCPU<int>{masks.data_ptr<int>(), (int)masks.size(1),
+                          block_ptr.data_ptr<int64_t>(), ranks.data_ptr<int>(),
+                          nbrs.data_ptr<int>(), bases.data_ptr<int>(),
+                          kernel_volume});
+  }
+}
+
+void conv_forward_implicit_gemm_cpu(at::Tensor in_feat, at::Tensor out_feat,
+                                    at::Tensor kernel, at::Tensor out_in_map) {
+  out_in_map = out_in_map.contiguous();
+  DenseMapCPU map{out_in_map.data_ptr<int>(), (int)kernel.size(0)};
+  conv_forward_tiles_cpu(in_feat, out_feat, kernel, map, c10::nullopt,
+                         c10::nullopt);
+}
+
+// Recomputes the given rows of out_feat (all of them without rows) the way
+// conv_forward_implicit_gemm_cpu computes them, and returns the recomputed
+// rows, see conv_forward_tiles_cpu.
+at::Tensor conv_forward_implicit_gemm_rows_cpu(
+    at::Tensor in_feat, at::Tensor out_feat, at::Tensor kernel,
+    at::Tensor out_in_map, c10::optional<at::Tensor> rows,
+    c10::optional<at::Tensor> active_masks) {
+  out_in_map = out_in_map.contiguous();
+  DenseMapCPU map{out_in_map.data_ptr<int>(), (int)kernel.size(0)};
+  return conv_forward_tiles_cpu(in_feat, out_feat, kernel, map, rows,
+                                active_masks);
+}
+
+// conv_forward_implicit_gemm(_rows)_cpu on a compact out_in_map, decoded
+// row by row while gathering.
+at::Tensor conv_forward_implicit_gemm_compact_cpu(
+    at::Tensor in_feat, at::Tensor out_feat, at::Tensor kernel,
+    at::Tensor masks, at::Tensor block_ptr, at::Tensor ranks, at::Tensor nbrs,
+    at::Tensor bases, c10::optional<at::Tensor> rows,
+    c10::optional<at::Tensor> active_masks) {
+  at::Tensor recomputed;
+  with_compact_map_cpu(masks, block_ptr, ranks, nbrs, bases, kernel.size(0),
+                       [&](const auto &map) {
+                         recomputed = conv_forward_tiles_cpu(
+                             in_feat, out_feat, kernel, map, rows,
+                             active_masks);
+                       });
+  return recomputed;
+}
+
+void conv_backward_wgrad_implicit_gemm_cpu(at::Tensor in_feat,
+                                           at::Tensor grad_out_feat,
+                                           at::Tensor grad_kernel,
+                                           at::Tensor out_in_map) {
+  out_in_map = out_in_map.contiguous();
+  DenseMapCPU map{out_in_map.data_ptr<int>(), (int)grad_kernel.size(0)};
+  conv_backward_wgrad_tiles_cpu(in_feat, grad_out_feat, grad_kernel, map);
+}
+
+void conv_backward_wgrad_implicit_gemm_compact_cpu(
+    at::Tensor in_feat, at::Tensor grad_out_feat, at::Tensor grad_kernel,
+    at::Tensor masks, at::Tensor block_ptr, at::Tensor ranks, at::Tensor nbrs,
+    at::Tensor bases) {
+  with_compact_map_cpu(masks, block_ptr, ranks, nbrs, bases,
+                       grad_kernel.size(0),
+                       [&](const auto &map) {
+                         conv_backward_wgrad_tiles_cpu(in_feat, grad_out_feat,
+                                                       grad_kernel, map);
+                       });
+}
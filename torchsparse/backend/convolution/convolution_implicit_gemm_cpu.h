@@ -0,0 +1,27 @@
+#pragma once
+
+#include <torch/torch.h>
+
+void conv_forward_implicit_gemm_cpu(at::Tensor in_feat, at::Tensor out_feat,
+                                    at::Tensor kernel, at::Tensor out_in_map);
+
+at::Tensor conv_forward_implicit_gemm_rows_cpu(
+    at::Tensor in_feat, at::Tensor out_feat, at::Tensor kernel,
+    at::Tensor out_in_map, c10::optional<at::Tensor> rows,
+    c10::optional<at::Tensor> active_masks);
+
+void conv_backward_wgrad_implicit_gemm_cpu(at::Tensor in_feat,
+                                           at::Tensor grad_out_feat,
+                                           at::Tensor grad_kernel,
+                                           at::Tensor out_in_map);
+
+at::Tensor conv_forward_implicit_gemm_compact_cpu(
+    at::Tensor in_feat, at::Tensor out_feat, at::Tensor kernel,
+    at::Tensor masks, at::Tensor block_ptr, at::Tensor ranks, at::Tensor nbrs,
+    at::Tensor bases, c10::optional<at::Tensor> rows,
+    c10::optional<at::Tensor> active_masks);
+
+void conv_backward_wgrad_implicit_gemm_compact_cpu(
+    at::Tensor in_feat, at::Tensor grad_out_feat, at::Tensor grad_kernel,
+    at::Tensor masks, at::Tensor block_ptr, at::Tensor ranks, at::Tensor nbrs,
+    at::Tensor bases);
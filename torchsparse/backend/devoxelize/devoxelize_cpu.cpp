@@ -1,59 +1,98 @@
 #include "devoxelize_cpu.h"
 
-#include <torch/torch.h>
+#include <ATen/OpMathType.h>
+#include <torch/extension.h>
 
 #include <vector>
 
+#include "../utils/segment_cpu.h"
+
 // make sure indices is int type
-// feat: (b,c,s) indices: (N, 3) batch_index: (N, ) -> out: (N, c)
+// feat: (n, c) indices: (N, 8) weight: (N, 8) -> out: (N, c)
 at::Tensor devoxelize_forward_cpu(const at::Tensor feat,
                                   const at::Tensor indices,
                                   const at::Tensor weight) {
   int c = feat.size(1);
   int N = indices.size(0);
+  at::Tensor _feat = feat.contiguous();
+  at::Tensor _indices = indices.contiguous();
+  at::Tensor _weight = weight.to(feat.scalar_type()).contiguous();
+
+  at::Tensor out = torch::zeros({N, c}, _feat.options());
+  const int *indices_ = _indices.data_ptr<int>();
 
-  at::Tensor out = torch::zeros(
-      {N, c}, at::device(feat.device()).dtype(at::ScalarType::Float));
-#pragma omp parallel for
-  for (int i = 0; i < N; i++) {
-    int *indices_ = indices.data_ptr<int>() + i * 8;
-    float *weight_ = weight.data_ptr<float>() + i * 8;
-    for (int j = 0; j < c; j++) {
-      float *feat_ = feat.data_ptr<float>() + j;
-      float cur_feat;
-      for (int k = 0; k < 8; k++) {
-        cur_feat = (indices_[k] >= 0) ? feat_[indices_[k] * c] : 0;
-        *(out.data_ptr<float>() + i * c + j) += weight_[k] * cur_feat;
-      }
-    }
-  }
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _feat.scalar_type(),
+      "devoxelize_forward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *feat_ = _feat.data_ptr<scalar_t>();
+        const scalar_t *weight_ = _weight.data_ptr<scalar_t>();
+        scalar_t *out_ = out.data_ptr<scalar_t>();
+        _Pragma("omp parallel")
+        {
+          std::vector<acc_t> acc(c);
+          _Pragma("omp for schedule(static)")
+          for (int i = 0; i < N; i++) {
+            std::fill(acc.begin(), acc.end(), (acc_t)0);
+            for (int k = 0; k < 8; k++) {
+              int pos = indices_[i * 8 + k];
+              if (pos < 0) continue;
+              acc_t w = weight_[i * 8 + k];
+              const scalar_t *src = feat_ + (int64_t)pos * c;
+              for (int j = 0; j < c; j++) acc[j] += w * (acc_t)src[j];
+            }
+            scalar_t *dst = out_ + (int64_t)i * c;
+            for (int j = 0; j < c; j++) dst[j] = acc[j];
+          }
+        }
+      }));
   return out;
 }
 
-// top_grad: (N, c), indices: (N, 3), batch_index: (N, ) -> bottom_grad:
-// (b,c,s), s=r^3
+// top_grad: (N, c), indices: (N, 8), weight: (N, 8) -> bottom_grad: (n, c)
+// The N x 8 (point, corner) pairs are bucketed by target voxel, so each voxel
+// accumulates its own gradient row without atomics.
 at::Tensor devoxelize_backward_cpu(const at::Tensor top_grad,
                                    const at::Tensor indices,
                                    const at::Tensor weight, int n) {
   int c = top_grad.size(1);
   int N = top_grad.size(0);
-  at::Tensor bottom_grad = torch::zeros(
-      {n, c}, at::device(top_grad.device()).dtype(at::ScalarType::Float));
-
-  for (int i = 0; i < N; i++) {
-    int *indices_ = indices.data_ptr<int>() + i * 8;
-    float *weight_ = weight.data_ptr<float>() + i * 8;
-#pragma omp parallel for
-    for (int j = 0; j < c; j++) {
-      float *top_grad_ = top_grad.data_ptr<float>() + j;
-      float cur_top_grad;
-      for (int k = 0; k < 8; k++) {
-        cur_top_grad = (indices_[k] >= 0) ? top_grad_[indices_[k] * c] : 0;
-        *(bottom_grad.data_ptr<float>() + indices_[k] * c + j) +=
-            weight_[k] * cur_top_grad;
-      }
-    }
-  }
+  at::Tensor _top_grad = top_grad.contiguous();
+  at::Tensor _indices = indices.contiguous();
+  at::Tensor _weight = weight.to(top_grad.scalar_type()).contiguous();
+  at::Tensor bottom_grad = torch::zeros({n, c}, _top_grad.options());
+  const int *indices_ = _indices.data_ptr<int>();
+
+  std::vector<int> seg_ptr, seg_rows;
+  build_segments_cpu(
+      N * 8, n, [&](int i) { return indices_[i] < n ? indices_[i] : -1; },
+      seg_ptr, seg_rows);
 
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _top_grad.scalar_type(),
+      "devoxelize_backward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *top_grad_ = _top_grad.data_ptr<scalar_t>();
+        const scalar_t *weight_ = _weight.data_ptr<scalar_t>();
+        scalar_t *bottom_grad_ = bottom_grad.data_ptr<scalar_t>();
+        _Pragma("omp parallel")
+        {
+          std::vector<acc_t> acc(c);
+          _Pragma("omp for schedule(static)")
+          for (int v = 0; v < n; v++) {
+            if (seg_ptr[v] == seg_ptr[v + 1]) continue;
+            std::fill(acc.begin(), acc.end(), (acc_t)0);
+            for (int s = seg_ptr[v]; s < seg_ptr[v + 1]; s++) {
+              // seg_rows holds flattened (point, corner) positions
+              int pair = seg_rows[s];
+              acc_t w = weight_[pair];
+              const scalar_t *src = top_grad_ + (int64_t)(pair / 8) * c;
+              for (int j = 0; j < c; j++) acc[j] += w * (acc_t)src[j];
+            }
+            scalar_t *dst = bottom_grad_ + (int64_t)v * c;
+            for (int j = 0; j < c; j++) dst[j] = acc[j];
+          }
+        }
+      }));
   return bottom_grad;
 }
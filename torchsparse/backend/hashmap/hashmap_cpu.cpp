@@ -7,6 +7,8 @@
 // Fix 1: Use std::unordered_map instead of dense_hash_map for Windows compatibility
 #include <unordered_map>
 
+#include "../utils/atomic_cpu.h"
+
 void HashTableCPU::lookup_vals(const int64_t* const keys,
                                int64_t* const results, const int n) {
 #pragma omp parallel for
@@ -35,3 +37,156 @@ void HashTableCPU::insert_vals(const int64_t* const keys,
     hashmap[keys[i]] = vals[i];
   }
 }
+
+// Same FNV-1a coordinate hash as hash_func_64b in hashmap_cuda.cuh, so that
+// CPU and GPU tables agree on keys.
+static inline int64_t hash_coords_64b(const int* data) {
+  uint64_t hash = 14695981039346656037UL;
+  for (int j = 0; j < 4; j++) {
+    hash ^= (unsigned int)data[j];
+    hash *= 1099511628211UL;
+  }
+  return (int64_t)hash;
+}
+
+// Value stored for the coordinate (x, y, z, batch), or 0 if it is missing.
+int CPUHashTable::probe(const int* coords) const {
+  const int64_t key = hash_coords_64b(coords);
+  int slot = (uint64_t)key % _capacity;
+  while (true) {
+    const int64_t cur_key = table_keys[slot];
+    if (cur_key == key) return table_vals[slot];
+    if (cur_key == CPU_EMPTY_CELL) return 0;
+    slot = (slot + 1) % _capacity;
+  }
+}
+
+void CPUHashTable::insert_coords(torch::Tensor coords) {
+  coords = coords.contiguous();
+  const int n = coords.size(0);
+  const int* coords_ptr = coords.data_ptr<int>();
+#pragma omp parallel for
+  for (int idx = 0; idx < n; idx++) {
+    int64_t key = hash_coords_64b(coords_ptr + idx * 4);
+    int slot = (uint64_t)key % _capacity;
+    while (true) {
+      int64_t prev =
+          atomic_cas_int64_cpu(&table_keys[slot], CPU_EMPTY_CELL, key);
+      if (prev == CPU_EMPTY_CELL || prev == key) {
+        table_vals[slot] = idx + 1;
+        break;
+      }
+      slot = (slot + 1) % _capacity;
+    }
+  }
+}
+
+// Points every coordinate at the given row (inserting missing keys), or
+// removes it for negative rows. Removed keys stay in the table with an empty
+// value, so probe sequences through them are not cut short.
+void CPUHashTable::update_coords(torch::Tensor coords, torch::Tensor rows) {
+  coords = coords.contiguous();
+  rows = rows.contiguous();
+  const int n = coords.size(0);
+  const int* coords_ptr = coords.data_ptr<int>();
+  const int64_t* rows_ptr = rows.data_ptr<int64_t>();
+#pragma omp parallel for
+  for (int idx = 0; idx < n; idx++) {
+    int64_t key = hash_coords_64b(coords_ptr + idx * 4);
+    int slot = (uint64_t)key % _capacity;
+    while (true) {
+      int64_t prev =
+          atomic_cas_int64_cpu(&table_keys[slot], CPU_EMPTY_CELL, key);
+      if (prev == CPU_EMPTY_CELL || prev == key) {
+        table_vals[slot] = rows_ptr[idx] < 0 ? 0 : (int)rows_ptr[idx] + 1;
+        break;
+      }
+      slot = (slot + 1) % _capacity;
+    }
+  }
+}
+
+torch::Tensor CPUHashTable::lookup_coords(torch::Tensor coords,
+                                          torch::Tensor kernel_sizes,
+                                          torch::Tensor strides,
+                                          int kernel_volume) {
+  coords = coords.contiguous();
+  const int n = coords.size(0);
+  auto options =
+      torch::TensorOptions().dtype(at::ScalarType::Int).device(coords.device());
+  torch::Tensor results = torch::zeros(
+      {(n + _divisor - 1) / _divisor * _divisor, kernel_volume}, options);
+  const int* coords_ptr = coords.data_ptr<int>();
+  const int* kernel_sizes_ptr = kernel_sizes.data_ptr<int>();
+  const int* strides_ptr = strides.data_ptr<int>();
+  int* results_ptr = results.data_ptr<int>();
+  // Offset enumeration matches lookup_coords_kernel: x varies fastest for odd
+  // kernel volumes and z varies fastest for even ones.
+  const bool odd = kernel_volume % 2;
+
+#pragma omp parallel for
+  for (int idx = 0; idx < n; idx++) {
+    const int* in_coords = coords_ptr + 4 * idx;
+    int coords_out[4];
+    coords_out[3] = in_coords[3];
+    for (int kernel_idx = 0; kernel_idx < kernel_volume; kernel_idx++) {
+      int _kernel_idx = kernel_idx;
+      for (int d = 0; d < 3; d++) {
+        int i = odd ? d : 2 - d;
+        int cur_offset = _kernel_idx % kernel_sizes_ptr[i];
+        cur_offset -= (kernel_sizes_ptr[i] - 1) / 2;
+        coords_out[i] = in_coords[i] * strides_ptr[i] + cur_offset;
+        _kernel_idx /= kernel_sizes_ptr[i];
+      }
+      results_ptr[idx * kernel_volume + kernel_idx] = probe(coords_out);
+    }
+  }
+  return results;
+}
+
+// lookup_coords of a submanifold convolution (unit strides, coords are the
+// inserted coordinates) with an odd kernel. Offset kernel_volume - 1 - k is
+// the negation of offset k, so if coords[j] = coords[i] + offset k, then
+// coords[i] = coords[j] + offset (kernel_volume - 1 - k). Only the offsets up
+// to the center are probed; the other half is filled in by transposition.
+// Every mirrored entry has exactly one writer.
+torch::Tensor CPUHashTable::lookup_coords_symmetric(torch::Tensor coords,
+                                                    torch::Tensor kernel_sizes,
+                                                    int kernel_volume) {
+  if (kernel_volume % 2 == 0) {
+    throw std::invalid_argument("Symmetric lookup needs an odd kernel size");
+  }
+  coords = coords.contiguous();
+  const int n = coords.size(0);
+  auto options =
+      torch::TensorOptions().dtype(at::ScalarType::Int).device(coords.device());
+  torch::Tensor results = torch::zeros(
+      {(n + _divisor - 1) / _divisor * _divisor, kernel_volume}, options);
+  const int* coords_ptr = coords.data_ptr<int>();
+  const int* kernel_sizes_ptr = kernel_sizes.data_ptr<int>();
+  int* results_ptr = results.data_ptr<int>();
+  const int center = kernel_volume / 2;
+
+#pragma omp parallel for
+  for (int idx = 0; idx < n; idx++) {
+    const int* in_coords = coords_ptr + 4 * idx;
+    int coords_out[4];
+    coords_out[3] = in_coords[3];
+    for (int kernel_idx = 0; kernel_idx <= center; kernel_idx++) {
+      int _kernel_idx = kernel_idx;
+      for (int i = 0; i < 3; i++) {
+        int cur_offset = _kernel_idx % kernel_sizes_ptr[i];
+        cur_offset -= (kernel_sizes_ptr[i] - 1) / 2;
+        coords_out[i] = in_coords[i] + cur_offset;
+        _kernel_idx /= kernel_sizes_ptr[i];
+      }
+      const int val = probe(coords_out);
+      results_ptr[(int64_t)idx * kernel_volume + kernel_idx] = val;
+      if (val > 0 && kernel_idx < center) {
+        results_ptr[(int64_t)(val - 1) * kernel_volume + kernel_volume - 1 -
+                    kernel_idx] = idx + 1;
+      }
+    }
+  }
+  return results;
+}
@@ -5,6 +5,8 @@
 #include <cstdlib>
 #include <vector>
 
+#include <torch/torch.h>
+
 // Use std::unordered_map instead of dense_hash_map for Windows compatibility
 #ifdef _WIN32
     #include <unordered_map>
@@ -35,3 +37,42 @@ class HashTableCPU {
   void lookup_vals(const int64_t* const keys, int64_t* const results,
                    const int n);
 };
+
+/** Reserved value for indicating "empty". */
+#define CPU_EMPTY_CELL (0)
+
+// Open-addressing coordinate hash table that mirrors GPUHashTable: keys and
+// values live in the (CPU) tensors passed to the constructor, so a table can be
+// cached in TensorCache.hashmaps and rebuilt from them later.
+class CPUHashTable {
+ private:
+  const int _capacity;
+  const int _divisor;
+  torch::Tensor _keys;
+  torch::Tensor _vals;
+  int64_t* table_keys;
+  int* table_vals;
+
+  int probe(const int* coords) const;
+
+ public:
+  CPUHashTable(torch::Tensor table_keys, torch::Tensor table_vals)
+      : _capacity(table_keys.size(0)),
+        _divisor(128),
+        _keys(table_keys),
+        _vals(table_vals),
+        table_keys(table_keys.data_ptr<int64_t>()),
+        table_vals(table_vals.data_ptr<int>()){};
+  ~CPUHashTable() {}
+
+  void insert_coords(torch::Tensor coords);
+  void update_coords(torch::Tensor coords, torch::Tensor rows);
+  torch::Tensor lookup_coords(torch::Tensor coords, torch::Tensor kernel_sizes,
+                              torch::Tensor tensor_strides,
+                              int kernel_volume);
+  torch::Tensor lookup_coords_symmetric(torch::Tensor coords,
+                                        torch::Tensor kernel_sizes,
+                                        int kernel_volume);
+  int get_divisor() { return _divisor; }
+  int get_capacity() { return _capacity; }
+};
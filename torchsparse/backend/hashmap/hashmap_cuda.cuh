@@ -97,6 +97,7 @@ class GPUHashTable {
   void insert_vals(torch::Tensor keys);
   torch::Tensor lookup_vals(torch::Tensor keys);
   void insert_coords(torch::Tensor coords);
+  void update_coords(torch::Tensor coords, torch::Tensor rows);
   torch::Tensor lookup_coords(at::Tensor coords, at::Tensor kernel_sizes, at::Tensor tensor_strides, int kernel_volume);
   int get_divisor(){return _divisor;}
   int get_capacity(){return _capacity;}
@@ -169,6 +170,32 @@ __global__ void insert_coords_kernel(key_type* table_keys, val_type* table_vals,
 }
 
 
+// Points every coordinate at the given row (inserting missing keys), or
+// removes it for negative rows. Removed keys stay in the table with an empty
+// value, so probe sequences through them are not cut short.
+template <typename key_type=int64_t, typename val_type=int>
+__global__ void update_coords_kernel(key_type* table_keys, val_type* table_vals, int* coords, const int64_t* rows, int n, int _capacity)
+{
+    int idx = blockIdx.x * blockDim.x + threadIdx.x;
+    if (idx < n)
+    {
+        key_type key = (key_type)(hash_func_64b(coords + idx * 4));
+        int value = rows[idx] < 0 ? EMPTY_CELL : (int)rows[idx] + 1;
+        int slot = hash(key, _capacity);
+        while (true)
+        {
+            key_type prev = atomicCAS(&table_keys[slot], EMPTY_CELL, key);
+            if (prev == EMPTY_CELL || prev == key)
+            {
+                table_vals[slot] = value;
+                return;
+            }
+            slot = (slot + 1) % _capacity;
+        }
+    }
+}
+
+
 // lookup from hashmap
 template <typename key_type=int64_t, typename val_type=int>
 __global__ void lookup_kernel(key_type* table_keys, val_type* table_vals, const key_type* keys, val_type* vals, int n, int _capacity)
@@ -274,6 +301,13 @@ void GPUHashTable<key_type, val_type>::insert_coords(at::Tensor coords){
   insert_many_coords(coords.data_ptr<int>(), coords.size(0));
 }
 
+template <typename key_type, typename val_type>
+void GPUHashTable<key_type, val_type>::update_coords(at::Tensor coords, at::Tensor rows){
+  const int n = coords.size(0);
+  update_coords_kernel<key_type, val_type><<<(n + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(
+    table_keys, table_vals, coords.data_ptr<int>(), rows.data_ptr<int64_t>(), n, _capacity);
+}
+
 template <typename key_type, typename val_type>
 void GPUHashTable<key_type, val_type>::lookup_many(const key_type *keys, val_type *results, const int n){
   lookup_kernel<key_type, val_type><<<(n + BLOCK_SIZE - 1) / BLOCK_SIZE, BLOCK_SIZE>>>(table_keys, table_vals, keys, results, n, _capacity);
@@ -0,0 +1,247 @@
+#include "group_norm_cpu.h"
+
+#include <ATen/OpMathType.h>
+#include <torch/torch.h>
+
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+inline int group_norm_num_threads() {
+#ifdef _OPENMP
+  return omp_get_max_threads();
+#else
+  return 1;
+#endif
+}
+
+inline int group_norm_thread_id() {
+#ifdef _OPENMP
+  return omp_get_thread_num();
+#else
+  return 0;
+#endif
+}
+
+// feats (N, C), batch (N,) int64, weight / bias (C,) or empty.
+// Returns {output (N, C), mean (B, G), rstd (B, G)}. Every (sample, group)
+// pair is normalized over the rows of its sample and the channels of its
+// group. The statistics are gathered in a single pass over feats, with
+// per-thread partial sums in double precision.
+std::vector<at::Tensor> group_norm_forward_cpu(
+    const at::Tensor feats, const at::Tensor batch, const at::Tensor weight,
+    const at::Tensor bias, const int batch_size, const int num_groups,
+    const double eps) {
+  const int N = feats.size(0);
+  const int C = feats.size(1);
+  const int group_size = C / num_groups;
+  const int BG = batch_size * num_groups;
+  at::Tensor _feats = feats.contiguous();
+  at::Tensor _batch = batch.contiguous();
+  const int64_t *batch_ = _batch.data_ptr<int64_t>();
+  const bool affine = weight.numel() > 0;
+
+  at::Tensor output = torch::empty_like(_feats);
+  auto stat_options = _feats.options().dtype(at::ScalarType::Double);
+  at::Tensor mean = torch::zeros({batch_size, num_groups}, stat_options);
+  at::Tensor rstd = torch::zeros({batch_size, num_groups}, stat_options);
+  double *mean_ = mean.data_ptr<double>();
+  double *rstd_ = rstd.data_ptr<double>();
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _feats.scalar_type(),
+      "group_norm_forward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *feats_ = _feats.data_ptr<scalar_t>();
+        scalar_t *output_ = output.data_ptr<scalar_t>();
+
+        const int num_threads = group_norm_num_threads();
+        // per thread: sum and sum of squares of every (sample, group)
+        std::vector<double> partial((size_t)num_threads * BG * 2, 0);
+        std::vector<int64_t> counts(batch_size, 0);
+        _Pragma("omp parallel")
+        {
+          double *local =
+              partial.data() + (size_t)group_norm_thread_id() * BG * 2;
+          _Pragma("omp for schedule(static)")
+          for (int i = 0; i < N; i++) {
+            int64_t b = batch_[i];
+            const scalar_t *src = feats_ + (int64_t)i * C;
+            for (int g = 0; g < num_groups; g++) {
+              double sum = 0, sum_sq = 0;
+              for (int j = g * group_size; j < (g + 1) * group_size; j++) {
+                double x = (acc_t)src[j];
+                sum += x;
+                sum_sq += x * x;
+              }
+              local[(b * num_groups + g) * 2] += sum;
+              local[(b * num_groups + g) * 2 + 1] += sum_sq;
+            }
+          }
+        }
+        for (int i = 0; i < N; i++) counts[batch_[i]]++;
+
+        for (int bg = 0; bg < BG; bg++) {
+          double sum = 0, sum_sq = 0;
+          for (int t = 0; t < num_threads; t++) {
+            sum += partial[((size_t)t * BG + bg) * 2];
+            sum_sq += partial[((size_t)t * BG + bg) * 2 + 1];
+          }
+          double count = (double)counts[bg / num_groups] * group_size;
+          if (count == 0) continue;
+          double m = sum / count;
+          double var = std::max(sum_sq / count - m * m, 0.0);
+          mean_[bg] = m;
+          rstd_[bg] = 1.0 / std::sqrt(var + eps);
+        }
+
+        std::vector<acc_t> scale(C, 1), shift(C, 0);
+        if (affine) {
+          at::Tensor _weight = weight.contiguous().to(at::kDouble);
+          at::Tensor _bias = bias.contiguous().to(at::kDouble);
+          for (int j = 0; j < C; j++) {
+            scale[j] = _weight.data_ptr<double>()[j];
+            shift[j] = _bias.data_ptr<double>()[j];
+          }
+        }
+        _Pragma("omp parallel for")
+        for (int i = 0; i < N; i++) {
+          int64_t bg = batch_[i] * num_groups;
+          const scalar_t *src = feats_ + (int64_t)i * C;
+          scalar_t *dst = output_ + (int64_t)i * C;
+          for (int g = 0; g < num_groups; g++) {
+            acc_t m = mean_[bg + g], r = rstd_[bg + g];
+            for (int j = g * group_size; j < (g + 1) * group_size; j++) {
+              dst[j] = ((acc_t)src[j] - m) * r * scale[j] + shift[j];
+            }
+          }
+        }
+      }));
+  return {output, mean, rstd};
+}
+
+// Returns {grad_feats (N, C), grad_weight (C,), grad_bias (C,)}; the
+// parameter gradients are empty without weight. With xhat the normalized
+// input and g = grad_output * weight, for every (sample, group):
+//   grad_feats = rstd * (g - mean(g) - xhat * mean(g * xhat)).
+std::vector<at::Tensor> group_norm_backward_cpu(
+    const at::Tensor grad_output, const at::Tensor feats,
+    const at::Tensor batch, const at::Tensor mean, const at::Tensor rstd,
+    const at::Tensor weight, const int batch_size, const int num_groups) {
+  const int N = feats.size(0);
+  const int C = feats.size(1);
+  const int group_size = C / num_groups;
+  const int BG = batch_size * num_groups;
+  at::Tensor _grad_output = grad_output.contiguous();
+  at::Tensor _feats = feats.contiguous();
+  at::Tensor _batch = batch.contiguous();
+  at::Tensor _mean = mean.contiguous();
+  at::Tensor _rstd = rstd.contiguous();
+  const int64_t *batch_ = _batch.data_ptr<int64_t>();
+  const double *mean_ = _mean.data_ptr<double>();
+  const double *rstd_ = _rstd.data_ptr<double>();
+  const bool affine = weight.numel() > 0;
+
+  at::Tensor grad_feats = torch::empty_like(_feats);
+  at::Tensor grad_weight, grad_bias;
+  std::vector<double> w(C, 1);
+  if (affine) {
+    at::Tensor _weight = weight.contiguous().to(at::kDouble);
+    for (int j = 0; j < C; j++) w[j] = _weight.data_ptr<double>()[j];
+  }
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _feats.scalar_type(),
+      "group_norm_backward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *grad_output_ = _grad_output.data_ptr<scalar_t>();
+        const scalar_t *feats_ = _feats.data_ptr<scalar_t>();
+        scalar_t *grad_feats_ = grad_feats.data_ptr<scalar_t>();
+
+        const int num_threads = group_norm_num_threads();
+        // per thread: sum(g) and sum(g * xhat) of every (sample, group),
+        // then sum(dy * xhat) and sum(dy) of every channel
+        const size_t stride = (size_t)BG * 2 + (size_t)C * 2;
+        std::vector<double> partial((size_t)num_threads * stride, 0);
+        std::vector<int64_t> counts(batch_size, 0);
+        _Pragma("omp parallel")
+        {
+          double *local =
+              partial.data() + (size_t)group_norm_thread_id() * stride;
+          double *local_w = local + (size_t)BG * 2;
+          _Pragma("omp for schedule(static)")
+          for (int i = 0; i < N; i++) {
+            int64_t bg = batch_[i] * num_groups;
+            const scalar_t *x = feats_ + (int64_t)i * C;
+            const scalar_t *dy = grad_output_ + (int64_t)i * C;
+            for (int g = 0; g < num_groups; g++) {
+              double m = mean_[bg + g], r = rstd_[bg + g];
+              double sum_g = 0, sum_gx = 0;
+              for (int j = g * group_size; j < (g + 1) * group_size; j++) {
+                double xhat = ((double)(acc_t)x[j] - m) * r;
+                double d = (acc_t)dy[j];
+                sum_g += d * w[j];
+                sum_gx += d * w[j] * xhat;
+                local_w[j * 2] += d * xhat;
+                local_w[j * 2 + 1] += d;
+              }
+              local[(bg + g) * 2] += sum_g;
+              local[(bg + g) * 2 + 1] += sum_gx;
+            }
+          }
+        }
+        for (int i = 0; i < N; i++) counts[batch_[i]]++;
+
+        std::vector<double> totals(stride, 0);
+        for (int t = 0; t < num_threads; t++) {
+          for (size_t k = 0; k < stride; k++) {
+            totals[k] += partial[(size_t)t * stride + k];
+          }
+        }
+        for (int bg = 0; bg < BG; bg++) {
+          double count = (double)counts[bg / num_groups] * group_size;
+          if (count == 0) continue;
+          totals[bg * 2] /= count;
+          totals[bg * 2 + 1] /= count;
+        }
+
+        _Pragma("omp parallel for")
+        for (int i = 0; i < N; i++) {
+          int64_t bg = batch_[i] * num_groups;
+          const scalar_t *x = feats_ + (int64_t)i * C;
+          const scalar_t *dy = grad_output_ + (int64_t)i * C;
+          scalar_t *dx = grad_feats_ + (int64_t)i * C;
+          for (int g = 0; g < num_groups; g++) {
+            double m = mean_[bg + g], r = rstd_[bg + g];
+            double mean_g = totals[(bg + g) * 2];
+            double mean_gx = totals[(bg + g) * 2 + 1];
+            for (int j = g * group_size; j < (g + 1) * group_size; j++) {
+              double xhat = ((double)(acc_t)x[j] - m) * r;
+              double d = (double)(acc_t)dy[j] * w[j];
+              dx[j] = (acc_t)(r * (d - mean_g - xhat * mean_gx));
+            }
+          }
+        }
+
+        if (affine) {
+          auto param_options = weight.options();
+          grad_weight = torch::empty({C}, param_options.dtype(at::kDouble));
+          grad_bias = torch::empty({C}, param_options.dtype(at::kDouble));
+          for (int j = 0; j < C; j++) {
+            grad_weight.data_ptr<double>()[j] = totals[(size_t)BG * 2 + j * 2];
+            grad_bias.data_ptr<double>()[j] =
+                totals[(size_t)BG * 2 + j * 2 + 1];
+          }
+          grad_weight = grad_weight.to(weight.scalar_type());
+          grad_bias = grad_bias.to(weight.scalar_type());
+        } else {
+          grad_weight = torch::empty({0}, _feats.options());
+          grad_bias = torch::empty({0}, _feats.options());
+        }
+      }));
+  return {grad_feats, grad_weight, grad_bias};
+}
@@ -0,0 +1,15 @@
+#pragma once
+
+#include <torch/torch.h>
+
+#include <vector>
+
+std::vector<at::Tensor> group_norm_forward_cpu(
+    const at::Tensor feats, const at::Tensor batch, const at::Tensor weight,
+    const at::Tensor bias, const int batch_size, const int num_groups,
+    const double eps);
+
+std::vector<at::Tensor> group_norm_backward_cpu(
+    const at::Tensor grad_output, const at::Tensor feats,
+    const at::Tensor batch, const at::Tensor mean, const at::Tensor rstd,
+    const at::Tensor weight, const int batch_size, const int num_groups);
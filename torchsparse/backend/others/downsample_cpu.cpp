@@ -0,0 +1,184 @@
+#include "downsample_cpu.h"
+
+#include <torch/torch.h>
+
+#include <algorithm>
+#include <climits>
+#include <cstdint>
+#include <stdexcept>
+#include <vector>
+
+#include "../utils/unique_cpu.h"
+
+#define NDim 4
+
+// Ravels b, x, y, z within [coords_min, coords_max], as downsample_cuda does.
+inline int64_t transform_coords_cpu(const int *coords, const int *coords_min,
+                                    const int64_t *sizes) {
+  int64_t cur = 0;
+  for (int i = 0; i < NDim; i++) {
+    cur = cur * sizes[i] + (coords[i] - coords_min[i]);
+  }
+  return cur;
+}
+
+inline void inverse_transform_coords_cpu(int64_t cur, const int *coords_min,
+                                         const int64_t *sizes,
+                                         int *out_coords) {
+  for (int i = NDim - 1; i >= 0; i--) {
+    out_coords[i] = coords_min[i] + (int)(cur % sizes[i]);
+    cur /= sizes[i];
+  }
+}
+
+// Enumerates the output coordinates covered by one input point (offsets
+// -(k - 1)..0 on every axis, z fastest) and either counts them or writes
+// their raveled keys.
+inline int get_output_coords_cpu(const int *in_coords, const int *kernel_sizes,
+                                 const int *stride, const int *padding,
+                                 const int *coords_min, const int *coords_max,
+                                 const int64_t *sizes, int64_t *out_keys) {
+  int count = 0;
+  int cur_coords[NDim];
+  cur_coords[0] = in_coords[0];
+  for (int dx = -(kernel_sizes[0] - 1); dx <= 0; dx++) {
+    for (int dy = -(kernel_sizes[1] - 1); dy <= 0; dy++) {
+      for (int dz = -(kernel_sizes[2] - 1); dz <= 0; dz++) {
+        const int offsets[NDim - 1] = {dx, dy, dz};
+        bool valid = true;
+        for (int j = 1; j < NDim && valid; j++) {
+          int cur = in_coords[j] + offsets[j - 1] + padding[j - 1];
+          int cur_div = cur / stride[j - 1];
+          valid = cur % stride[j - 1] == 0 && cur_div >= coords_min[j] &&
+                  cur_div <= coords_max[j];
+          cur_coords[j] = cur_div;
+        }
+        if (!valid) continue;
+        if (out_keys != nullptr) {
+          out_keys[count] = transform_coords_cpu(cur_coords, coords_min, sizes);
+        }
+        count++;
+      }
+    }
+  }
+  return count;
+}
+
+// Same contract as downsample_cuda, except that output coordinates are
+// deduplicated with a hash table and numbered by first occurrence instead of
+// being sorted.
+at::Tensor downsample_cpu(at::Tensor _in_coords, at::Tensor _coords_max,
+                          at::Tensor _coords_min, at::Tensor _kernel_sizes,
+                          at::Tensor _stride, at::Tensor _padding) {
+  _in_coords = _in_coords.contiguous();
+  const int N = _in_coords.size(0);
+  const int *in_coords = _in_coords.data_ptr<int>();
+  const int *coords_min = _coords_min.data_ptr<int>();
+  const int *coords_max = _coords_max.data_ptr<int>();
+  const int *kernel_sizes = _kernel_sizes.data_ptr<int>();
+  const int *stride = _stride.data_ptr<int>();
+  const int *padding = _padding.data_ptr<int>();
+
+  int64_t sizes[NDim];
+  double volume = 1;
+  for (int i = 0; i < NDim; i++) {
+    sizes[i] = std::max<int64_t>((int64_t)coords_max[i] - coords_min[i] + 1, 1);
+    volume *= (double)sizes[i];
+  }
+  if (volume >= 9.2e18) {
+    throw std::invalid_argument("Coordinate range is too large to downsample");
+  }
+
+  // count candidates per point, then write them at their prefix offsets
+  std::vector<int64_t> offsets(N + 1, 0);
+#pragma omp parallel for
+  for (int i = 0; i < N; i++) {
+    offsets[i + 1] = get_output_coords_cpu(
+        in_coords + (int64_t)i * NDim, kernel_sizes, stride, padding,
+        coords_min, coords_max, sizes, nullptr);
+  }
+  for (int i = 0; i < N; i++) offsets[i + 1] += offsets[i];
+  const int64_t n_candidates = offsets[N];
+  if (n_candidates > INT_MAX) {
+    throw std::invalid_argument("Too many output candidates to downsample");
+  }
+
+  std::vector<int64_t> keys(n_candidates);
+#pragma omp parallel for
+  for (int i = 0; i < N; i++) {
+    get_output_coords_cpu(in_coords + (int64_t)i * NDim, kernel_sizes, stride,
+                          padding, coords_min, coords_max, sizes,
+                          keys.data() + offsets[i]);
+  }
+
+  std::vector<int> first;
+  first_occurrence_cpu(keys.data(), (int)n_candidates, first);
+  std::vector<int64_t> unique_keys;
+  for (int i = 0; i < (int)n_candidates; i++) {
+    if (first[i] == i) unique_keys.push_back(keys[i]);
+  }
+
+  const int M = unique_keys.size();
+  at::Tensor _out_coords = torch::empty({M, NDim}, _in_coords.options());
+  int *out_coords = _out_coords.data_ptr<int>();
+#pragma omp parallel for
+  for (int i = 0; i < M; i++) {
+    inverse_transform_coords_cpu(unique_keys[i], coords_min, sizes,
+                                 out_coords + (int64_t)i * NDim);
+  }
+  return _out_coords;
+}
+
+// Deduplicates (N, 4) coordinates through packed 64-bit keys, keeping the
+// first occurrence of every coordinate in input order.
+at::Tensor unique_coords_cpu(at::Tensor _coords) {
+  _coords = _coords.contiguous();
+  const int N = _coords.size(0);
+  const int *coords = _coords.data_ptr<int>();
+  if (N == 0) return _coords.clone();
+
+  int coords_min[NDim], coords_max[NDim];
+  for (int d = 0; d < NDim; d++) {
+    int lo = INT_MAX, hi = INT_MIN;
+#pragma omp parallel for reduction(min : lo) reduction(max : hi)
+    for (int i = 0; i < N; i++) {
+      lo = std::min(lo, coords[(int64_t)i * NDim + d]);
+      hi = std::max(hi, coords[(int64_t)i * NDim + d]);
+    }
+    coords_min[d] = lo;
+    coords_max[d] = hi;
+  }
+  int64_t sizes[NDim];
+  double volume = 1;
+  for (int d = 0; d < NDim; d++) {
+    sizes[d] = (int64_t)coords_max[d] - coords_min[d] + 1;
+    volume *= (double)sizes[d];
+  }
+  if (volume >= 9.2e18) {
+    throw std::invalid_argument("Coordinate range is too large to deduplicate");
+  }
+
+  std::vector<int64_t> keys(N);
+#pragma omp parallel for
+  for (int i = 0; i < N; i++) {
+    keys[i] = transform_coords_cpu(coords + (int64_t)i * NDim, coords_min, sizes);
+  }
+
+  std::vector<int> first;
+  first_occurrence_cpu(keys.data(), N, first);
+  std::vector<int> rows;
+  for (int i = 0; i < N; i++) {
+    if (first[i] == i) rows.push_back(i);
+  }
+
+  const int M = rows.size();
+  at::Tensor _out_coords = torch::empty({M, NDim}, _coords.options());
+  int *out_coords = _out_coords.data_ptr<int>();
+#pragma omp parallel for
+  for (int i = 0; i < M; i++) {
+    std::copy(coords + (int64_t)rows[i] * NDim,
+              coords + (int64_t)(rows[i] + 1) * NDim,
+              out_coords + (int64_t)i * NDim);
+  }
+  return _out_coords;
+}
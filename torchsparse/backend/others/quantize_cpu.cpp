@@ -0,0 +1,147 @@
+#include "quantize_cpu.h"
+
+#include <ATen/OpMathType.h>
+#include <torch/torch.h>
+
+#include <algorithm>
+#include <climits>
+#include <stdexcept>
+#include <vector>
+
+#include "../utils/segment_cpu.h"
+#include "../utils/unique_cpu.h"
+
+// reduction modes for the optional per-voxel features
+#define QUANTIZE_REDUCE_NONE 0
+#define QUANTIZE_REDUCE_MEAN 1
+#define QUANTIZE_REDUCE_MAX 2
+#define QUANTIZE_REDUCE_SUM 3
+
+// coords: (N, D) int32, feats: (N, C) or empty.
+// Returns {unique coords (M, D), index (M,), inverse (N,), counts (M,),
+// reduced feats (M, C) or empty}. Voxels are numbered in the order of their
+// first point, and index holds that first point, so the result does not
+// depend on the number of threads.
+std::vector<at::Tensor> sparse_quantize_cpu(const at::Tensor coords,
+                                            const at::Tensor feats,
+                                            const int reduction) {
+  at::Tensor _coords = coords.contiguous();
+  const int N = _coords.size(0);
+  const int D = _coords.size(1);
+  const int *coords_ = _coords.data_ptr<int>();
+  auto long_options = _coords.options().dtype(at::ScalarType::Long);
+
+  // ravel coordinates into exact 64-bit keys
+  std::vector<int> cmin(D, INT_MAX), cmax(D, INT_MIN);
+  for (int d = 0; d < D; d++) {
+    int lo = INT_MAX, hi = INT_MIN;
+#pragma omp parallel for reduction(min : lo) reduction(max : hi)
+    for (int i = 0; i < N; i++) {
+      lo = std::min(lo, coords_[(int64_t)i * D + d]);
+      hi = std::max(hi, coords_[(int64_t)i * D + d]);
+    }
+    cmin[d] = lo;
+    cmax[d] = hi;
+  }
+  std::vector<int64_t> extents(D, 1);
+  double volume = 1;
+  for (int d = 0; d < D && N > 0; d++) {
+    extents[d] = (int64_t)cmax[d] - cmin[d] + 1;
+    volume *= (double)extents[d];
+  }
+  if (volume >= 9.2e18) {
+    throw std::invalid_argument("Coordinate range is too large to quantize");
+  }
+
+  std::vector<int64_t> keys(N);
+#pragma omp parallel for
+  for (int i = 0; i < N; i++) {
+    int64_t key = 0;
+    for (int d = 0; d < D; d++) {
+      key = key * extents[d] + (coords_[(int64_t)i * D + d] - cmin[d]);
+    }
+    keys[i] = key;
+  }
+
+  // number voxels by first occurrence
+  std::vector<int> first;
+  first_occurrence_cpu(keys.data(), N, first);
+  std::vector<int> first_voxel(N, -1);
+  int M = 0;
+  for (int i = 0; i < N; i++) {
+    if (first[i] == i) first_voxel[i] = M++;
+  }
+
+  at::Tensor index = torch::empty({M}, long_options);
+  at::Tensor inverse = torch::empty({N}, long_options);
+  at::Tensor out_coords = torch::empty({M, D}, _coords.options());
+  int64_t *index_ = index.data_ptr<int64_t>();
+  int64_t *inverse_ = inverse.data_ptr<int64_t>();
+  int *out_coords_ = out_coords.data_ptr<int>();
+
+#pragma omp parallel for
+  for (int i = 0; i < N; i++) {
+    int v = first_voxel[i];
+    if (v < 0) continue;
+    index_[v] = i;
+    std::copy(coords_ + (int64_t)i * D, coords_ + (int64_t)(i + 1) * D,
+              out_coords_ + (int64_t)v * D);
+  }
+#pragma omp parallel for
+  for (int i = 0; i < N; i++) {
+    inverse_[i] = first_voxel[first[i]];
+  }
+
+  std::vector<int> seg_ptr, seg_rows;
+  build_segments_cpu(
+      N, M, [&](int i) { return (int)inverse_[i]; }, seg_ptr, seg_rows);
+  at::Tensor counts = torch::empty({M}, long_options);
+  int64_t *counts_ = counts.data_ptr<int64_t>();
+#pragma omp parallel for
+  for (int v = 0; v < M; v++) counts_[v] = seg_ptr[v + 1] - seg_ptr[v];
+
+  at::Tensor out_feats = torch::empty({0}, _coords.options());
+  if (reduction == QUANTIZE_REDUCE_NONE || feats.numel() == 0) {
+    return {out_coords, index, inverse, counts, out_feats};
+  }
+  if (feats.size(0) != N) {
+    throw std::invalid_argument("Coordinate and feature size mismatch");
+  }
+
+  at::Tensor _feats = feats.contiguous();
+  const int C = _feats.size(1);
+  out_feats = torch::empty({M, C}, _feats.options());
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _feats.scalar_type(),
+      "sparse_quantize_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *feats_ = _feats.data_ptr<scalar_t>();
+        scalar_t *out_feats_ = out_feats.data_ptr<scalar_t>();
+        _Pragma("omp parallel")
+        {
+          std::vector<acc_t> acc(C);
+          _Pragma("omp for schedule(static)")
+          for (int v = 0; v < M; v++) {
+            const int begin = seg_ptr[v], end = seg_ptr[v + 1];
+            const scalar_t *src = feats_ + (int64_t)seg_rows[begin] * C;
+            for (int j = 0; j < C; j++) acc[j] = src[j];
+            for (int s = begin + 1; s < end; s++) {
+              src = feats_ + (int64_t)seg_rows[s] * C;
+              if (reduction == QUANTIZE_REDUCE_MAX) {
+                for (int j = 0; j < C; j++)
+                  acc[j] = std::max(acc[j], (acc_t)src[j]);
+              } else {
+                for (int j = 0; j < C; j++) acc[j] += src[j];
+              }
+            }
+            if (reduction == QUANTIZE_REDUCE_MEAN) {
+              acc_t inv_count = (acc_t)1 / (acc_t)(end - begin);
+              for (int j = 0; j < C; j++) acc[j] *= inv_count;
+            }
+            scalar_t *dst = out_feats_ + (int64_t)v * C;
+            for (int j = 0; j < C; j++) dst[j] = acc[j];
+          }
+        }
+      }));
+  return {out_coords, index, inverse, counts, out_feats};
+}
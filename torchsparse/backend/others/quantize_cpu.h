@@ -0,0 +1,9 @@
+#pragma once
+
+#include <torch/torch.h>
+
+#include <vector>
+
+std::vector<at::Tensor> sparse_quantize_cpu(const at::Tensor coords,
+                                            const at::Tensor feats,
+                                            const int reduction);
@@ -0,0 +1,183 @@
+#include "pooling_cpu.h"
+
+#include <ATen/OpMathType.h>
+#include <torch/torch.h>
+
+#include <algorithm>
+#include <vector>
+
+#include "../utils/segment_cpu.h"
+
+// feats (N_in, C), out_in_map (>= n_out, K) int32, where out_in_map[o][k] is
+// the input row at kernel offset k of output o, or -1.
+// Returns {output (n_out, C), argmax (n_out, C) int32}: the input row each
+// output channel was taken from (the first one on ties), or -1 for outputs
+// without any input.
+std::vector<at::Tensor> max_pool_forward_cpu(const at::Tensor feats,
+                                             const at::Tensor out_in_map,
+                                             const int n_out) {
+  const int C = feats.size(1);
+  const int K = out_in_map.size(1);
+  at::Tensor _feats = feats.contiguous();
+  at::Tensor _out_in_map = out_in_map.contiguous();
+  const int *map_ = _out_in_map.data_ptr<int>();
+
+  at::Tensor output = torch::zeros({n_out, C}, _feats.options());
+  at::Tensor argmax = torch::full(
+      {n_out, C}, -1, _feats.options().dtype(at::ScalarType::Int));
+  int *argmax_ = argmax.data_ptr<int>();
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _feats.scalar_type(),
+      "max_pool_forward_cpu", ([&] {
+        const scalar_t *feats_ = _feats.data_ptr<scalar_t>();
+        scalar_t *output_ = output.data_ptr<scalar_t>();
+        _Pragma("omp parallel for")
+        for (int o = 0; o < n_out; o++) {
+          scalar_t *dst = output_ + (int64_t)o * C;
+          int *arg = argmax_ + (int64_t)o * C;
+          for (int k = 0; k < K; k++) {
+            int i = map_[(int64_t)o * K + k];
+            if (i < 0) continue;
+            const scalar_t *src = feats_ + (int64_t)i * C;
+            for (int c = 0; c < C; c++) {
+              if (arg[c] < 0 || src[c] > dst[c]) {
+                dst[c] = src[c];
+                arg[c] = i;
+              }
+            }
+          }
+        }
+      }));
+  return {output, argmax};
+}
+
+// Gradients flow back to the argmax rows only. The (output, offset) pairs are
+// bucketed by input row, so that every input row is written by one thread.
+at::Tensor max_pool_backward_cpu(const at::Tensor grad_output,
+                                 const at::Tensor out_in_map,
+                                 const at::Tensor argmax, const int n_in) {
+  const int n_out = grad_output.size(0);
+  const int C = grad_output.size(1);
+  const int K = out_in_map.size(1);
+  at::Tensor _grad_output = grad_output.contiguous();
+  at::Tensor _out_in_map = out_in_map.contiguous();
+  at::Tensor _argmax = argmax.contiguous();
+  const int *map_ = _out_in_map.data_ptr<int>();
+  const int *argmax_ = _argmax.data_ptr<int>();
+
+  std::vector<int> ptr, pairs;
+  build_segments_cpu(
+      n_out * K, n_in, [&](int p) { return map_[p]; }, ptr, pairs);
+
+  at::Tensor grad_input = torch::zeros({n_in, C}, _grad_output.options());
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16,
+      _grad_output.scalar_type(), "max_pool_backward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *grad_ = _grad_output.data_ptr<scalar_t>();
+        scalar_t *grad_input_ = grad_input.data_ptr<scalar_t>();
+        _Pragma("omp parallel for schedule(dynamic, 64)")
+        for (int i = 0; i < n_in; i++) {
+          scalar_t *dst = grad_input_ + (int64_t)i * C;
+          for (int j = ptr[i]; j < ptr[i + 1]; j++) {
+            int o = pairs[j] / K;
+            const scalar_t *src = grad_ + (int64_t)o * C;
+            const int *arg = argmax_ + (int64_t)o * C;
+            for (int c = 0; c < C; c++) {
+              if (arg[c] == i) dst[c] = (acc_t)dst[c] + (acc_t)src[c];
+            }
+          }
+        }
+      }));
+  return grad_input;
+}
+
+// Returns {output (n_out, C), counts (n_out,) int32}: the mean over the valid
+// neighbors of every output, and the number of those neighbors.
+std::vector<at::Tensor> avg_pool_forward_cpu(const at::Tensor feats,
+                                             const at::Tensor out_in_map,
+                                             const int n_out) {
+  const int C = feats.size(1);
+  const int K = out_in_map.size(1);
+  at::Tensor _feats = feats.contiguous();
+  at::Tensor _out_in_map = out_in_map.contiguous();
+  const int *map_ = _out_in_map.data_ptr<int>();
+
+  at::Tensor output = torch::zeros({n_out, C}, _feats.options());
+  at::Tensor counts =
+      torch::zeros({n_out}, _feats.options().dtype(at::ScalarType::Int));
+  int *counts_ = counts.data_ptr<int>();
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _feats.scalar_type(),
+      "avg_pool_forward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *feats_ = _feats.data_ptr<scalar_t>();
+        scalar_t *output_ = output.data_ptr<scalar_t>();
+        _Pragma("omp parallel")
+        {
+          std::vector<acc_t> acc(C);
+          _Pragma("omp for")
+          for (int o = 0; o < n_out; o++) {
+            std::fill(acc.begin(), acc.end(), (acc_t)0);
+            int count = 0;
+            for (int k = 0; k < K; k++) {
+              int i = map_[(int64_t)o * K + k];
+              if (i < 0) continue;
+              const scalar_t *src = feats_ + (int64_t)i * C;
+              for (int c = 0; c < C; c++) acc[c] += (acc_t)src[c];
+              count++;
+            }
+            counts_[o] = count;
+            if (count == 0) continue;
+            scalar_t *dst = output_ + (int64_t)o * C;
+            for (int c = 0; c < C; c++) dst[c] = acc[c] / (acc_t)count;
+          }
+        }
+      }));
+  return {output, counts};
+}
+
+at::Tensor avg_pool_backward_cpu(const at::Tensor grad_output,
+                                 const at::Tensor out_in_map,
+                                 const at::Tensor counts, const int n_in) {
+  const int n_out = grad_output.size(0);
+  const int C = grad_output.size(1);
+  const int K = out_in_map.size(1);
+  at::Tensor _grad_output = grad_output.contiguous();
+  at::Tensor _out_in_map = out_in_map.contiguous();
+  at::Tensor _counts = counts.contiguous();
+  const int *map_ = _out_in_map.data_ptr<int>();
+  const int *counts_ = _counts.data_ptr<int>();
+
+  std::vector<int> ptr, pairs;
+  build_segments_cpu(
+      n_out * K, n_in, [&](int p) { return map_[p]; }, ptr, pairs);
+
+  at::Tensor grad_input = torch::zeros({n_in, C}, _grad_output.options());
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16,
+      _grad_output.scalar_type(), "avg_pool_backward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *grad_ = _grad_output.data_ptr<scalar_t>();
+        scalar_t *grad_input_ = grad_input.data_ptr<scalar_t>();
+        _Pragma("omp parallel")
+        {
+          std::vector<acc_t> acc(C);
+          _Pragma("omp for schedule(dynamic, 64)")
+          for (int i = 0; i < n_in; i++) {
+            std::fill(acc.begin(), acc.end(), (acc_t)0);
+            for (int j = ptr[i]; j < ptr[i + 1]; j++) {
+              int o = pairs[j] / K;
+              acc_t scale = (acc_t)1 / (acc_t)counts_[o];
+              const scalar_t *src = grad_ + (int64_t)o * C;
+              for (int c = 0; c < C; c++) acc[c] += (acc_t)src[c] * scale;
+            }
+            scalar_t *dst = grad_input_ + (int64_t)i * C;
+            for (int c = 0; c < C; c++) dst[c] = acc[c];
+          }
+        }
+      }));
+  return grad_input;
+}
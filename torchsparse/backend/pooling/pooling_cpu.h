@@ -0,0 +1,21 @@
+#pragma once
+
+#include <torch/torch.h>
+
+#include <vector>
+
+std::vector<at::Tensor> max_pool_forward_cpu(const at::Tensor feats,
+                                             const at::Tensor out_in_map,
+                                             const int n_out);
+
+at::Tensor max_pool_backward_cpu(const at::Tensor grad_output,
+                                 const at::Tensor out_in_map,
+                                 const at::Tensor argmax, const int n_in);
+
+std::vector<at::Tensor> avg_pool_forward_cpu(const at::Tensor feats,
+                                             const at::Tensor out_in_map,
+                                             const int n_out);
+
+at::Tensor avg_pool_backward_cpu(const at::Tensor grad_output,
+                                 const at::Tensor out_in_map,
+                                 const at::Tensor counts, const int n_in);
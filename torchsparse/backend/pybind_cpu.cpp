@@ -3,21 +3,49 @@
 #include <torch/serialize/tensor.h>
 
 #include "convolution/convolution_gather_scatter_cpu.h"
+#include "convolution/convolution_implicit_gemm_cpu.h"
 #include "devoxelize/devoxelize_cpu.h"
 #include "hash/hash_cpu.h"
+#include "hashmap/hashmap_cpu.hpp"
+#include "norm/group_norm_cpu.h"
 #include "others/count_cpu.h"
+#include "others/downsample_cpu.h"
 #include "others/query_cpu.h"
+#include "others/quantize_cpu.h"
+#include "pooling/pooling_cpu.h"
 #include "voxelize/voxelize_cpu.h"
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
+  py::class_<CPUHashTable>(m, "CPUHashTable")
+        .def(py::init<torch::Tensor, torch::Tensor>())
+        .def("insert_coords", &CPUHashTable::insert_coords)
+        .def("update_coords", &CPUHashTable::update_coords)
+        .def("lookup_coords", &CPUHashTable::lookup_coords)
+        .def("lookup_coords_symmetric", &CPUHashTable::lookup_coords_symmetric);
   m.def("conv_forward_gather_scatter_cpu", &conv_forward_gather_scatter_cpu);
   m.def("conv_backward_gather_scatter_cpu", &conv_backward_gather_scatter_cpu);
+  m.def("conv_forward_implicit_gemm_cpu", &conv_forward_implicit_gemm_cpu);
+  m.def("conv_forward_implicit_gemm_rows_cpu", &conv_forward_implicit_gemm_rows_cpu);
+  m.def("conv_backward_wgrad_implicit_gemm_cpu", &conv_backward_wgrad_implicit_gemm_cpu);
+  m.def("conv_forward_implicit_gemm_compact_cpu", &conv_forward_implicit_gemm_compact_cpu);
+  m.def("conv_backward_wgrad_implicit_gemm_compact_cpu", &conv_backward_wgrad_implicit_gemm_compact_cpu);
   m.def("voxelize_forward_cpu", &voxelize_forward_cpu);
   m.def("voxelize_backward_cpu", &voxelize_backward_cpu);
+  m.def("to_dense_forward_cpu", &to_dense_forward_cpu);
+  m.def("to_dense_backward_cpu", &to_dense_backward_cpu);
   m.def("devoxelize_forward_cpu", &devoxelize_forward_cpu);
   m.def("devoxelize_backward_cpu", &devoxelize_backward_cpu);
   m.def("hash_cpu", &hash_cpu);
   m.def("kernel_hash_cpu", &kernel_hash_cpu);
   m.def("hash_query_cpu", &hash_query_cpu);
   m.def("count_cpu", &count_cpu);
+  m.def("sparse_quantize_cpu", &sparse_quantize_cpu);
+  m.def("group_norm_forward_cpu", &group_norm_forward_cpu);
+  m.def("group_norm_backward_cpu", &group_norm_backward_cpu);
+  m.def("downsample_cpu", &downsample_cpu);
+  m.def("unique_coords_cpu", &unique_coords_cpu);
+  m.def("max_pool_forward_cpu", &max_pool_forward_cpu);
+  m.def("max_pool_backward_cpu", &max_pool_backward_cpu);
+  m.def("avg_pool_forward_cpu", &avg_pool_forward_cpu);
+  m.def("avg_pool_backward_cpu", &avg_pool_backward_cpu);
 }
@@ -3,6 +3,7 @@
 #include <torch/serialize/tensor.h>
 
 #include "convolution/convolution_gather_scatter_cpu.h"
+#include "convolution/convolution_implicit_gemm_cpu.h"
 #include "convolution/convolution_gather_scatter_cuda.h"
 #include "convolution/convolution_forward_fetch_on_demand_cuda.h"
 #include "convolution/convolution_forward_implicit_gemm_cuda.h"
@@ -15,16 +16,21 @@
 #include "hash/hash_cuda.h"
 #include "others/count_cpu.h"
 #include "others/count_cuda.h"
+#include "others/downsample_cpu.h"
 #include "others/downsample_cuda.h"
 #include "others/exclusive_scan_cuda.h"
 #include "others/query_cpu.h"
 #include "others/query_cuda.h"
+#include "others/quantize_cpu.h"
 #include "others/reduce_bitmask_cuda.h"
 #include "others/reorder_map_cuda.h"
 #include "others/sparsemapping_cuda.h"
 #include "voxelize/voxelize_cpu.h"
 #include "voxelize/voxelize_cuda.h"
 #include "hashmap/hashmap_cuda.cuh"
+#include "hashmap/hashmap_cpu.hpp"
+#include "norm/group_norm_cpu.h"
+#include "pooling/pooling_cpu.h"
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   py::class_<hashtable>(m, "GPUHashTable")
@@ -33,6 +39,7 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
         .def("insert_vals", &hashtable::insert_vals)
         .def("lookup_vals", &hashtable::lookup_vals)
         .def("insert_coords", &hashtable::insert_coords)
+        .def("update_coords", &hashtable::update_coords)
         .def("lookup_coords", &hashtable::lookup_coords);
   py::class_<hashtable32>(m, "GPUHashTable32")
         .def(py::init<const int>())
@@ -40,7 +47,14 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
         .def("insert_vals", &hashtable32::insert_vals)
         .def("lookup_vals", &hashtable32::lookup_vals)
         .def("insert_coords", &hashtable32::insert_coords)
+        .def("update_coords", &hashtable32::update_coords)
         .def("lookup_coords", &hashtable32::lookup_coords);
+  py::class_<CPUHashTable>(m, "CPUHashTable")
+        .def(py::init<torch::Tensor, torch::Tensor>())
+        .def("insert_coords", &CPUHashTable::insert_coords)
+        .def("update_coords", &CPUHashTable::update_coords)
+        .def("lookup_coords", &CPUHashTable::lookup_coords)
+        .def("lookup_coords_symmetric", &CPUHashTable::lookup_coords_symmetric);
   m.def("conv_forward_gather_scatter_cpu", &conv_forward_gather_scatter_cpu);
   m.def("conv_forward_gather_scatter_cuda", &conv_forward_gather_scatter_cuda);
   m.def("conv_forward_fetch_on_demand_cuda", &conv_forward_fetch_on_demand_cuda);
@@ -50,10 +64,17 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("conv_backward_wgrad_implicit_gemm_cuda", &conv_backward_wgrad_implicit_gemm_cuda, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("split_k_iters"), py::arg("allow_tf32") = false, py::arg("allow_fp16") = true);
   m.def("conv_backward_wgrad_implicit_gemm_sorted_cuda", &conv_backward_wgrad_implicit_gemm_sorted_cuda, py::arg("_in_feats"), py::arg("_kernel"), py::arg("_out_in_map"), py::arg("_reduced_mask"), py::arg("_reorder_loc"), py::arg("split_k_iters"), py::arg("allow_tf32") = false, py::arg("allow_fp16") = true);
   m.def("conv_backward_gather_scatter_cpu", &conv_backward_gather_scatter_cpu);
+  m.def("conv_forward_implicit_gemm_cpu", &conv_forward_implicit_gemm_cpu);
+  m.def("conv_forward_implicit_gemm_rows_cpu", &conv_forward_implicit_gemm_rows_cpu);
+  m.def("conv_backward_wgrad_implicit_gemm_cpu", &conv_backward_wgrad_implicit_gemm_cpu);
+  m.def("conv_forward_implicit_gemm_compact_cpu", &conv_forward_implicit_gemm_compact_cpu);
+  m.def("conv_backward_wgrad_implicit_gemm_compact_cpu", &conv_backward_wgrad_implicit_gemm_compact_cpu);
   m.def("conv_backward_gather_scatter_cuda", &conv_backward_gather_scatter_cuda);
   m.def("voxelize_forward_cpu", &voxelize_forward_cpu);
   m.def("voxelize_forward_cuda", &voxelize_forward_cuda);
   m.def("voxelize_backward_cpu", &voxelize_backward_cpu);
+  m.def("to_dense_forward_cpu", &to_dense_forward_cpu);
+  m.def("to_dense_backward_cpu", &to_dense_backward_cpu);
   m.def("voxelize_backward_cuda", &voxelize_backward_cuda);
   m.def("to_dense_forward_cuda", &to_dense_forward_cuda);
   m.def("to_dense_backward_cuda", &to_dense_backward_cuda);
@@ -79,5 +100,14 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("build_mask_from_kmap", &build_mask_from_kmap);
   m.def("downsample_cuda", &downsample_cuda);
   m.def("count_cpu", &count_cpu);
+  m.def("sparse_quantize_cpu", &sparse_quantize_cpu);
+  m.def("group_norm_forward_cpu", &group_norm_forward_cpu);
+  m.def("group_norm_backward_cpu", &group_norm_backward_cpu);
+  m.def("downsample_cpu", &downsample_cpu);
+  m.def("unique_coords_cpu", &unique_coords_cpu);
+  m.def("max_pool_forward_cpu", &max_pool_forward_cpu);
+  m.def("max_pool_backward_cpu", &max_pool_backward_cpu);
+  m.def("avg_pool_forward_cpu", &avg_pool_forward_cpu);
+  m.def("avg_pool_backward_cpu", &avg_pool_backward_cpu);
   m.def("count_cuda", &count_cuda);
 }
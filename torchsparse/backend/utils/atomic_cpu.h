@@ -0,0 +1,29 @@
+#pragma once
+
+#include <cstdint>
+
+#ifdef _MSC_VER
+#include <intrin.h>
+#endif
+
+// Compare-and-swap on CPU memory shared by OpenMP threads: stores val at
+// address if it holds compare, and returns the previous value.
+
+inline int64_t atomic_cas_int64_cpu(int64_t *address, int64_t compare,
+                                    int64_t val) {
+#ifdef _MSC_VER
+  return _InterlockedCompareExchange64(
+      reinterpret_cast<volatile long long *>(address), val, compare);
+#else
+  return __sync_val_compare_and_swap(address, compare, val);
+#endif
+}
+
+inline int atomic_cas_int32_cpu(int *address, int compare, int val) {
+#ifdef _MSC_VER
+  return _InterlockedCompareExchange(reinterpret_cast<volatile long *>(address),
+                                     val, compare);
+#else
+  return __sync_val_compare_and_swap(address, compare, val);
+#endif
+}
@@ -0,0 +1,52 @@
+#pragma once
+
+#include <cstdint>
+
+// Rows of an out_in_map (n_rows, kernel_volume), -1 for missing neighbors.
+// row(r, scratch) returns the kernel_volume entries of row r; has(r, k)
+// tells whether row r has a neighbor at offset k.
+struct DenseMapCPU {
+  const int *data;
+  int kernel_volume;
+
+  inline const int *row(const int64_t r, int *scratch) const {
+    return data + r * kernel_volume;
+  }
+
+  inline bool has(const int64_t r, const int k) const {
+    return data[r * kernel_volume + k] >= 0;
+  }
+};
+
+// Rows per block of the compact (bitmask + rank) encoding, equal to cta_M.
+#define COMPACT_MAP_BLOCK 128
+
+// The same rows in bitmask + rank encoding (see compact_out_in_map): bit k
+// of the n_words words masks[r] is set if row r has a neighbor at offset k.
+// The neighbors of the rows of block b are stored row by row, offset by
+// offset, from nbrs[block_ptr[b]], relative to bases[b]; those of row r
+// start ranks[r] entries after those of its block.
+template <typename index_t>
+struct CompactMapCPU {
+  const int *masks;
+  int n_words;
+  const int64_t *block_ptr;
+  const int *ranks;
+  const index_t *nbrs;
+  const int *bases;
+  int kernel_volume;
+
+  inline bool has(const int64_t r, const int k) const {
+    const uint32_t word = masks[r * n_words + k / 32];
+    return (word >> (k % 32)) & 1u;
+  }
+
+  inline const int *row(const int64_t r, int *scratch) const {
+    const int64_t block = r / COMPACT_MAP_BLOCK;
+    int64_t pos = block_ptr[block] + ranks[r];
+    for (int k = 0; k < kernel_volume; k++) {
+      scratch[k] = has(r, k) ? bases[block] + (int)nbrs[pos++] : -1;
+    }
+    return scratch;
+  }
+};
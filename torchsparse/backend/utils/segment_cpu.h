@@ -0,0 +1,24 @@
+#pragma once
+
+#include <vector>
+
+// Buckets the rows [0, n) by segment id (counting sort). After the call, the
+// rows of segment s are rows[ptr[s] : ptr[s + 1]], in increasing order.
+// Rows whose segment id is negative are dropped. key(i) returns the segment
+// id of row i and must lie in [-1, n_segments).
+template <typename KeyFn>
+inline void build_segments_cpu(const int n, const int n_segments, KeyFn key,
+                               std::vector<int> &ptr, std::vector<int> &rows) {
+  ptr.assign(n_segments + 1, 0);
+  for (int i = 0; i < n; i++) {
+    int s = key(i);
+    if (s >= 0) ptr[s + 1]++;
+  }
+  for (int s = 0; s < n_segments; s++) ptr[s + 1] += ptr[s];
+  rows.resize(ptr[n_segments]);
+  std::vector<int> cursor(ptr.begin(), ptr.end() - 1);
+  for (int i = 0; i < n; i++) {
+    int s = key(i);
+    if (s >= 0) rows[cursor[s]++] = i;
+  }
+}
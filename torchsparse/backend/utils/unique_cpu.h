@@ -0,0 +1,61 @@
+#pragma once
+
+#include <climits>
+#include <cstdint>
+#include <vector>
+
+#include "atomic_cpu.h"
+
+// Lock-free open-addressing hash dedup for non-negative int64 keys (e.g.
+// raveled coordinates), shared by the CPU quantize and downsample kernels.
+
+#define UNIQUE_CPU_EMPTY_KEY (-1)
+
+inline void unique_cpu_atomic_min(int *address, int val) {
+  int old = *address;
+  while (val < old) {
+    int prev = atomic_cas_int32_cpu(address, old, val);
+    if (prev == old) break;
+    old = prev;
+  }
+}
+
+inline uint64_t unique_cpu_mix(uint64_t key) {
+  // splitmix64 finalizer: raveled keys of neighbouring voxels are consecutive
+  key ^= key >> 31;
+  key *= 0x7fb5d329728ea185ULL;
+  key ^= key >> 27;
+  key *= 0x81dadef4bc2dd44dULL;
+  key ^= key >> 33;
+  return key;
+}
+
+// For every key i, first[i] is the smallest j with keys[j] == keys[i]. The
+// result is deterministic, whatever the number of threads.
+inline void first_occurrence_cpu(const int64_t *keys, const int n,
+                                 std::vector<int> &first) {
+  int64_t capacity = 1;
+  while (capacity < 2 * (int64_t)n) capacity <<= 1;
+  const int64_t mask = capacity - 1;
+  std::vector<int64_t> table_keys(capacity, UNIQUE_CPU_EMPTY_KEY);
+  std::vector<int> table_vals(capacity, INT_MAX);
+  std::vector<int64_t> slots(n);
+
+#pragma omp parallel for
+  for (int i = 0; i < n; i++) {
+    int64_t key = keys[i];
+    int64_t slot = unique_cpu_mix((uint64_t)key) & mask;
+    while (true) {
+      int64_t prev =
+          atomic_cas_int64_cpu(&table_keys[slot], UNIQUE_CPU_EMPTY_KEY, key);
+      if (prev == UNIQUE_CPU_EMPTY_KEY || prev == key) break;
+      slot = (slot + 1) & mask;
+    }
+    unique_cpu_atomic_min(&table_vals[slot], i);
+    slots[i] = slot;
+  }
+
+  first.resize(n);
+#pragma omp parallel for
+  for (int i = 0; i < n; i++) first[i] = table_vals[slots[i]];
+}
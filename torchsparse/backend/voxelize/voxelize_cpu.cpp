@@ -1,43 +1,171 @@
 #include "voxelize_cpu.h"
 
-#include <torch/torch.h>
+#include <ATen/OpMathType.h>
+#include <torch/extension.h>
 
+#include <algorithm>
 #include <vector>
 
+#include "../utils/segment_cpu.h"
+
+// inputs (N, c), idx (N,), counts (N1,) -> out (N1, c): per-voxel mean.
+// Points are bucketed by voxel first, then every voxel reduces its own
+// segment of contiguous channel vectors.
 at::Tensor voxelize_forward_cpu(const at::Tensor inputs, const at::Tensor idx,
                                 const at::Tensor counts) {
   int N = inputs.size(0);
   int c = inputs.size(1);
   int N1 = counts.size(0);
-  at::Tensor out = torch::zeros(
-      {N1, c}, at::device(idx.device()).dtype(at::ScalarType::Float));
-  for (int i = 0; i < N; i++) {
-    int pos = *(idx.data_ptr<int>() + i);
-    if (*(counts.data_ptr<int>() + pos) == 0) continue;
-#pragma omp parallel for
-    for (int j = 0; j < c; j++) {
-      *(out.data_ptr<float>() + pos * c + j) +=
-          *(inputs.data_ptr<float>() + i * c + j) /
-          (float)(*(counts.data_ptr<int>() + pos));
-    }
-  }
+  at::Tensor _inputs = inputs.contiguous();
+  at::Tensor _idx = idx.contiguous();
+  at::Tensor _counts = counts.contiguous();
+  at::Tensor out = torch::zeros({N1, c}, _inputs.options());
+  const int *idx_ = _idx.data_ptr<int>();
+  const int *counts_ = _counts.data_ptr<int>();
+
+  std::vector<int> seg_ptr, seg_rows;
+  build_segments_cpu(
+      N, N1, [&](int i) { return idx_[i] < N1 ? idx_[i] : -1; }, seg_ptr,
+      seg_rows);
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _inputs.scalar_type(),
+      "voxelize_forward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *inputs_ = _inputs.data_ptr<scalar_t>();
+        scalar_t *out_ = out.data_ptr<scalar_t>();
+        _Pragma("omp parallel")
+        {
+          std::vector<acc_t> acc(c);
+          _Pragma("omp for schedule(static)")
+          for (int v = 0; v < N1; v++) {
+            if (counts_[v] == 0 || seg_ptr[v] == seg_ptr[v + 1]) continue;
+            std::fill(acc.begin(), acc.end(), (acc_t)0);
+            for (int s = seg_ptr[v]; s < seg_ptr[v + 1]; s++) {
+              const scalar_t *src = inputs_ + (int64_t)seg_rows[s] * c;
+              for (int j = 0; j < c; j++) acc[j] += src[j];
+            }
+            acc_t inv_count = (acc_t)1 / (acc_t)counts_[v];
+            scalar_t *dst = out_ + (int64_t)v * c;
+            for (int j = 0; j < c; j++) dst[j] = acc[j] * inv_count;
+          }
+        }
+      }));
   return out;
 }
 
+// top_grad (N1, c), idx (N,), counts (N1,) -> bottom_grad (N, c).
+// Every point reads the gradient of its own voxel, so the loop is a plain
+// row gather.
 at::Tensor voxelize_backward_cpu(const at::Tensor top_grad,
                                  const at::Tensor idx, const at::Tensor counts,
                                  const int N) {
   int c = top_grad.size(1);
-  at::Tensor bottom_grad = torch::zeros(
-      {N, c}, at::device(idx.device()).dtype(at::ScalarType::Float));
-  for (int i = 0; i < N; i++) {
-    if (*(counts.data_ptr<int>() + *(idx.data_ptr<int>() + i)) == 0) continue;
-#pragma omp parallel for
-    for (int j = 0; j < c; j++) {
-      *(bottom_grad.data_ptr<float>() + i * c + j) =
-          *(top_grad.data_ptr<float>() + *(idx.data_ptr<int>() + i) * c + j) /
-          (float)(*(counts.data_ptr<int>() + *(idx.data_ptr<int>() + i)));
-    }
-  }
+  at::Tensor _top_grad = top_grad.contiguous();
+  at::Tensor _idx = idx.contiguous();
+  at::Tensor _counts = counts.contiguous();
+  at::Tensor bottom_grad = torch::zeros({N, c}, _top_grad.options());
+  const int *idx_ = _idx.data_ptr<int>();
+  const int *counts_ = _counts.data_ptr<int>();
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _top_grad.scalar_type(),
+      "voxelize_backward_cpu", ([&] {
+        using acc_t = at::opmath_type<scalar_t>;
+        const scalar_t *top_grad_ = _top_grad.data_ptr<scalar_t>();
+        scalar_t *bottom_grad_ = bottom_grad.data_ptr<scalar_t>();
+        _Pragma("omp parallel for")
+        for (int i = 0; i < N; i++) {
+          int pos = idx_[i];
+          if (pos < 0 || counts_[pos] == 0) continue;
+          acc_t inv_count = (acc_t)1 / (acc_t)counts_[pos];
+          const scalar_t *src = top_grad_ + (int64_t)pos * c;
+          scalar_t *dst = bottom_grad_ + (int64_t)i * c;
+          for (int j = 0; j < c; j++) dst[j] = (acc_t)src[j] * inv_count;
+        }
+      }));
   return bottom_grad;
 }
+
+// Linear position of a (batch, x, y, z) coordinate in a (B, H, W, D) grid,
+// or -1 if it falls outside the grid.
+inline int64_t to_dense_position_cpu(const int *coords, const int *range) {
+  int64_t pos = 0;
+  for (int d = 0; d < 4; d++) {
+    if (coords[d] < 0 || coords[d] >= range[d]) return -1;
+    pos = pos * range[d] + coords[d];
+  }
+  return pos;
+}
+
+// inputs (N, c), idx (N, 4), range (4,) -> outputs (B, H, W, D, c), or
+// (B, c, H, W, D) if channel_first. outputs must be preallocated (zeros);
+// points are scattered straight into it.
+void to_dense_forward_cpu(const at::Tensor inputs, const at::Tensor idx,
+                          const at::Tensor range, at::Tensor outputs,
+                          const bool channel_first) {
+  int N = inputs.size(0);
+  int c = inputs.size(1);
+  at::Tensor _inputs = inputs.contiguous();
+  at::Tensor _idx = idx.contiguous();
+  at::Tensor _range = range.contiguous();
+  const int *idx_ = _idx.data_ptr<int>();
+  const int *range_ = _range.data_ptr<int>();
+  const int64_t volume = (int64_t)range_[1] * range_[2] * range_[3];
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _inputs.scalar_type(),
+      "to_dense_forward_cpu", ([&] {
+        const scalar_t *inputs_ = _inputs.data_ptr<scalar_t>();
+        scalar_t *outputs_ = outputs.data_ptr<scalar_t>();
+        _Pragma("omp parallel for")
+        for (int i = 0; i < N; i++) {
+          int64_t pos = to_dense_position_cpu(idx_ + (int64_t)i * 4, range_);
+          if (pos < 0) continue;
+          const scalar_t *src = inputs_ + (int64_t)i * c;
+          if (!channel_first) {
+            std::copy(src, src + c, outputs_ + pos * c);
+          } else {
+            int64_t b = idx_[(int64_t)i * 4];
+            scalar_t *dst = outputs_ + b * c * volume + (pos - b * volume);
+            for (int j = 0; j < c; j++) dst[j * volume] = src[j];
+          }
+        }
+      }));
+}
+
+// top_grad (B, H, W, D, c) or (B, c, H, W, D), idx (N, 4), range (4,) ->
+// bottom_grad (N, c): every point gathers the gradient at its own cell.
+void to_dense_backward_cpu(const at::Tensor top_grad, const at::Tensor idx,
+                           const at::Tensor range, at::Tensor bottom_grad,
+                           const bool channel_first) {
+  int N = bottom_grad.size(0);
+  int c = bottom_grad.size(1);
+  at::Tensor _top_grad = top_grad.contiguous();
+  at::Tensor _idx = idx.contiguous();
+  at::Tensor _range = range.contiguous();
+  const int *idx_ = _idx.data_ptr<int>();
+  const int *range_ = _range.data_ptr<int>();
+  const int64_t volume = (int64_t)range_[1] * range_[2] * range_[3];
+
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, _top_grad.scalar_type(),
+      "to_dense_backward_cpu", ([&] {
+        const scalar_t *top_grad_ = _top_grad.data_ptr<scalar_t>();
+        scalar_t *bottom_grad_ = bottom_grad.data_ptr<scalar_t>();
+        _Pragma("omp parallel for")
+        for (int i = 0; i < N; i++) {
+          int64_t pos = to_dense_position_cpu(idx_ + (int64_t)i * 4, range_);
+          if (pos < 0) continue;
+          scalar_t *dst = bottom_grad_ + (int64_t)i * c;
+          if (!channel_first) {
+            const scalar_t *src = top_grad_ + pos * c;
+            std::copy(src, src + c, dst);
+          } else {
+            int64_t b = idx_[(int64_t)i * 4];
+            const scalar_t *src = top_grad_ + b * c * volume + (pos - b * volume);
+            for (int j = 0; j < c; j++) dst[j] = src[j * volume];
+          }
+        }
+      }));
+}
@@ -119,8 +119,8 @@ void to_dense_forward_cuda(const at::Tensor inputs, const at::Tensor idx,
   int N = inputs.size(0);
   int c = inputs.size(1);
 
-  AT_DISPATCH_FLOATING_TYPES_AND_HALF(
-      inputs.scalar_type(), "to_dense_forward_cuda", ([&]
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, inputs.scalar_type(), "to_dense_forward_cuda", ([&]
                                                { to_dense_forward_kernel<scalar_t><<<(N * c + 255) / 256, 256>>>(
                                                      N, c, inputs.data_ptr<scalar_t>(), idx.data_ptr<int>(),
                                                      range.data_ptr<int>(), outputs.data_ptr<scalar_t>()); }));
@@ -133,8 +133,8 @@ void to_dense_backward_cuda(const at::Tensor top_grad,
   int N = bottom_grad.size(0);
   int c = bottom_grad.size(1);
 
-  AT_DISPATCH_FLOATING_TYPES_AND_HALF(
-      top_grad.scalar_type(), "to_dense_backward_cuda", ([&]
+  AT_DISPATCH_FLOATING_TYPES_AND2(
+      at::ScalarType::Half, at::ScalarType::BFloat16, top_grad.scalar_type(), "to_dense_backward_cuda", ([&]
                                                   { to_dense_backward_kernel<scalar_t><<<(N * c + 255) / 256, 256>>>(
                                                         N, c, top_grad.data_ptr<scalar_t>(), idx.data_ptr<int>(),
                                                         range.data_ptr<int>(), bottom_grad.data_ptr<scalar_t>()); }));
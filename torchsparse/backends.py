@@ -1,11 +1,74 @@
+import functools
+from typing import Optional, Union
+
 import torch
 
+__all__ = ["init", "get_device_capability", "get_allow_tf32", "get_allow_fp16"]
+
+# allow_tf32, allow_fp16 and device_capability are resolved on first access
+# (see __getattr__), so importing torchsparse never touches the CUDA runtime.
+# Assigning any of them overrides the per-device default.
+_lazy_attributes = ("device_capability", "allow_tf32", "allow_fp16")
+
 
 def init():
-    global benchmark, allow_tf32, allow_fp16, device_capability, hash_rsv_ratio
+    global benchmark, hash_rsv_ratio
     benchmark = False
-    device_capability = torch.cuda.get_device_capability()
-    device_capability = device_capability[0] * 100 + device_capability[1] * 10
-    allow_tf32 = device_capability >= 800
-    allow_fp16 = device_capability >= 750
     hash_rsv_ratio = 2  # default value, reserve 2x ( 2 * original_point_number) space for downsampling
+    for name in _lazy_attributes:
+        globals().pop(name, None)
+    _get_device_capability.cache_clear()
+
+
+def _get_device_index(device: Optional[Union[int, str, torch.device]]) -> int:
+    if device is None:
+        return torch.cuda.current_device()
+    device = torch.device(device) if not isinstance(device, int) else device
+    if isinstance(device, torch.device):
+        if device.type != "cuda":
+            return -1
+        return device.index if device.index is not None else torch.cuda.current_device()
+    return device
+
+
+@functools.lru_cache()
+def _get_device_capability(index: int) -> int:
+    if index < 0:
+        return 0
+    device_capability = torch.cuda.get_device_capability(index)
+    return device_capability[0] * 100 + device_capability[1] * 10
+
+
+def get_device_capability(
+    device: Optional[Union[int, str, torch.device]] = None
+) -> int:
+    if "device_capability" in globals():
+        return globals()["device_capability"]
+    if not torch.cuda.is_available():
+        return 0
+    return _get_device_capability(_get_device_index(device))
+
+
+def get_allow_tf32(device: Optional[Union[int, str, torch.device]] = None) -> bool:
+    if "allow_tf32" in globals():
+        return globals()["allow_tf32"]
+    return get_device_capability(device) >= 800
+
+
+def get_allow_fp16(device: Optional[Union[int, str, torch.device]] = None) -> bool:
+    if "allow_fp16" in globals():
+        return globals()["allow_fp16"]
+    return get_device_capability(device) >= 750
+
+
+def __getattr__(name: str):
+    if name == "device_capability":
+        return get_device_capability()
+    if name == "allow_tf32":
+        return get_allow_tf32()
+    if name == "allow_fp16":
+        return get_allow_fp16()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+init()
@@ -4,6 +4,8 @@ from .count import *
 from .crop import *
 from .devoxelize import *
 from .hash import *
+from .norm import *
 from .pooling import *
 from .query import *
+from .segment import *
 from .voxelize import *
@@ -3,5 +3,7 @@ from .conv_mode import *
 
 # from .conv_config import *
 from .conv_config import Dataflow
+from .func import expand_grouped_weight
 from .hash import *
 from .kmap import *
+from .incremental import *
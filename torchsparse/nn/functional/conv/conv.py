@@ -24,7 +24,21 @@ def conv3d(
     transposed: bool = False,
     generative: bool = False,
     training: bool = False,
+    groups: int = 1,
 ) -> SparseTensor:
+    r"""
+    sparse 3D convolution. weight is (K, Cin / groups, Cout), or
+    (Cin / groups, Cout) for 1x1x1 kernels with unit stride; with groups > 1,
+    output channels [g * Cout / groups, (g + 1) * Cout / groups) only read
+    input channels [g * Cin / groups, (g + 1) * Cin / groups), through
+    weight[..., g * Cout / groups : (g + 1) * Cout / groups]. A PyTorch
+    nn.Conv3d weight (Cout, Cin / groups, kD, kH, kW) converts to this layout
+    by moving Cout last and flattening the kernel offsets. An
+    nn.ConvTranspose3d weight (Cin, Cout / groups, kD, kH, kW), for
+    transposed=True, converts with w.view(groups, Cin / groups, Cout / groups,
+    K).permute(3, 1, 0, 2).reshape(K, Cin / groups, Cout), which concatenates
+    the groups along the output channels.
+    """
     from torchsparse.nn import functional as F
 
     feats, coords = input.feats, input.coords
@@ -33,18 +47,11 @@ def conv3d(
     stride = make_ntuple(stride, ndim=3)
     dilation = make_ntuple(dilation, ndim=3)
 
-    conv_mode = F.get_conv_mode()
-    if config is None:
-        config = F.conv_config.get_global_conv_config()
-        if config is None:
-            config = F.conv_config.get_default_conv_config(
-                conv_mode=conv_mode, training=training
-            )
+    config, kmap_mode = _get_conv_config(config, coords.device, training)
 
     # TODO: Deal with kernel volume > 32. (Split mask or unsort)
 
     dataflow = config.dataflow
-    kmap_mode = config.kmap_mode
 
     if dataflow == F.Dataflow.ImplicitGEMM:
         ConvolutionFunction = ImplicitGEMMConvolutionFuntion
@@ -54,6 +61,9 @@ def conv3d(
     elif dataflow == F.Dataflow.FetchOnDemand:
         ConvolutionFunction = FetchOnDemandConvolutionFuntion
         config.ifsort = False
+    elif dataflow == F.Dataflow.TorchNative:
+        ConvolutionFunction = TorchNativeConvolutionFuntion
+        config.ifsort = False
     elif (
         dataflow == F.Dataflow.CodedCSR
     ):  # Placeholder for PCEngine integration. Mode name can be modified.
@@ -62,7 +72,19 @@ def conv3d(
     else:
         raise ValueError("unsupported dataflow: {}".format(dataflow))
 
+    conv_args = ()
+    if groups > 1:
+        if dataflow == F.Dataflow.TorchNative or (
+            dataflow == F.Dataflow.GatherScatter and feats.device.type == "cpu"
+        ):
+            conv_args = (groups,)
+        else:
+            # no native support: block-diagonal dense kernel, same maps
+            weight = expand_grouped_weight(weight, groups)
+
     if kernel_size == (1, 1, 1) and stride == (1, 1, 1) and dilation == (1, 1, 1):
+        if conv_args:
+            weight = expand_grouped_weight(weight, groups)
         feats = feats.matmul(weight)
         if bias is not None:
             feats += bias
@@ -73,44 +95,9 @@ def conv3d(
             spatial_range=input.spatial_range,
         )
     elif not transposed:
-        kmap = input._caches.kmaps.get((input.stride, kernel_size, stride, dilation))
-
-        if kmap_mode != "hashmap_on_the_fly":
-            hashmap = input._caches.hashmaps.get(input.stride)
-        else:
-            hashmap = input._caches.hashmaps.get(
-                tuple(input.stride[k] * stride[k] for k in range(3))
-            )
-        if hashmap is None:
-            hashmap_keys, hashmap_vals = None, None
-        else:
-            hashmap_keys, hashmap_vals = hashmap
-
-        spatial_range = input.spatial_range
-
-        if kmap is None:
-            kmap = F.build_kernel_map(
-                coords,
-                feats.shape[0],
-                kernel_size,
-                stride,
-                padding,
-                hashmap_keys,
-                hashmap_vals,
-                spatial_range,
-                kmap_mode,
-                dataflow,
-                downsample_mode=config.downsample_mode,
-                training=training,
-                ifsort=config.ifsort,
-                split_mask_num=config.split_mask_num,
-                split_mask_num_bwd=config.split_mask_num_bwd,
-            )
-
-            hashmap = [kmap["hashmap_keys"], kmap["hashmap_vals"]]
-
-            input._caches.kmaps[(input.stride, kernel_size, stride, dilation)] = kmap
-            input._caches.hashmaps[input.stride] = hashmap
+        kmap = _get_kernel_map(
+            input, kernel_size, stride, padding, dilation, config, kmap_mode, training
+        )
 
         feats = ConvolutionFunction.apply(
             feats,
@@ -118,6 +105,7 @@ def conv3d(
             kmap,
             config,
             transposed,
+            *conv_args,
         )
 
         if bias is not None:
@@ -131,16 +119,15 @@ def conv3d(
     else:
         tensor_stride = tuple(input.stride[k] // stride[k] for k in range(3))
         if not generative:
-            kmap = input._caches.kmaps.get(
-                (tensor_stride, kernel_size, stride, dilation)
-            )
-
-            kmap = F.transpose_kernel_map(
-                kmap,
-                config.ifsort,
-                training=training,
-                split_mask_num=config.split_mask_num,
-                split_mask_num_bwd=config.split_mask_num_bwd,
+            kmap = _get_transposed_kernel_map(
+                input,
+                kernel_size,
+                stride,
+                padding,
+                dilation,
+                config,
+                kmap_mode,
+                training,
             )
 
             feats = ConvolutionFunction.apply(
@@ -149,6 +136,7 @@ def conv3d(
                 kmap,
                 config,
                 transposed,
+                *conv_args,
             )
 
             if bias is not None:
@@ -178,6 +166,7 @@ def conv3d(
                 training=training,
                 ifsort=config.ifsort,
                 generative=generative,
+                kmap_format=config.kmap_format,
             )
             # generate output: logically forced to be not transposed
             feats = ConvolutionFunction.apply(
@@ -186,6 +175,7 @@ def conv3d(
                 kmap,
                 config,
                 False,
+                *conv_args,
             )
             if bias is not None:
                 feats += bias
@@ -200,11 +190,136 @@ def conv3d(
                 spatial_range=input._caches.cmaps[tensor_stride][1],
             )
             hashmap = [kmap["hashmap_keys"], kmap["hashmap_vals"]]
-            input._caches.kmaps = dict()  # new_kmap
-            input._caches.hashmaps = dict()
+            input._caches.kmaps.clear()  # new_kmap
+            input._caches.hashmaps.clear()
 
     output._caches = input._caches
     output._caches.cmaps.setdefault(
         output.stride, (output.coords, output.spatial_range)
     )
     return output
+
+
+def _get_kernel_map(
+    input: SparseTensor,
+    kernel_size: Tuple[int, ...],
+    stride: Tuple[int, ...],
+    padding: Union[int, Tuple[int, ...]],
+    dilation: Tuple[int, ...],
+    config: Dict,
+    kmap_mode: str,
+    training: bool = False,
+) -> Dict:
+    # kernel map from input to its (strided) output, from the tensor cache
+    # or built and cached; shared by convolution and pooling layers
+    from torchsparse.nn import functional as F
+
+    kmap = input._caches.kmaps.get((input.stride, kernel_size, stride, dilation))
+
+    if kmap_mode != "hashmap_on_the_fly":
+        hashmap = input._caches.hashmaps.get(input.stride)
+    else:
+        hashmap = input._caches.hashmaps.get(
+            tuple(input.stride[k] * stride[k] for k in range(3))
+        )
+    if hashmap is None:
+        hashmap_keys, hashmap_vals = None, None
+    else:
+        hashmap_keys, hashmap_vals = hashmap
+
+    spatial_range = input.spatial_range
+
+    if kmap is None:
+        kmap = F.build_kernel_map(
+            input.coords,
+            input.feats.shape[0],
+            kernel_size,
+            stride,
+            padding,
+            hashmap_keys,
+            hashmap_vals,
+            spatial_range,
+            kmap_mode,
+            config.dataflow,
+            downsample_mode=config.downsample_mode,
+            training=training,
+            ifsort=config.ifsort,
+            split_mask_num=config.split_mask_num,
+            split_mask_num_bwd=config.split_mask_num_bwd,
+            kmap_format=config.kmap_format,
+            curve=input._caches.curve,
+        )
+
+        hashmap = [kmap["hashmap_keys"], kmap["hashmap_vals"]]
+
+        input._caches.kmaps[(input.stride, kernel_size, stride, dilation)] = kmap
+        input._caches.hashmaps[input.stride] = hashmap
+    return kmap
+
+
+def _get_conv_config(config: Dict, device: torch.device, training: bool = False):
+    # the given config, else the global or default one, and the kmap mode
+    # to use on device
+    from torchsparse.nn import functional as F
+
+    if config is None:
+        config = F.conv_config.get_global_conv_config()
+        if config is None:
+            config = F.conv_config.get_default_conv_config(
+                conv_mode=F.get_conv_mode(), training=training
+            )
+    kmap_mode = config.kmap_mode
+    if kmap_mode == "hashmap_on_the_fly" and device.type != "cuda":
+        # on-the-fly kernel map builders are CUDA-only
+        kmap_mode = "hashmap"
+    return config, kmap_mode
+
+
+def _get_transposed_kernel_map(
+    input: SparseTensor,
+    kernel_size: Tuple[int, ...],
+    stride: Tuple[int, ...],
+    padding: Union[int, Tuple[int, ...]],
+    dilation: Tuple[int, ...],
+    config: Dict,
+    kmap_mode: str,
+    training: bool = False,
+) -> Dict:
+    # transposed kernel map back to the cached coordinates of the finer
+    # stride, from the map of the downsampling layer
+    from torchsparse.nn import functional as F
+
+    tensor_stride = tuple(input.stride[k] // stride[k] for k in range(3))
+    kmap = input._caches.kmaps.get((tensor_stride, kernel_size, stride, dilation))
+    if kmap is None:
+        # evicted from the tensor cache: rebuild the downsampling map
+        # from the cached coordinates of the target stride
+        kmap = F.build_kernel_map(
+            input._caches.cmaps[tensor_stride][0],
+            input._caches.cmaps[tensor_stride][0].shape[0],
+            kernel_size,
+            stride,
+            padding,
+            None,
+            None,
+            input._caches.cmaps[tensor_stride][1],
+            kmap_mode,
+            config.dataflow,
+            downsample_mode=config.downsample_mode,
+            training=training,
+            ifsort=config.ifsort,
+            split_mask_num=config.split_mask_num,
+            split_mask_num_bwd=config.split_mask_num_bwd,
+            kmap_format=config.kmap_format,
+            curve=input._caches.curve,
+        )
+        input._caches.kmaps[(tensor_stride, kernel_size, stride, dilation)] = kmap
+
+    kmap = F.transpose_kernel_map(
+        kmap,
+        config.ifsort,
+        training=training,
+        split_mask_num=config.split_mask_num,
+        split_mask_num_bwd=config.split_mask_num_bwd,
+    )
+    return kmap
@@ -9,6 +9,7 @@ class Dataflow(Enum):
     GatherScatter = 1
     FetchOnDemand = 2
     CodedCSR = 3
+    TorchNative = 4
 
 
 _global_conv_config = None
@@ -23,6 +24,8 @@ _default_conv_config = AttributeDict(
         ("epsilon", 0.0),
         ("mm_thresh", 0),
         ("FOD_fusion", True),
+        # "dense" or "compact" (CPU kernel maps, see compact_kernel_map)
+        ("kmap_format", "dense"),
     ]
 )
 
@@ -56,6 +59,9 @@ def keys_check(conv_config):
     if "FOD_fusion" not in conv_config:
         flag = True
         conv_config["FOD_fusion"] = _default_conv_config["FOD_fusion"]
+    if "kmap_format" not in conv_config:
+        flag = True
+        conv_config["kmap_format"] = _default_conv_config["kmap_format"]
     if flag == True:
         print(
             "Warning: Missing fields for ConvConfig. Use default configs for these fields."
@@ -1,3 +1,4 @@
 from .gather_scatter import *
 from .implicit_gemm import *
 from .fetch_on_demand import *
+from .torch_native import *
@@ -86,8 +86,8 @@ class FetchOnDemandConvolutionFuntion(Function):
                     sizes[1] if not transposed else sizes[0],
                     qmapsize,
                     transposed,
-                    torchsparse.backends.allow_tf32,
-                    torchsparse.backends.allow_fp16,
+                    torchsparse.backends.get_allow_tf32(input.device),
+                    torchsparse.backends.get_allow_fp16(input.device),
                 )
             else:
                 output = (
@@ -99,8 +99,8 @@ class FetchOnDemandConvolutionFuntion(Function):
                         mapsize,
                         sizes[1] if not transposed else sizes[0],
                         transposed,
-                        torchsparse.backends.allow_tf32,
-                        torchsparse.backends.allow_fp16,
+                        torchsparse.backends.get_allow_tf32(input.device),
+                        torchsparse.backends.get_allow_fp16(input.device),
                     )
                 )
 
@@ -108,6 +108,7 @@ class FetchOnDemandConvolutionFuntion(Function):
             raise NotImplementedError
 
         ctx.for_backwards = (input, weight, nbmaps, nbsizes, transposed)
+        ctx.submanifold = kmap.get("submanifold", False)
         return output.to(weight.dtype)
 
     @staticmethod
@@ -145,6 +146,8 @@ class FetchOnDemandConvolutionFuntion(Function):
                 nbmaps,
                 nbsizes.cpu(),
                 transposed,
+                1,
+                ctx.submanifold,
             )
         else:
             raise NotImplementedError
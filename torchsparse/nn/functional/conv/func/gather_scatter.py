@@ -7,12 +7,30 @@ from torch.autograd import Function
 
 import torchsparse
 import torchsparse.backend
+from torchsparse.utils.tensor_cache import resize_cached_kmap
+
+from .torch_native import conv_backward_torch_native, conv_forward_torch_native
 
 buffer = torch.Tensor()
 
 __all__ = ["GatherScatterConvolutionFuntion"]
 
 
+def _derive_compact_maps(kmap: Dict) -> Dict:
+    # compact kmaps (see compact_kernel_map) keep no neighbor lists; they
+    # are derived for this call only and released with its autograd graph
+    from torchsparse.nn import functional as F
+    from ..kmap.func import derive_gather_scatter_maps
+
+    return derive_gather_scatter_maps(
+        {
+            "out_in_map": F.decode_out_in_map(kmap["out_in_map"]),
+            "sizes": kmap["sizes"],
+            "symmetric": kmap.get("symmetric", False),
+        }
+    )
+
+
 class GatherScatterConvolutionFuntion(Function):  # TorchSparse_v2
     @staticmethod
     # @custom_fwd(cast_inputs=torch.half)
@@ -23,7 +41,12 @@ class GatherScatterConvolutionFuntion(Function):  # TorchSparse_v2
         kmap: Dict,
         config: Dict,
         transposed: bool = False,
+        groups: int = 1,
     ) -> torch.Tensor:
+        # the center offset is the identity map (see build_kernel_map)
+        submanifold = kmap.get("submanifold", False)
+        if kmap.get("kmap_format") == "compact":
+            kmap = _derive_compact_maps(kmap)
         nbmaps = kmap["nbmaps"]
         nbsizes = kmap["nbsizes"].cpu()
         sizes = kmap["sizes"]
@@ -61,10 +84,20 @@ class GatherScatterConvolutionFuntion(Function):  # TorchSparse_v2
                 )
 
         if input.device.type == "cuda":
+            assert groups == 1, "conv3d expands grouped weights on CUDA"
             if torch.float16 in [input.dtype, weight.dtype]:
                 input = input.to(torch.float16)
                 weight = weight.to(torch.float16)
 
+            if input_mask is None:
+                # kmaps built on the CPU (e.g. by DataLoader workers) have no masks
+                input_mask, output_mask = torchsparse.backend.build_mask_from_kmap(
+                    sizes[0], sizes[1], nbmaps, nbsizes[0 : sizes[1]].to(nbmaps.device)
+                )
+                kmap["input_mask"] = input_mask
+                kmap["output_mask"] = output_mask
+                resize_cached_kmap(kmap)
+
             output = torchsparse.backend.conv_forward_gather_scatter_cuda(
                 input,
                 weight,
@@ -81,24 +114,31 @@ class GatherScatterConvolutionFuntion(Function):  # TorchSparse_v2
             )
         elif input.device.type == "cpu":
             torchsparse.backend.conv_forward_gather_scatter_cpu(
-                input, output, weight, nbmaps, nbsizes.cpu(), transposed
+                input,
+                output,
+                weight,
+                nbmaps,
+                nbsizes.cpu(),
+                transposed,
+                groups,
+                submanifold,
             )
         else:
-            # use the native pytorch XLA APIs for the TPU.
-            cur_st = 0
-            for kernel_idx in range(weight.shape[0]):
-                cur_ed = cur_st + nbsizes[kernel_idx]
-                in_map = nbmaps[cur_st:cur_ed, 0].long()
-                out_map = nbmaps[cur_st:cur_ed, 1].long()
-                cur_st += nbsizes[kernel_idx]
-
-                if transposed:
-                    in_map, out_map = out_map, in_map
-
-                cur_feat = input[in_map]
-                cur_feat = torch.mm(cur_feat, weight[kernel_idx])
-                output[out_map] += cur_feat
+            # use the native pytorch APIs on other devices (e.g. XLA / MPS)
+            output = conv_forward_torch_native(
+                input,
+                weight,
+                nbmaps,
+                nbsizes,
+                sizes,
+                transposed,
+                groups,
+                submanifold,
+            )
         ctx.for_backwards = (input, weight, nbmaps, nbsizes, transposed)
+        ctx.sizes = sizes
+        ctx.groups = groups
+        ctx.submanifold = submanifold
         return output.to(weight.dtype)
 
     @staticmethod
@@ -133,13 +173,26 @@ class GatherScatterConvolutionFuntion(Function):  # TorchSparse_v2
                 nbmaps,
                 nbsizes.cpu(),
                 transposed,
+                ctx.groups,
+                ctx.submanifold,
             )
         else:
-            raise NotImplementedError
+            grad_input, grad_weight = conv_backward_torch_native(
+                grad_output.contiguous(),
+                input,
+                weight,
+                nbmaps,
+                nbsizes,
+                ctx.sizes,
+                transposed,
+                ctx.groups,
+                ctx.submanifold,
+            )
         return (
             grad_input,
             grad_weight,
             None,
             None,
             None,
+            None,
         )
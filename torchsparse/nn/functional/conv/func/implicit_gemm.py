@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Any, Dict, Optional, Union
 
 import torch
 from torch.autograd import Function
@@ -11,6 +11,67 @@ import torchsparse.backends
 
 __all__ = ["ImplicitGEMMConvolutionFuntion"]
 
+_Map = Union[torch.Tensor, Dict[str, Any]]
+
+
+def _forward_cpu(
+    input: torch.Tensor,
+    output: torch.Tensor,
+    weight: torch.Tensor,
+    out_in_map: _Map,
+    rows: Optional[torch.Tensor] = None,
+    active_masks: Optional[torch.Tensor] = None,
+) -> Optional[torch.Tensor]:
+    # writes the rows (all if None) of a zero-initialized output; out_in_map
+    # is dense or compact (see compact_out_in_map). A row comes out the same
+    # whichever rows are computed, given the active offsets of the tiles of
+    # the previous call (active_masks, filled without rows); returns the
+    # rows written if active_masks is given (see conv_forward_tiles_cpu)
+    if isinstance(out_in_map, dict):
+        return torchsparse.backend.conv_forward_implicit_gemm_compact_cpu(
+            input,
+            output,
+            weight,
+            out_in_map["masks"],
+            out_in_map["block_ptr"],
+            out_in_map["ranks"],
+            out_in_map["nbrs"],
+            out_in_map["bases"],
+            rows,
+            active_masks,
+        )
+    elif active_masks is not None:
+        return torchsparse.backend.conv_forward_implicit_gemm_rows_cpu(
+            input, output, weight, out_in_map, rows, active_masks
+        )
+    else:
+        torchsparse.backend.conv_forward_implicit_gemm_cpu(
+            input, output, weight, out_in_map
+        )
+
+
+def _wgrad_cpu(
+    input: torch.Tensor,
+    grad_output: torch.Tensor,
+    grad_weight: torch.Tensor,
+    out_in_map: _Map,
+) -> None:
+    if isinstance(out_in_map, dict):
+        torchsparse.backend.conv_backward_wgrad_implicit_gemm_compact_cpu(
+            input,
+            grad_output,
+            grad_weight,
+            out_in_map["masks"],
+            out_in_map["block_ptr"],
+            out_in_map["ranks"],
+            out_in_map["nbrs"],
+            out_in_map["bases"],
+        )
+    else:
+        torchsparse.backend.conv_backward_wgrad_implicit_gemm_cpu(
+            input, grad_output, grad_weight, out_in_map
+        )
+
 
 class ImplicitGEMMConvolutionFuntion(Function):  # TorchSparse++
     @staticmethod
@@ -29,38 +90,22 @@ class ImplicitGEMMConvolutionFuntion(Function):  # TorchSparse++
             reorder_out_in_map = kmap["reorder_out_in_map"]
             reduced_sorted_mask = kmap["reduced_sorted_mask"]
             reorder_loc = kmap["reorder_loc"]
-            out_in_map_bwd = kmap["out_in_map_bwd"]
-            reorder_out_in_map_bwd = kmap["reorder_out_in_map_bwd"]
-            reduced_sorted_mask_bwd_wgrad = kmap["reduced_sorted_mask_bwd_wgrad"]
-            reduced_sorted_mask_bwd_dgrad = kmap["reduced_sorted_mask_bwd_dgrad"]
-            reorder_loc_bwd = kmap["reorder_loc_bwd"]
         else:
             out_in_map = kmap["out_in_map_t"]
             reorder_out_in_map = kmap["reorder_out_in_map_t"]
             reduced_sorted_mask = kmap["reduced_sorted_mask_t"]
             reorder_loc = kmap["reorder_loc_t"]
-            out_in_map_bwd = kmap["out_in_map_bwd_t"]
-            reorder_out_in_map_bwd = kmap["reorder_out_in_map_bwd_t"]
-            reduced_sorted_mask_bwd_wgrad = kmap["reduced_sorted_mask_bwd_wgrad_t"]
-            reduced_sorted_mask_bwd_dgrad = kmap["reduced_sorted_mask_bwd_dgrad_t"]
-            reorder_loc_bwd = kmap["reorder_loc_bwd_t"]
 
         ifsort = config["ifsort"]
 
         input = input.contiguous()
         weight = weight.contiguous()
-        if input.device.type != "cuda":
-            if not transposed:
-                output = torch.zeros(
-                    sizes[1], weight.size(-1), dtype=input.dtype, device=input.device
-                )
-            else:
-                # TODO(Haotian): ensure the original, upsampled size to be the same.
-                output = torch.zeros(
-                    sizes[0], weight.size(-1), dtype=input.dtype, device=input.device
-                )
 
         if input.device.type == "cuda":
+            from torchsparse.nn import functional as F
+
+            # compact maps of CPU kmaps moved to the GPU
+            out_in_map = F.decode_out_in_map(out_in_map)
             if torch.float16 in [input.dtype, weight.dtype]:
                 input = input.to(torch.float16)
                 weight = weight.to(torch.float16)
@@ -69,15 +114,16 @@ class ImplicitGEMMConvolutionFuntion(Function):  # TorchSparse++
             num_out_feats = sizes[1] if not transposed else sizes[0]
             num_out_channels = weight.shape[-1]
 
-            if not ifsort:
+            # kmaps built on the CPU (e.g. by DataLoader workers) are unsorted
+            if not ifsort or reorder_out_in_map is None:
                 output = torchsparse.backend.conv_forward_implicit_gemm_cuda(
                     input,
                     weight,
                     out_in_map,
                     num_out_feats,
                     num_out_channels,
-                    torchsparse.backends.allow_tf32,
-                    torchsparse.backends.allow_fp16,
+                    torchsparse.backends.get_allow_tf32(input.device),
+                    torchsparse.backends.get_allow_fp16(input.device),
                 )
             else:
                 output = torchsparse.backend.conv_forward_implicit_gemm_sorted_cuda(
@@ -88,36 +134,38 @@ class ImplicitGEMMConvolutionFuntion(Function):  # TorchSparse++
                     reorder_loc,
                     num_out_feats,
                     num_out_channels,
-                    torchsparse.backends.allow_tf32,
-                    torchsparse.backends.allow_fp16,
+                    torchsparse.backends.get_allow_tf32(input.device),
+                    torchsparse.backends.get_allow_fp16(input.device),
                 )
+        elif input.device.type == "cpu":
+            if input.dtype != weight.dtype:
+                input = input.to(weight.dtype)
+            # TODO(Haotian): ensure the original, upsampled size to be the same.
+            num_out_feats = sizes[1] if not transposed else sizes[0]
+            output = torch.zeros(
+                num_out_feats, weight.size(-1), dtype=weight.dtype, device=input.device
+            )
+            _forward_cpu(input, output, weight, out_in_map)
         else:
             raise NotImplementedError
-        ctx.for_backwards = (
-            input,
-            weight,
-            out_in_map_bwd,
-            reorder_out_in_map_bwd,
-            reduced_sorted_mask_bwd_wgrad,
-            reduced_sorted_mask_bwd_dgrad,
-            reorder_loc_bwd,
-            transposed,
-        )
+        # backward-only kmap structures are built in backward, on demand
+        ctx.for_backwards = (input, weight, out_in_map, kmap, transposed)
         return output.to(weight.dtype)
 
     @staticmethod
     # @custom_bwd
     def backward(ctx, grad_output: torch.Tensor):
-        (
-            input,
-            weight,
-            out_in_map_bwd,
-            reorder_out_in_map_bwd,
-            reduced_sorted_mask_bwd_wgrad,
-            reduced_sorted_mask_bwd_dgrad,
-            reorder_loc_bwd,
-            transposed,
-        ) = ctx.for_backwards
+        from torchsparse.nn import functional as F
+
+        input, weight, out_in_map, kmap, transposed = ctx.for_backwards
+
+        kmap = F.build_kernel_map_bwd(kmap, transposed)
+        suffix = "_t" if transposed else ""
+        out_in_map_bwd = kmap["out_in_map_bwd" + suffix]
+        reorder_out_in_map_bwd = kmap["reorder_out_in_map_bwd" + suffix]
+        reduced_sorted_mask_bwd_wgrad = kmap["reduced_sorted_mask_bwd_wgrad" + suffix]
+        reduced_sorted_mask_bwd_dgrad = kmap["reduced_sorted_mask_bwd_dgrad" + suffix]
+        reorder_loc_bwd = kmap["reorder_loc_bwd" + suffix]
 
         grad_output = grad_output.contiguous()
 
@@ -127,6 +175,7 @@ class ImplicitGEMMConvolutionFuntion(Function):  # TorchSparse++
         kernel_volume, ic, oc = weight.size()
 
         if grad_output.device.type == "cuda":
+            out_in_map_bwd = F.decode_out_in_map(out_in_map_bwd)
             if kernel_volume < 32:  # sort mode
                 # dgrad
                 grad_input = torchsparse.backend.conv_forward_implicit_gemm_sorted_cuda(
@@ -137,8 +186,8 @@ class ImplicitGEMMConvolutionFuntion(Function):  # TorchSparse++
                     reorder_loc_bwd,
                     input.size(0),
                     input.size(1),
-                    torchsparse.backends.allow_tf32,
-                    torchsparse.backends.allow_fp16,
+                    torchsparse.backends.get_allow_tf32(grad_output.device),
+                    torchsparse.backends.get_allow_fp16(grad_output.device),
                 )
 
                 # wgrad
@@ -151,8 +200,8 @@ class ImplicitGEMMConvolutionFuntion(Function):  # TorchSparse++
                             reduced_sorted_mask_bwd_wgrad,
                             reorder_loc_bwd,
                             32,
-                            torchsparse.backends.allow_tf32,
-                            torchsparse.backends.allow_fp16,
+                            torchsparse.backends.get_allow_tf32(grad_output.device),
+                            torchsparse.backends.get_allow_fp16(grad_output.device),
                         )
                     )
                     .reshape(kernel_volume, oc, ic)
@@ -168,8 +217,8 @@ class ImplicitGEMMConvolutionFuntion(Function):  # TorchSparse++
                     out_in_map_bwd,
                     input.size(0),
                     input.size(1),
-                    torchsparse.backends.allow_tf32,
-                    torchsparse.backends.allow_fp16,
+                    torchsparse.backends.get_allow_tf32(grad_output.device),
+                    torchsparse.backends.get_allow_fp16(grad_output.device),
                 )
 
                 # wgrad
@@ -180,14 +229,27 @@ class ImplicitGEMMConvolutionFuntion(Function):  # TorchSparse++
                             input,
                             out_in_map_bwd,
                             32,
-                            torchsparse.backends.allow_tf32,
-                            torchsparse.backends.allow_fp16,
+                            torchsparse.backends.get_allow_tf32(grad_output.device),
+                            torchsparse.backends.get_allow_fp16(grad_output.device),
                         )
                     )
                     .reshape(kernel_volume, oc, ic)
                     .transpose(2, 1)
                     .contiguous()
                 )
+        elif grad_output.device.type == "cpu":
+            # dgrad: gather through the transposed map, no write conflicts
+            grad_input = torch.zeros_like(input)
+            _forward_cpu(
+                grad_output,
+                grad_input,
+                weight.transpose(2, 1).contiguous(),
+                out_in_map_bwd,
+            )
+
+            # wgrad
+            grad_weight = torch.zeros_like(weight)
+            _wgrad_cpu(input, grad_output, grad_weight, out_in_map)
         else:
             raise NotImplementedError
         return (grad_input, grad_weight, None, None, None)
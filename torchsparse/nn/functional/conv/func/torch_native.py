@@ -0,0 +1,251 @@
+from typing import Dict, Tuple
+
+import torch
+from torch.autograd import Function
+
+__all__ = [
+    "TorchNativeConvolutionFuntion",
+    "conv_forward_torch_native",
+    "conv_backward_torch_native",
+    "expand_grouped_weight",
+]
+
+
+def _get_groups(
+    nbmaps: torch.Tensor, nbsizes: torch.Tensor, transposed: bool, skip_center: bool
+) -> Tuple[torch.Tensor, ...]:
+    # rows of all kernel offsets are laid out in one padded (K, max_n) grid,
+    # so that a single batched GEMM covers every offset
+    kernel_volume = nbsizes.shape[0]
+    nbsizes = nbsizes.cpu().long()
+    if skip_center:
+        # the center offset of a submanifold convolution is the identity map
+        starts = torch.cumsum(nbsizes, 0) - nbsizes
+        center = kernel_volume // 2
+        keep = torch.ones(nbmaps.shape[0], dtype=torch.bool)
+        keep[int(starts[center]) : int(starts[center] + nbsizes[center])] = False
+        nbmaps = nbmaps[keep.to(nbmaps.device)]
+        nbsizes = nbsizes.clone()
+        nbsizes[center] = 0
+
+    device = nbmaps.device
+    max_size = int(nbsizes.max()) if kernel_volume > 0 else 0
+    offsets = torch.repeat_interleave(
+        torch.arange(kernel_volume, device=device), nbsizes.to(device)
+    )
+    starts = (torch.cumsum(nbsizes, 0) - nbsizes).to(device)
+    positions = torch.arange(nbmaps.shape[0], device=device) - starts[offsets]
+
+    nbmaps = nbmaps.long()
+    in_map, out_map = nbmaps[:, 0], nbmaps[:, 1]
+    if transposed:
+        in_map, out_map = out_map, in_map
+    return in_map, out_map, offsets, positions, max_size
+
+
+def _scatter_rows(
+    values: torch.Tensor,
+    offsets: torch.Tensor,
+    positions: torch.Tensor,
+    kernel_volume: int,
+    max_size: int,
+) -> torch.Tensor:
+    buffer = values.new_zeros(kernel_volume, max_size, values.shape[1])
+    buffer[offsets, positions] = values
+    return buffer
+
+
+def _grouped_bmm(x: torch.Tensor, weight: torch.Tensor, groups: int) -> torch.Tensor:
+    # (K, M, Cin) x (K, Cin / groups, Cout) -> (K, M, Cout), where output
+    # channel group g only reads input channel group g
+    if groups == 1:
+        return torch.bmm(x, weight)
+    kernel_volume, num_rows = x.shape[0], x.shape[1]
+    in_group, out_channels = weight.shape[1], weight.shape[2]
+    out_group = out_channels // groups
+    if in_group == 1:
+        # depthwise: elementwise products
+        output = x.unsqueeze(-1) * weight.view(kernel_volume, 1, groups, out_group)
+        return output.reshape(kernel_volume, num_rows, out_channels)
+    x = x.view(kernel_volume, num_rows, groups, in_group).transpose(1, 2)
+    weight = weight.view(kernel_volume, in_group, groups, out_group).transpose(1, 2)
+    output = torch.matmul(x, weight).transpose(1, 2)
+    return output.reshape(kernel_volume, num_rows, out_channels)
+
+
+def _grouped_wgrad(x: torch.Tensor, grad: torch.Tensor, groups: int) -> torch.Tensor:
+    # (K, M, Cin)^T x (K, M, Cout) -> (K, Cin / groups, Cout)
+    if groups == 1:
+        return torch.bmm(x.transpose(1, 2), grad)
+    kernel_volume, num_rows = x.shape[0], x.shape[1]
+    in_group = x.shape[2] // groups
+    out_group = grad.shape[2] // groups
+    x = x.view(kernel_volume, num_rows, groups, in_group).permute(0, 2, 3, 1)
+    grad = grad.view(kernel_volume, num_rows, groups, out_group).transpose(1, 2)
+    output = torch.matmul(x, grad).transpose(1, 2)
+    return output.reshape(kernel_volume, in_group, groups * out_group)
+
+
+def _transpose_grouped(weight: torch.Tensor, groups: int) -> torch.Tensor:
+    # kernel of the dgrad pass: every channel group transposed,
+    # (K, Cin / groups, Cout) -> (K, Cout / groups, Cin)
+    kernel_volume, in_group, out_channels = weight.shape
+    weight = weight.view(kernel_volume, in_group, groups, out_channels // groups)
+    return weight.permute(0, 3, 2, 1).reshape(
+        kernel_volume, out_channels // groups, groups * in_group
+    )
+
+
+def expand_grouped_weight(weight: torch.Tensor, groups: int) -> torch.Tensor:
+    r"""
+    dense (K, Cin, Cout) kernel of a grouped (K, Cin / groups, Cout) kernel,
+    zero outside of the diagonal channel blocks, for dataflows without
+    native support for groups
+    """
+    if groups == 1:
+        return weight
+    squeeze = weight.dim() == 2
+    if squeeze:
+        weight = weight.unsqueeze(0)
+    kernel_volume, in_group, out_channels = weight.shape
+    weight = weight.view(kernel_volume, in_group, groups, out_channels // groups)
+    eye = torch.eye(groups, dtype=weight.dtype, device=weight.device)
+    weight = torch.einsum("kigo,gh->kgiho", weight, eye)
+    weight = weight.reshape(kernel_volume, groups * in_group, out_channels)
+    return weight[0] if squeeze else weight
+
+
+def conv_forward_torch_native(
+    input: torch.Tensor,
+    weight: torch.Tensor,
+    nbmaps: torch.Tensor,
+    nbsizes: torch.Tensor,
+    sizes: Tuple[int, int],
+    transposed: bool = False,
+    groups: int = 1,
+    submanifold: bool = False,
+) -> torch.Tensor:
+    kernel_volume = weight.shape[0]
+    # the center offset of a submanifold convolution is the identity map
+    skip_center = submanifold and kernel_volume % 2 == 1
+    num_out_feats = sizes[1] if not transposed else sizes[0]
+
+    if skip_center:
+        center = weight[kernel_volume // 2 : kernel_volume // 2 + 1]
+        output = _grouped_bmm(input.unsqueeze(0), center, groups)[0]
+    else:
+        output = input.new_zeros(num_out_feats, weight.shape[-1])
+
+    in_map, out_map, offsets, positions, max_size = _get_groups(
+        nbmaps, nbsizes, transposed, skip_center
+    )
+    if max_size == 0:
+        return output
+
+    buffer = _scatter_rows(
+        input.index_select(0, in_map), offsets, positions, kernel_volume, max_size
+    )
+    buffer = _grouped_bmm(buffer, weight, groups)
+    output.index_add_(0, out_map, buffer[offsets, positions])
+    return output
+
+
+def conv_backward_torch_native(
+    grad_output: torch.Tensor,
+    input: torch.Tensor,
+    weight: torch.Tensor,
+    nbmaps: torch.Tensor,
+    nbsizes: torch.Tensor,
+    sizes: Tuple[int, int],
+    transposed: bool = False,
+    groups: int = 1,
+    submanifold: bool = False,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    kernel_volume = weight.shape[0]
+    skip_center = submanifold and kernel_volume % 2 == 1
+    weight_t = _transpose_grouped(weight, groups)
+
+    grad_input = torch.zeros_like(input)
+    grad_weight = torch.zeros_like(weight)
+    if skip_center:
+        center = slice(kernel_volume // 2, kernel_volume // 2 + 1)
+        grad_center = _grouped_bmm(grad_output.unsqueeze(0), weight_t[center], groups)
+        grad_input += grad_center[0]
+        grad_weight[center] = _grouped_wgrad(
+            input.unsqueeze(0), grad_output.unsqueeze(0), groups
+        )
+
+    in_map, out_map, offsets, positions, max_size = _get_groups(
+        nbmaps, nbsizes, transposed, skip_center
+    )
+    if max_size == 0:
+        return grad_input, grad_weight
+
+    in_buffer = _scatter_rows(
+        input.index_select(0, in_map), offsets, positions, kernel_volume, max_size
+    )
+    out_buffer = _scatter_rows(
+        grad_output.index_select(0, out_map),
+        offsets,
+        positions,
+        kernel_volume,
+        max_size,
+    )
+
+    # dgrad
+    grad_buffer = _grouped_bmm(out_buffer, weight_t, groups)
+    grad_input.index_add_(0, in_map, grad_buffer[offsets, positions])
+
+    # wgrad
+    grad_weight += _grouped_wgrad(in_buffer, out_buffer, groups)
+    return grad_input, grad_weight
+
+
+class TorchNativeConvolutionFuntion(Function):
+    @staticmethod
+    def forward(
+        ctx,
+        input: torch.Tensor,
+        weight: torch.Tensor,
+        kmap: Dict,
+        config: Dict,
+        transposed: bool = False,
+        groups: int = 1,
+    ) -> torch.Tensor:
+        nbmaps = kmap["nbmaps"]
+        nbsizes = kmap["nbsizes"]
+        sizes = kmap["sizes"]
+        submanifold = kmap.get("submanifold", False)
+
+        input = input.contiguous()
+        weight = weight.contiguous()
+        if input.dtype != weight.dtype:
+            input = input.to(weight.dtype)
+
+        output = conv_forward_torch_native(
+            input, weight, nbmaps, nbsizes, sizes, transposed, groups, submanifold
+        )
+        ctx.for_backwards = (input, weight, nbmaps, nbsizes, sizes, transposed)
+        ctx.groups = groups
+        ctx.submanifold = submanifold
+        return output
+
+    @staticmethod
+    def backward(ctx, grad_output: torch.Tensor):
+        input, weight, nbmaps, nbsizes, sizes, transposed = ctx.for_backwards
+
+        if grad_output.dtype != weight.dtype:
+            grad_output = grad_output.to(weight.dtype)
+
+        grad_input, grad_weight = conv_backward_torch_native(
+            grad_output.contiguous(),
+            input,
+            weight,
+            nbmaps,
+            nbsizes,
+            sizes,
+            transposed,
+            ctx.groups,
+            ctx.submanifold,
+        )
+        return (grad_input, grad_weight, None, None, None, None)
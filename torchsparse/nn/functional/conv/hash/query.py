@@ -51,5 +51,10 @@ def convert_transposed_out_in_map(out_in_map, size):
         device=out_in_map.device,
         dtype=torch.int32,
     )
-    torchsparse.backend.convert_transposed_out_in_map(out_in_map, out_in_map_t)
+    if out_in_map.device.type == "cuda":
+        torchsparse.backend.convert_transposed_out_in_map(out_in_map, out_in_map_t)
+    else:
+        out_idx, kernel_idx = torch.nonzero(out_in_map >= 0, as_tuple=True)
+        in_idx = out_in_map[out_idx, kernel_idx].long()
+        out_in_map_t[in_idx, kernel_idx] = out_idx.int()
     return out_in_map_t
@@ -0,0 +1,365 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import torch
+
+from torchsparse import SparseTensor
+from torchsparse.utils import make_ntuple
+
+from .conv import _get_conv_config, _get_kernel_map, _get_transposed_kernel_map
+from .conv import conv3d
+from .func.implicit_gemm import _forward_cpu
+from .kmap.update import _get_hashmap, _lookup, _window_outputs
+
+__all__ = [
+    "get_incremental_mode",
+    "set_incremental_mode",
+    "get_incremental_stats",
+    "reset_incremental_stats",
+    "incremental_conv3d",
+]
+
+_global_incremental_mode = False
+_incremental_stats = {"rows": 0, "recomputed_rows": 0}
+
+_int_types = {1: torch.int8, 2: torch.int16, 4: torch.int32, 8: torch.int64}
+
+
+def get_incremental_mode() -> bool:
+    global _global_incremental_mode
+    return _global_incremental_mode
+
+
+def set_incremental_mode(incremental_mode: bool):
+    r"""
+    with incremental_mode, Conv3d layers in eval mode keep their previous
+    input and output features and only recompute the output rows whose
+    kernel window holds a changed input (see incremental_conv3d)
+    """
+    global _global_incremental_mode
+    _global_incremental_mode = incremental_mode
+
+
+def get_incremental_stats() -> Dict[str, Any]:
+    r"""
+    output rows produced and recomputed by incremental_conv3d since the last
+    reset_incremental_stats, and the fraction recomputed
+    """
+    stats = dict(_incremental_stats)
+    stats["recomputed_fraction"] = stats["recomputed_rows"] / max(stats["rows"], 1)
+    return stats
+
+
+def reset_incremental_stats() -> None:
+    _incremental_stats["rows"] = 0
+    _incremental_stats["recomputed_rows"] = 0
+
+
+def incremental_conv3d(
+    state: Dict[str, Any],
+    input: SparseTensor,
+    weight: torch.Tensor,
+    kernel_size: Union[int, List[int], Tuple[int, ...]],
+    bias: Optional[torch.Tensor] = None,
+    stride: Union[int, List[int], Tuple[int, ...]] = 1,
+    padding: Union[int, Tuple[int, ...]] = 0,
+    dilation: Union[int, Tuple[int, ...]] = 1,
+    config: Dict = None,
+    transposed: bool = False,
+    generative: bool = False,
+    groups: int = 1,
+) -> SparseTensor:
+    r"""
+    conv3d for inference on a stream of frames. state (a dict owned by the
+    layer) keeps the input and output features of the previous call. Output
+    rows are only recomputed if an input in their kernel window changed its
+    features, or if the coordinates around them were changed by a streaming
+    update (see SparseTensor.update); the others are taken from the previous
+    output. The CPU ImplicitGEMM kernel computes its output in tiles of rows
+    that only depend on the number of outputs, one GEMM per tile over the
+    kernel offsets present in the tile. The recomputed rows go through GEMMs
+    of the shape of their tile, and tiles whose offsets changed are
+    recomputed whole: the output is bit-identical to conv3d. Other
+    dataflows and devices, generative and grouped layers, autograd and
+    changed weights recompute every row.
+    """
+    from torchsparse.nn import functional as F
+
+    kernel_size = make_ntuple(kernel_size, ndim=3)
+    stride = make_ntuple(stride, ndim=3)
+    dilation = make_ntuple(dilation, ndim=3)
+    config, kmap_mode = _get_conv_config(config, input.coords.device)
+
+    if (
+        config.dataflow != F.Dataflow.ImplicitGEMM
+        or input.feats.device.type != "cpu"
+        or generative
+        or groups > 1
+        or (kernel_size == (1, 1, 1) and stride == (1, 1, 1))
+        or (
+            torch.is_grad_enabled()
+            and (weight.requires_grad or input.feats.requires_grad)
+        )
+    ):
+        state.clear()
+        output = conv3d(
+            input,
+            weight,
+            kernel_size,
+            bias=bias,
+            stride=stride,
+            padding=padding,
+            dilation=dilation,
+            config=config,
+            transposed=transposed,
+            generative=generative,
+            groups=groups,
+        )
+        _count(output.feats.shape[0], output.feats.shape[0])
+        return output
+
+    if not transposed:
+        kmap = _get_kernel_map(
+            input, kernel_size, stride, padding, dilation, config, kmap_mode
+        )
+        out_in_map = kmap["out_in_map"]
+        num_outputs = kmap["sizes"][1]
+        out_stride = tuple(input.stride[k] * stride[k] for k in range(3))
+        out_coords, spatial_range = kmap["coords"], kmap["spatial_range"]
+    else:
+        kmap = _get_transposed_kernel_map(
+            input, kernel_size, stride, padding, dilation, config, kmap_mode
+        )
+        out_in_map = kmap["out_in_map_t"]
+        num_outputs = kmap["sizes"][0]
+        out_stride = tuple(input.stride[k] // stride[k] for k in range(3))
+        out_coords, spatial_range = input._caches.cmaps[out_stride]
+
+    feats = input.feats
+    if feats.dtype != weight.dtype:
+        feats = feats.to(weight.dtype)
+    feats = feats.contiguous()
+    weight = weight.contiguous()
+
+    rows = None
+    if _can_reuse(state, input, feats, weight, bias, out_coords, out_stride):
+        rows, output = _dirty_rows(
+            state, input, feats, out_coords, out_stride, kernel_size, stride, transposed
+        )
+    kernel_volume, channels = weight.shape[0], feats.shape[1]
+    if rows is None:
+        output = torch.zeros(
+            num_outputs, weight.shape[-1], dtype=weight.dtype, device=feats.device
+        )
+        active_masks = torch.zeros(
+            _num_tiles(num_outputs, kernel_volume, channels),
+            kernel_volume,
+            dtype=torch.uint8,
+        )
+        _forward_cpu(feats, output, weight, out_in_map, active_masks=active_masks)
+        if bias is not None:
+            output += bias
+        _count(num_outputs, num_outputs)
+    else:
+        num_prev_outputs = state["out_feats"].shape[0]
+        if num_outputs != num_prev_outputs:
+            resized = _resized_rows(
+                num_prev_outputs, num_outputs, kernel_volume, channels
+            )
+            rows = torch.unique(torch.cat([rows, resized]))
+        active_masks = _resize_masks(
+            state["active_masks"], _num_tiles(num_outputs, kernel_volume, channels)
+        )
+        rows = _forward_cpu(feats, output, weight, out_in_map, rows, active_masks)
+        if bias is not None:
+            output[rows] += bias
+        _count(num_outputs, rows.shape[0])
+
+    state.clear()
+    state.update(
+        caches=input._caches,
+        version=input._caches.version,
+        params=_versions(weight, bias),
+        in_coords=input.coords,
+        in_feats=feats,
+        in_feats_version=feats._version,
+        out_coords=out_coords,
+        out_feats=output,
+        out_feats_version=output._version,
+        active_masks=active_masks,
+    )
+
+    output = SparseTensor(
+        coords=out_coords,
+        feats=output,
+        stride=out_stride,
+        spatial_range=spatial_range,
+    )
+    output._caches = input._caches
+    output._caches.cmaps.setdefault(
+        output.stride, (output.coords, output.spatial_range)
+    )
+    return output
+
+
+def _count(num_rows: int, num_recomputed: int) -> None:
+    _incremental_stats["rows"] += num_rows
+    _incremental_stats["recomputed_rows"] += num_recomputed
+
+
+def _versions(*tensors: Optional[torch.Tensor]) -> Tuple[Any, ...]:
+    # identity and in-place modification counter of tensors
+    return tuple(
+        None if x is None else (x.data_ptr(), x.shape, x._version) for x in tensors
+    )
+
+
+def _bits(x: torch.Tensor) -> torch.Tensor:
+    # features compared bit by bit, e.g. -0.0 differs from 0.0
+    return x.view(_int_types[x.element_size()])
+
+
+def _can_reuse(
+    state: Dict[str, Any],
+    input: SparseTensor,
+    feats: torch.Tensor,
+    weight: torch.Tensor,
+    bias: Optional[torch.Tensor],
+    out_coords: torch.Tensor,
+    out_stride: Tuple[int, ...],
+) -> bool:
+    # the previous call saw the same coordinates, or the coordinates before
+    # the last streaming update of input, with the same weights and tile
+    # sizes; its features were not modified in place since
+    if not state or state["caches"] is not input._caches:
+        return False
+    if state["params"] != _versions(weight, bias):
+        return False
+    if (
+        state["in_feats"]._version != state["in_feats_version"]
+        or state["out_feats"]._version != state["out_feats_version"]
+        or state["in_feats"].shape[1] != feats.shape[1]
+    ):
+        return False
+    caches = input._caches
+    if caches.version == state["version"]:
+        same = input.coords is state["in_coords"] and out_coords is state["out_coords"]
+    elif caches.version == state["version"] + 1:
+        in_delta = caches.deltas.get(input.stride)
+        out_delta = caches.deltas.get(out_stride)
+        same = (
+            in_delta is not None
+            and out_delta is not None
+            and in_delta["old_coords"] is state["in_coords"]
+            and in_delta["coords"] is input.coords
+            and out_delta["old_coords"] is state["out_coords"]
+            and out_delta["coords"] is out_coords
+        )
+    else:
+        same = False
+    if not same:
+        return False
+    # the tiles of the CPU kernel depend on the number of outputs
+    kernel_volume = weight.shape[0]
+    return _tile_rows(
+        state["out_coords"].shape[0], kernel_volume, feats.shape[1]
+    ) == _tile_rows(out_coords.shape[0], kernel_volume, feats.shape[1])
+
+
+# tile size of the CPU ImplicitGEMM kernel, see get_tile_rows in
+# convolution_implicit_gemm_cpu.cpp
+_tile_elements = 1 << 20
+_tile_m_min = 128
+
+
+def _tile_rows(num_rows: int, kernel_volume: int, channels: int) -> int:
+    max_rows = _tile_elements // max(kernel_volume * channels, 1)
+    max_rows = max(max_rows // _tile_m_min * _tile_m_min, _tile_m_min)
+    if num_rows <= max_rows:
+        return max(num_rows, 1)
+    num_tiles = (num_rows + max_rows - 1) // max_rows
+    tile_rows = (num_rows + num_tiles - 1) // num_tiles
+    return (tile_rows + _tile_m_min - 1) // _tile_m_min * _tile_m_min
+
+
+def _num_tiles(num_rows: int, kernel_volume: int, channels: int) -> int:
+    tile_rows = _tile_rows(num_rows, kernel_volume, channels)
+    return (num_rows + tile_rows - 1) // tile_rows
+
+
+def _resized_rows(
+    num_prev_rows: int, num_rows: int, kernel_volume: int, channels: int
+) -> torch.Tensor:
+    # rows of the tiles whose number of rows changed with the number of
+    # outputs (the last ones), which go through GEMMs of another shape
+    tile_rows = _tile_rows(num_rows, kernel_volume, channels)
+    start = max(min(num_prev_rows, num_rows) - 1, 0) // tile_rows * tile_rows
+    return torch.arange(start, num_rows, dtype=torch.long)
+
+
+def _resize_masks(masks: torch.Tensor, num_tiles: int) -> torch.Tensor:
+    # active offsets of the tiles after the number of outputs changed; the
+    # added tiles hold new rows only, which are recomputed anyway
+    if masks.shape[0] == num_tiles:
+        return masks
+    resized = masks.new_zeros((num_tiles, masks.shape[1]))
+    num_kept = min(num_tiles, masks.shape[0])
+    resized[:num_kept] = masks[:num_kept]
+    return resized
+
+
+def _compact_rows(
+    prev: torch.Tensor, delta: Optional[Dict[str, Any]], num_rows: int
+) -> torch.Tensor:
+    # previous rows at their place after a streaming update; the rows
+    # appended by the update are left uninitialized
+    if delta is None:
+        return prev.clone()
+    output = prev.new_empty((num_rows,) + prev.shape[1:])
+    num_kept = delta["num_kept"]
+    output[:num_kept] = prev[:num_kept]
+    output[delta["holes"]] = prev[delta["movers"]]
+    return output
+
+
+def _dirty_rows(
+    state: Dict[str, Any],
+    input: SparseTensor,
+    feats: torch.Tensor,
+    out_coords: torch.Tensor,
+    out_stride: Tuple[int, ...],
+    kernel_size: Tuple[int, ...],
+    stride: Tuple[int, ...],
+    transposed: bool,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    # output rows to recompute, and the previous output features moved to
+    # their new rows
+    caches = input._caches
+    in_delta = out_delta = None
+    if caches.version != state["version"]:
+        in_delta = caches.deltas[input.stride]
+        out_delta = caches.deltas[out_stride]
+
+    num_inputs = input.coords.shape[0]
+    num_outputs = out_coords.shape[0]
+    prev_feats = _compact_rows(state["in_feats"], in_delta, num_inputs)
+    num_kept = num_inputs if in_delta is None else in_delta["num_kept"]
+    changed = (_bits(feats[:num_kept]) != _bits(prev_feats[:num_kept])).any(1)
+    changed = input.coords[:num_kept][changed]
+
+    if in_delta is not None:
+        changed = torch.cat([changed, in_delta["touched"]])
+    candidates = _window_outputs(changed, kernel_size, stride, transposed)
+    if out_delta is not None:
+        candidates = torch.cat([candidates, out_delta["touched"]])
+    hashmap = _get_hashmap(caches, out_stride, out_coords)
+    rows = _lookup(hashmap, candidates)[:, 0].long()
+    rows = rows[rows >= 0]
+    if out_delta is not None:
+        appended = torch.arange(
+            out_delta["num_kept"], num_outputs, dtype=torch.long, device=rows.device
+        )
+        rows = torch.cat([rows, appended])
+    rows = torch.unique(rows)
+
+    output = _compact_rows(state["out_feats"], out_delta, num_outputs)
+    return rows, output
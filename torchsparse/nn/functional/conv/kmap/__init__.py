@@ -1,3 +1,6 @@
 from .build_kmap import *
 from .downsample import *
 from .upsample import *
+from .prebuild import *
+from .update import *
+from .compact import *
@@ -1,20 +1,30 @@
-from typing import Dict, Tuple, Union
+from typing import Dict, Optional, Tuple, Union
 import math
 import numpy as np
 import torch
 
 import torchsparse.backend
 from torchsparse.utils import make_ntuple, make_tensor, make_divisible
+from torchsparse.utils.tensor_cache import resize_cached_kmap
 
 from .func import *
+from .compact import compact_kernel_map, compact_out_in_map, decode_out_in_map
 
 from ..conv_config import *
 
-__all__ = ["build_kernel_map", "transpose_kernel_map"]
+__all__ = ["build_kernel_map", "transpose_kernel_map", "build_kernel_map_bwd"]
 
 cta_M = 128
 cta_M_wgrad = 64
 
+_bwd_keys = (
+    "out_in_map_bwd",
+    "reorder_out_in_map_bwd",
+    "reduced_sorted_mask_bwd_wgrad",
+    "reduced_sorted_mask_bwd_dgrad",
+    "reorder_loc_bwd",
+)
+
 
 def build_kernel_map(
     _coords: torch.Tensor,
@@ -33,9 +43,44 @@ def build_kernel_map(
     generative: bool = False,
     split_mask_num: int = 1,
     split_mask_num_bwd: int = 1,
+    kmap_format: str = "dense",
+    curve: Optional[str] = None,
 ) -> Dict:
+    r"""
+    kernel map from _coords to the (strided) output coordinates. With
+    kmap_format="compact", CPU maps of the ImplicitGEMM and GatherScatter
+    dataflows are stored compact (see compact_kernel_map). With a curve,
+    hashmap-mode output coordinates are sorted along it (see spdownsample).
+    """
     from torchsparse.nn import functional as F
 
+    if _coords.device.type not in ("cuda", "cpu"):
+        # no native kernel map builders on this device (e.g. XLA / MPS):
+        # build on the CPU and move the result
+        kmap = build_kernel_map(
+            _coords.cpu(),
+            input_node_num,
+            kernel_size,
+            stride,
+            padding,
+            None if hashmap_keys is None else hashmap_keys.cpu(),
+            None if hashmap_vals is None else hashmap_vals.cpu(),
+            spatial_range,
+            "hashmap",
+            dataflow,
+            downsample_mode=downsample_mode,
+            training=training,
+            ifsort=ifsort,
+            generative=generative,
+            split_mask_num=split_mask_num,
+            split_mask_num_bwd=split_mask_num_bwd,
+            curve=curve,
+        )
+        return {
+            k: v.to(_coords.device) if isinstance(v, torch.Tensor) else v
+            for k, v in kmap.items()
+        }
+
     kmap = dict(
         [
             ("out_in_map", None),
@@ -56,12 +101,23 @@ def build_kernel_map(
             ("qnbaddrs", None),
             # [Fetch-on-Demand]: quantified mapsize
             ("qmapsize", None),
+            # how the map was built, for streaming updates (update_kernel_maps)
+            ("kmap_mode", mode),
+            ("padding", None),
+            ("downsample_mode", downsample_mode),
+            ("kmap_format", "dense"),
+            # out_in_map[i, k] = j iff out_in_map[j, K - 1 - k] = i
+            ("symmetric", False),
+            # unit strides, not generative: the output coordinates are the
+            # input coordinates and the center offset is the identity map
+            ("submanifold", False),
         ]
     )
 
     stride = make_ntuple(stride, ndim=3)
     kernel_size = make_ntuple(kernel_size, ndim=3)
     padding = make_ntuple(padding, ndim=3)
+    kmap["padding"] = padding
     if spatial_range is not None:
         new_spatial_range = [0, 0, 0]
         for i in range(len(new_spatial_range)):
@@ -73,6 +129,7 @@ def build_kernel_map(
     else:
         new_spatial_range = None
     subm = not (any(s > 1 for s in stride))
+    kmap["submanifold"] = subm and not generative
     stride = make_tensor(stride, dtype=torch.int, device=_coords.device)
     padding = make_tensor(padding, dtype=torch.int, device=_coords.device)
     kernel_size = make_tensor(kernel_size, dtype=torch.int, device=_coords.device)
@@ -97,7 +154,7 @@ def build_kernel_map(
                 split_mask_num=split_mask_num,
             )
 
-        elif dataflow == Dataflow.GatherScatter:
+        elif dataflow in (Dataflow.GatherScatter, Dataflow.TorchNative):
             kmap = build_kmap_Gather_Scatter_hashmap_on_the_fly(
                 kmap,
                 input_node_num,
@@ -144,10 +201,11 @@ def build_kernel_map(
                 ifsort=ifsort,
                 downsample_mode=downsample_mode,
                 generative=generative,
+                curve=curve,
                 split_mask_num=split_mask_num,
             )
 
-        elif dataflow == Dataflow.GatherScatter:
+        elif dataflow in (Dataflow.GatherScatter, Dataflow.TorchNative):
             kmap = build_kmap_Gather_Scatter_hashmap(
                 kmap,
                 input_node_num,
@@ -160,6 +218,7 @@ def build_kernel_map(
                 subm=subm,
                 downsample_mode=downsample_mode,
                 generative=generative,
+                curve=curve,
             )
 
         elif dataflow == Dataflow.FetchOnDemand:
@@ -175,6 +234,7 @@ def build_kernel_map(
                 subm=subm,
                 downsample_mode=downsample_mode,
                 generative=generative,
+                curve=curve,
             )
 
         else:
@@ -189,35 +249,17 @@ def build_kernel_map(
         raise ValueError("[Build kernel map] unknown mode: {}".format(mode))
 
     if dataflow == Dataflow.ImplicitGEMM:
-        if training:
-            out_in_map_bwd = F.convert_transposed_out_in_map(
-                kmap["out_in_map"], make_divisible(kmap["sizes"][0], cta_M)
-            )
-            bitmask_bwd = torchsparse.backend.derive_bitmask_from_out_in_map(
-                out_in_map_bwd, split_mask_num_bwd, kmap["sizes"][0]
-            )
-            sorted_mask_bwd, reorder_loc_bwd = torch.sort(bitmask_bwd, descending=True)
-            reorder_loc_bwd = reorder_loc_bwd.to(torch.int32)
-            reorder_out_in_map_bwd = torchsparse.backend.reorder_out_in_map_cuda(
-                out_in_map_bwd, reorder_loc_bwd
-            )
-            reduced_sorted_mask_bwd_wgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M_wgrad
-            )
-            reduced_sorted_mask_bwd_dgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M
-            )
-        else:
-            out_in_map_bwd = None
-            reorder_out_in_map_bwd = None
-            reduced_sorted_mask_bwd_wgrad = None
-            reduced_sorted_mask_bwd_dgrad = None
-            reorder_loc_bwd = None
-        kmap["out_in_map_bwd"] = out_in_map_bwd
-        kmap["reorder_out_in_map_bwd"] = reorder_out_in_map_bwd
-        kmap["reduced_sorted_mask_bwd_wgrad"] = reduced_sorted_mask_bwd_wgrad
-        kmap["reduced_sorted_mask_bwd_dgrad"] = reduced_sorted_mask_bwd_dgrad
-        kmap["reorder_loc_bwd"] = reorder_loc_bwd
+        # backward-only structures are built on first use, see
+        # build_kernel_map_bwd; training is kept for API compatibility
+        for key in _bwd_keys:
+            kmap[key] = None
+        kmap["split_mask_num_bwd"] = split_mask_num_bwd
+    if (
+        kmap_format == "compact"
+        and _coords.device.type == "cpu"
+        and dataflow in (Dataflow.ImplicitGEMM, Dataflow.GatherScatter)
+    ):
+        kmap = compact_kernel_map(kmap)
     return kmap
 
 
@@ -231,33 +273,18 @@ def transpose_kernel_map(
     from torchsparse.nn import functional as F
 
     out_in_map = F.convert_transposed_out_in_map(
-        kmap["out_in_map"], make_divisible(kmap["sizes"][0], cta_M)
+        decode_out_in_map(kmap["out_in_map"]),
+        make_divisible(kmap["sizes"][0], cta_M),
     )
 
-    if ifsort:
-        if training:
-            out_in_map_bwd = kmap["out_in_map"]
-            reorder_out_in_map_bwd = kmap["reorder_out_in_map"]
-            reorder_loc_bwd = kmap["reorder_loc"]
-            sorted_mask_bwd = kmap["sorted_mask"]
-            reduced_sorted_mask_bwd_wgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M_wgrad
-            )
-            reduced_sorted_mask_bwd_dgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M
-            )
-            kmap["out_in_map_bwd_t"] = out_in_map_bwd
-            kmap["reorder_out_in_map_bwd_t"] = reorder_out_in_map_bwd
-            kmap["reduced_sorted_mask_bwd_wgrad_t"] = reduced_sorted_mask_bwd_wgrad
-            kmap["reduced_sorted_mask_bwd_dgrad_t"] = reduced_sorted_mask_bwd_dgrad
-            kmap["reorder_loc_bwd_t"] = reorder_loc_bwd
-        else:
-            kmap["out_in_map_bwd_t"] = None
-            kmap["reorder_out_in_map_bwd_t"] = None
-            kmap["reduced_sorted_mask_bwd_wgrad_t"] = None
-            kmap["reduced_sorted_mask_bwd_dgrad_t"] = None
-            kmap["reorder_loc_bwd_t"] = None
+    # backward-only structures are built on first use, see
+    # build_kernel_map_bwd; training is kept for API compatibility.
+    # structures built by an earlier backward pass are kept
+    for key in _bwd_keys:
+        kmap.setdefault(key + "_t", None)
+    kmap.setdefault("split_mask_num_bwd", split_mask_num_bwd)
 
+    if out_in_map.device.type == "cuda" and ifsort:
         bitmask = torchsparse.backend.derive_bitmask_from_out_in_map(
             out_in_map, split_mask_num, kmap["sizes"][0]
         )
@@ -273,37 +300,85 @@ def transpose_kernel_map(
         kmap["reduced_sorted_mask_t"] = reduced_sorted_mask
         kmap["reorder_loc_t"] = reorder_loc
     else:
-        if training:
-            out_in_map_bwd = kmap["out_in_map"]
+        # the CPU dataflows have no sorted / bitmask variants
+        kmap["reorder_out_in_map_t"] = None
+        kmap["reduced_sorted_mask_t"] = None
+        kmap["reorder_loc_t"] = None
+
+    if kmap.get("kmap_format") == "compact":
+        out_in_map = compact_out_in_map(out_in_map)
+    kmap["out_in_map_t"] = out_in_map
+    resize_cached_kmap(kmap)
+
+    return kmap
+
+
+def build_kernel_map_bwd(kmap: Dict, transposed: bool = False) -> Dict:
+    r"""
+    materializes the backward-only structures of an ImplicitGEMM kmap the
+    first time a backward pass needs them and caches them in the kmap, so
+    frozen layers and no-grad forwards never pay for them
+    """
+    from torchsparse.nn import functional as F
+
+    suffix = "_t" if transposed else ""
+    if kmap.get("out_in_map_bwd" + suffix) is not None:
+        return kmap
+
+    split_mask_num_bwd = kmap.get("split_mask_num_bwd", 1)
+    out_in_map = kmap["out_in_map"]
+    # compact maps (see compact_kernel_map) only exist on CPU
+    on_cuda = isinstance(out_in_map, torch.Tensor) and out_in_map.device.type == "cuda"
+    reorder_out_in_map_bwd = None
+    reduced_sorted_mask_bwd_wgrad = None
+    reduced_sorted_mask_bwd_dgrad = None
+    reorder_loc_bwd = None
+
+    if not transposed:
+        out_in_map_bwd = F.convert_transposed_out_in_map(
+            decode_out_in_map(out_in_map), make_divisible(kmap["sizes"][0], cta_M)
+        )
+        if kmap.get("kmap_format") == "compact":
+            out_in_map_bwd = compact_out_in_map(out_in_map_bwd)
+        elif on_cuda:
             bitmask_bwd = torchsparse.backend.derive_bitmask_from_out_in_map(
-                out_in_map_bwd, split_mask_num_bwd, kmap["sizes"][1]
+                out_in_map_bwd, split_mask_num_bwd, kmap["sizes"][0]
             )
             sorted_mask_bwd, reorder_loc_bwd = torch.sort(bitmask_bwd, descending=True)
-            reorder_loc_bwd = reorder_loc_bwd.to(torch.int32)
+    else:
+        # the backward of a transposed convolution runs on the forward map
+        out_in_map_bwd = out_in_map
+        if on_cuda:
+            if kmap.get("sorted_mask") is not None:
+                sorted_mask_bwd = kmap["sorted_mask"]
+                reorder_loc_bwd = kmap["reorder_loc"]
+            else:
+                bitmask_bwd = torchsparse.backend.derive_bitmask_from_out_in_map(
+                    out_in_map_bwd, split_mask_num_bwd, kmap["sizes"][1]
+                )
+                sorted_mask_bwd, reorder_loc_bwd = torch.sort(
+                    bitmask_bwd, descending=True
+                )
+
+    if on_cuda:
+        reorder_loc_bwd = reorder_loc_bwd.to(torch.int32)
+        if transposed and kmap.get("reorder_out_in_map") is not None:
+            reorder_out_in_map_bwd = kmap["reorder_out_in_map"]
+        else:
             reorder_out_in_map_bwd = torchsparse.backend.reorder_out_in_map_cuda(
                 out_in_map_bwd, reorder_loc_bwd
             )
-            reduced_sorted_mask_bwd_wgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M_wgrad
-            )
-            reduced_sorted_mask_bwd_dgrad = torchsparse.backend.reduce_bitmask_cuda(
-                sorted_mask_bwd, cta_M
-            )
-            kmap["out_in_map_bwd_t"] = out_in_map_bwd
-            kmap["reorder_out_in_map_bwd_t"] = reorder_out_in_map_bwd
-            kmap["reduced_sorted_mask_bwd_wgrad_t"] = reduced_sorted_mask_bwd_wgrad
-            kmap["reduced_sorted_mask_bwd_dgrad_t"] = reduced_sorted_mask_bwd_dgrad
-            kmap["reorder_loc_bwd_t"] = reorder_loc_bwd
-        else:
-            kmap["out_in_map_bwd_t"] = None
-            kmap["reorder_out_in_map_bwd_t"] = None
-            kmap["reduced_sorted_mask_bwd_wgrad_t"] = None
-            kmap["reduced_sorted_mask_bwd_dgrad_t"] = None
-            kmap["reorder_loc_bwd_t"] = None
-        kmap["reorder_out_in_map_t"] = None
-        kmap["reduced_sorted_mask_t"] = None
-        kmap["reorder_loc_t"] = None
-
-    kmap["out_in_map_t"] = out_in_map
+        reduced_sorted_mask_bwd_wgrad = torchsparse.backend.reduce_bitmask_cuda(
+            sorted_mask_bwd, cta_M_wgrad
+        )
+        reduced_sorted_mask_bwd_dgrad = torchsparse.backend.reduce_bitmask_cuda(
+            sorted_mask_bwd, cta_M
+        )
 
+    kmap["out_in_map_bwd" + suffix] = out_in_map_bwd
+    kmap["reorder_out_in_map_bwd" + suffix] = reorder_out_in_map_bwd
+    kmap["reduced_sorted_mask_bwd_wgrad" + suffix] = reduced_sorted_mask_bwd_wgrad
+    kmap["reduced_sorted_mask_bwd_dgrad" + suffix] = reduced_sorted_mask_bwd_dgrad
+    kmap["reorder_loc_bwd" + suffix] = reorder_loc_bwd
+    resize_cached_kmap(kmap)
     return kmap
@@ -0,0 +1,137 @@
+from typing import Any, Dict, Optional, Union
+
+import torch
+
+from torchsparse.utils.tensor_cache import get_tensor_nbytes
+
+__all__ = [
+    "compact_out_in_map",
+    "decode_out_in_map",
+    "compact_kernel_map",
+    "kernel_map_memory",
+]
+
+# rows per block of the compact encoding (cta_M, COMPACT_MAP_BLOCK in
+# backend/utils/compact_map_cpu.h)
+_block_rows = 128
+
+# out_in_map variants stored compact by compact_kernel_map
+_map_keys = ("out_in_map", "out_in_map_t", "out_in_map_bwd", "out_in_map_bwd_t")
+
+
+def compact_out_in_map(out_in_map: torch.Tensor) -> Dict[str, Any]:
+    r"""
+    bitmask + rank encoding of an (N, K) out_in_map: one bit per kernel
+    offset and row ("masks", (N, ceil(K / 32)) int32) and the existing
+    neighbors only, row by row ("nbrs"). Rows are grouped in blocks of 128,
+    block b starts at nbrs[block_ptr[b]], row r ranks[r] neighbors later,
+    and neighbors are stored relative to bases[b], the smallest neighbor of
+    the block. On spatially sorted coordinates the neighbors of a block are
+    close, and nbrs is int16.
+    """
+    num_rows, kernel_volume = out_in_map.shape
+    device = out_in_map.device
+    valid = out_in_map >= 0
+
+    num_words = (kernel_volume + 31) // 32
+    masks = torch.zeros(num_rows, num_words, dtype=torch.int64, device=device)
+    for w in range(num_words):
+        bits = valid[:, w * 32 : (w + 1) * 32].long()
+        shifts = torch.arange(bits.shape[1], dtype=torch.int64, device=device)
+        masks[:, w] = (bits << shifts).sum(1)
+    # keeps the low 32 bits
+    masks = torch.where(masks >= 1 << 31, masks - (1 << 32), masks).int()
+
+    num_blocks = (num_rows + _block_rows - 1) // _block_rows
+    counts = valid.sum(1)
+    row_blocks = torch.arange(num_rows, device=device) // _block_rows
+    block_counts = torch.zeros(num_blocks, dtype=torch.int64, device=device)
+    block_counts.index_add_(0, row_blocks, counts)
+    block_ptr = torch.zeros(num_blocks + 1, dtype=torch.int64, device=device)
+    block_ptr[1:] = torch.cumsum(block_counts, 0)
+    # neighbors of the rows before each row in its block
+    ranks = (torch.cumsum(counts, 0) - counts - block_ptr[row_blocks]).int()
+
+    values = out_in_map[valid].int()
+    blocks = torch.repeat_interleave(
+        torch.arange(num_blocks, device=device), block_counts
+    )
+    bases = torch.zeros(num_blocks, dtype=torch.int32, device=device)
+    bases.scatter_reduce_(0, blocks, values, "amin", include_self=False)
+    nbrs = values - bases[blocks]
+    if nbrs.numel() == 0 or int(nbrs.max()) <= torch.iinfo(torch.int16).max:
+        nbrs = nbrs.short()
+
+    return {
+        "masks": masks,
+        "block_ptr": block_ptr,
+        "ranks": ranks,
+        "nbrs": nbrs,
+        "bases": bases,
+        "kernel_volume": kernel_volume,
+    }
+
+
+def decode_out_in_map(
+    out_in_map: Optional[Union[torch.Tensor, Dict[str, Any]]]
+) -> Optional[torch.Tensor]:
+    r"""
+    the (N, K) int32 out_in_map of a compact encoding (see
+    compact_out_in_map); dense maps are returned as they are
+    """
+    if out_in_map is None or isinstance(out_in_map, torch.Tensor):
+        return out_in_map
+    masks = out_in_map["masks"]
+    kernel_volume = out_in_map["kernel_volume"]
+    device = masks.device
+
+    offsets = torch.arange(kernel_volume, device=device)
+    words = masks[:, offsets // 32].long()
+    valid = ((words >> (offsets % 32)) & 1).bool()
+
+    block_ptr = out_in_map["block_ptr"]
+    blocks = torch.repeat_interleave(
+        torch.arange(block_ptr.shape[0] - 1, device=device), torch.diff(block_ptr)
+    )
+    dense = torch.full(valid.shape, -1, dtype=torch.int32, device=device)
+    dense[valid] = out_in_map["nbrs"].int() + out_in_map["bases"][blocks]
+    return dense
+
+
+def compact_kernel_map(kmap: Dict) -> Dict:
+    r"""
+    stores the out_in_map variants of kmap compact (see compact_out_in_map)
+    and drops the per-offset neighbor lists, which the CPU dataflows derive
+    on the fly. Maps built later for this kmap (transposed and backward
+    maps) are stored compact as well.
+    """
+    for key in _map_keys:
+        if isinstance(kmap.get(key), torch.Tensor):
+            kmap[key] = compact_out_in_map(kmap[key])
+    for key in ("nbmaps", "nbsizes", "input_mask", "output_mask"):
+        if key in kmap:
+            kmap[key] = None
+    kmap["kmap_format"] = "compact"
+    return kmap
+
+
+def kernel_map_memory(kmap: Dict) -> Dict[str, int]:
+    r"""
+    bytes held by every field of kmap, their total ("total") and the bytes
+    its out_in_map takes in the dense int32 format ("dense_out_in_map");
+    tensors shared between fields are counted once
+    """
+    seen = set()
+    report = {}
+    for key, value in kmap.items():
+        nbytes = get_tensor_nbytes(value, seen)
+        if nbytes > 0:
+            report[key] = nbytes
+    report["total"] = sum(report.values())
+    out_in_map = kmap.get("out_in_map")
+    if isinstance(out_in_map, dict):
+        num_rows = out_in_map["masks"].shape[0]
+        report["dense_out_in_map"] = num_rows * out_in_map["kernel_volume"] * 4
+    elif out_in_map is not None:
+        report["dense_out_in_map"] = out_in_map.numel() * 4
+    return report
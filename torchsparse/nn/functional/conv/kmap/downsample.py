@@ -4,6 +4,7 @@ import torch
 
 import torchsparse.backend
 from torchsparse.utils import make_ntuple, make_tensor
+from torchsparse.utils.curve import build_curve_permutation
 
 __all__ = ["spdownsample"]
 
@@ -15,7 +16,15 @@ def spdownsample(
     padding: torch.Tensor = 0,
     spatial_range: Optional[Tuple[int]] = None,
     downsample_mode: str = "spconv",
+    curve: Optional[str] = None,
 ) -> torch.Tensor:
+    r"""
+    output coordinates of a strided convolution. Their order depends on the
+    device: on CPU, in the order the input coordinates first reach them
+    (hash-based deduplication); on CUDA, sorted lexicographically. If curve
+    is given, they are sorted by batch and along a space-filling curve
+    (see curve_codes) on every device.
+    """
     assert downsample_mode in ["spconv", "minkowski"]
 
     stride = make_ntuple(stride, ndim=3)
@@ -33,47 +42,92 @@ def spdownsample(
     ):
         coords = _coords.clone()
         coords[:, 1:] = torch.div(coords[:, 1:], sample_stride.float()).floor()
-        coords = torch.unique(coords, dim=0)
-        return coords
+        out_coords = _unique_coords(coords)
     else:
+        if _coords.device.type not in ["cuda", "cpu"]:
+            raise NotImplementedError
+        _coords = _coords.contiguous()
+
+        padding_t = make_tensor(padding, dtype=torch.int, device=_coords.device)
+        kernel_size_t = make_tensor(kernel_size, dtype=torch.int, device=_coords.device)
+        stride_t = make_tensor(stride, dtype=torch.int, device=_coords.device)
+        coords_min, coords_max = _downsample_bounds(
+            _coords, kernel_size_t, stride_t, padding_t, spatial_range
+        )
+
         if _coords.device.type == "cuda":
-            _coords = _coords.contiguous()
-
-            padding_t = make_tensor(padding, dtype=torch.int, device=_coords.device)
-            kernel_size_t = make_tensor(
-                kernel_size, dtype=torch.int, device=_coords.device
-            )
-            stride_t = make_tensor(stride, dtype=torch.int, device=_coords.device)
-
-            if spatial_range is not None:
-                coords_max_tuple = tuple(x - 1 for x in spatial_range)
-                coords_max = make_tensor(
-                    coords_max_tuple, dtype=torch.int, device=_coords.device
-                )
-            else:
-                coords_max = _coords.max(0).values
-                coords_max[1:] = (
-                    coords_max[1:] + 2 * padding_t - (kernel_size_t - 1)
-                ) // stride_t
-
-            if torchsparse.tensor.get_allow_negative_coordinates():
-                coords_min = _coords.min(0).values
-                coords_min[1:] = torch.div(
-                    coords_min[1:] - 2 * padding_t + (kernel_size_t - 1), stride_t
-                )
-            else:
-                coords_min = make_tensor(
-                    (0, 0, 0, 0), dtype=torch.int, device=_coords.device
-                )
-
-            out_coords = torchsparse.backend.downsample_cuda(
-                _coords,
-                coords_max,
-                coords_min,
-                kernel_size_t,
-                stride_t,
-                padding_t,
-            )
-            return out_coords
+            downsample = torchsparse.backend.downsample_cuda
         else:
-            raise NotImplementedError
+            downsample = torchsparse.backend.downsample_cpu
+        out_coords = downsample(
+            _coords,
+            coords_max.contiguous(),
+            coords_min.contiguous(),
+            kernel_size_t,
+            stride_t,
+            padding_t,
+        )
+    if curve is not None:
+        out_coords = out_coords[build_curve_permutation(out_coords, curve)]
+    return out_coords
+
+
+def _downsample_bounds(
+    _coords: torch.Tensor,
+    kernel_size: torch.Tensor,
+    stride: torch.Tensor,
+    padding: torch.Tensor,
+    spatial_range: Optional[Tuple[int]] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    # (b, x, y, z) range of the spconv-style output coordinates
+    if spatial_range is not None:
+        coords_max_tuple = tuple(x - 1 for x in spatial_range)
+        coords_max = make_tensor(
+            coords_max_tuple, dtype=torch.int, device=_coords.device
+        )
+    else:
+        coords_max = _coords.max(0).values
+        coords_max[1:] = (coords_max[1:] + 2 * padding - (kernel_size - 1)) // stride
+
+    if torchsparse.tensor.get_allow_negative_coordinates():
+        coords_min = _coords.min(0).values
+        coords_min[1:] = torch.div(
+            coords_min[1:] - 2 * padding + (kernel_size - 1), stride
+        )
+    else:
+        coords_min = make_tensor((0, 0, 0, 0), dtype=torch.int, device=_coords.device)
+    return coords_min, coords_max
+
+
+def _unique_coords(coords: torch.Tensor) -> torch.Tensor:
+    # deduplicates packed 64-bit keys instead of running a lexicographic
+    # torch.unique(dim=0) over the coordinate rows. On CPU, a hash table
+    # keeps the rows in first-occurrence order; other devices still sort
+    # the keys with torch.unique (no hash-based dedup yet), so their rows
+    # come out in lexicographic order (as downsample_cuda does) and the two
+    # orders differ
+    if coords.shape[0] == 0:
+        return coords
+    if coords.device.type == "cpu":
+        return torchsparse.backend.unique_coords_cpu(coords.int())
+
+    coords_min = coords.min(0).values.long()
+    sizes = coords.max(0).values.long() - coords_min + 1
+    # same limit as unique_coords_cpu: the keys must fit in an int64
+    volume = 1
+    for size in sizes.tolist():
+        volume *= size
+    if volume >= 9.2e18:
+        raise ValueError("Coordinate range is too large to deduplicate")
+    keys = torch.zeros(coords.shape[0], dtype=torch.long, device=coords.device)
+    for k in range(coords.shape[1]):
+        keys = keys * sizes[k] + (coords[:, k].long() - coords_min[k])
+    keys = torch.unique(keys)
+
+    out_coords = torch.empty(
+        keys.shape[0], coords.shape[1], dtype=coords.dtype, device=coords.device
+    )
+    for k in reversed(range(coords.shape[1])):
+        out_coords[:, k] = (keys % sizes[k] + coords_min[k]).to(coords.dtype)
+        keys = torch.div(keys, sizes[k], rounding_mode="floor")
+    return out_coords
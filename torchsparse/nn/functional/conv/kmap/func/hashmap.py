@@ -19,6 +19,7 @@ def build_kmap_implicit_GEMM_hashmap(
     split_mask_num: int = 1,
     downsample_mode: str = "spconv",
     generative: bool = False,
+    curve: Optional[str] = None,
 ) -> Dict:
     from torchsparse.nn import functional as F
 
@@ -33,6 +34,7 @@ def build_kmap_implicit_GEMM_hashmap(
                 padding,
                 spatial_range,
                 downsample_mode=downsample_mode,
+                curve=curve,
             )
         else:
             coords = F.spupsample_generative(
@@ -51,9 +53,14 @@ def build_kmap_implicit_GEMM_hashmap(
         kmap["hashmap_vals"] = torch.zeros(
             2 * _coords.shape[0], dtype=torch.int32, device=coords.device
         )
-    hashmap = torchsparse.backend.GPUHashTable(
-        kmap["hashmap_keys"], kmap["hashmap_vals"]
-    )
+    if coords.device.type == "cuda":
+        hashmap = torchsparse.backend.GPUHashTable(
+            kmap["hashmap_keys"], kmap["hashmap_vals"]
+        )
+    else:
+        hashmap = torchsparse.backend.CPUHashTable(
+            kmap["hashmap_keys"], kmap["hashmap_vals"]
+        )
 
     if to_insert:
         if not generative:
@@ -63,7 +70,23 @@ def build_kmap_implicit_GEMM_hashmap(
             _insert_coords[:, 1:] *= stride
             hashmap.insert_coords(_insert_coords[:, [1, 2, 3, 0]])
 
-    if not generative:
+    # submanifold maps of odd kernels are symmetric: the CPU table only
+    # probes half of the offsets (see lookup_coords_symmetric)
+    symmetric = (
+        subm
+        and not generative
+        and coords.device.type == "cpu"
+        and bool((kernel_size % 2 == 1).all())
+    )
+    kmap["symmetric"] = symmetric
+    if symmetric:
+        results = (
+            hashmap.lookup_coords_symmetric(
+                coords[:, [1, 2, 3, 0]], kernel_size, kernel_volume
+            )
+            - 1
+        )
+    elif not generative:
         results = (
             hashmap.lookup_coords(
                 coords[:, [1, 2, 3, 0]], kernel_size, stride, kernel_volume
@@ -85,7 +108,7 @@ def build_kmap_implicit_GEMM_hashmap(
     kmap["coords"] = coords
     kmap["sizes"] = (input_node_num, coords.shape[0])
 
-    if ifsort:
+    if ifsort and coords.device.type == "cuda":
         bitmask = torchsparse.backend.derive_bitmask_from_out_in_map(
             results, split_mask_num, kmap["sizes"][1]
         )
@@ -117,6 +140,7 @@ def build_kmap_Gather_Scatter_hashmap(
     subm: bool = False,
     downsample_mode: str = "spconv",
     generative: bool = False,
+    curve: Optional[str] = None,
 ) -> Dict:
 
     kmap = build_kmap_implicit_GEMM_hashmap(
@@ -133,27 +157,10 @@ def build_kmap_Gather_Scatter_hashmap(
         1,
         downsample_mode,
         generative,
+        curve,
     )
 
-    results = torch.t(kmap["out_in_map"]).contiguous()
-    nbsizes = torch.sum(results != -1, dim=1)
-    nbmaps = torch.nonzero(results != -1)
-    nbmaps[:, 0] = results.view(-1)[nbmaps[:, 0] * results.size(1) + nbmaps[:, 1]]
-    # important for build masks
-    nbmaps = nbmaps.contiguous()
-    input_mask, output_mask = torchsparse.backend.build_mask_from_kmap(
-        _coords.shape[0],
-        kmap["coords"].shape[0],
-        nbmaps.int(),
-        nbsizes.int()[0 : kmap["coords"].shape[0]],
-    )
-
-    kmap["nbmaps"] = nbmaps
-    kmap["nbsizes"] = nbsizes
-    kmap["input_mask"] = input_mask
-    kmap["output_mask"] = output_mask
-
-    return kmap
+    return derive_gather_scatter_maps(kmap)
 
 
 def build_kmap_Fetch_on_Demand_hashmap(
@@ -168,6 +175,7 @@ def build_kmap_Fetch_on_Demand_hashmap(
     subm: bool = False,
     downsample_mode: str = "spconv",
     generative: bool = False,
+    curve: Optional[str] = None,
 ) -> Dict:
 
     kmap = build_kmap_implicit_GEMM_hashmap(
@@ -184,8 +192,79 @@ def build_kmap_Fetch_on_Demand_hashmap(
         1,
         downsample_mode,
         generative,
+        curve,
     )
 
+    return derive_fetch_on_demand_maps(kmap)
+
+
+def derive_gather_scatter_maps(kmap: Dict) -> Dict:
+    # per-offset neighbor lists (and CUDA masks) of the out_in_map
+    if kmap.get("symmetric", False):
+        nbmaps, nbsizes = _symmetric_gather_scatter_maps(kmap["out_in_map"])
+    else:
+        results = torch.t(kmap["out_in_map"]).contiguous()
+        nbsizes = torch.sum(results != -1, dim=1)
+        nbmaps = torch.nonzero(results != -1)
+        nbmaps[:, 0] = results.view(-1)[
+            nbmaps[:, 0] * results.size(1) + nbmaps[:, 1]
+        ]
+    # important for build masks
+    nbmaps = nbmaps.contiguous()
+    if kmap["out_in_map"].device.type == "cuda":
+        input_mask, output_mask = torchsparse.backend.build_mask_from_kmap(
+            kmap["sizes"][0],
+            kmap["sizes"][1],
+            nbmaps.int(),
+            nbsizes.int()[0 : kmap["sizes"][1]],
+        )
+    else:
+        # masks are only consumed by the CUDA gather-scatter kernels
+        input_mask, output_mask = None, None
+
+    kmap["nbmaps"] = nbmaps
+    kmap["nbsizes"] = nbsizes
+    kmap["input_mask"] = input_mask
+    kmap["output_mask"] = output_mask
+
+    return kmap
+
+
+def _symmetric_gather_scatter_maps(
+    out_in_map: torch.Tensor,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    # neighbor lists of a symmetric map (see lookup_coords_symmetric): the
+    # offsets up to the center are extracted, the pairs of offset K - 1 - k
+    # are those of offset k with input and output swapped
+    kernel_volume = out_in_map.shape[1]
+    center = kernel_volume // 2
+    results = torch.t(out_in_map[:, : center + 1]).contiguous()
+    half_sizes = torch.sum(results != -1, dim=1)
+    half = torch.nonzero(results != -1)
+    half[:, 0] = results.view(-1)[half[:, 0] * results.size(1) + half[:, 1]]
+
+    nbsizes = torch.cat([half_sizes, half_sizes[:center].flip(0)])
+    num_half = int(half_sizes.sum())
+    num_mirrored = num_half - int(half_sizes[center])
+    # pair p of offset k < center moves from half_starts[k] + r to
+    # mirrored_starts[k] + r, mirrored offsets being in reverse order
+    half_starts = torch.cumsum(half_sizes, 0) - half_sizes
+    mirrored_starts = num_mirrored - torch.cumsum(half_sizes[:center], 0)
+    offsets = torch.repeat_interleave(
+        torch.arange(center, device=out_in_map.device), half_sizes[:center]
+    )
+    positions = (
+        torch.arange(num_mirrored, device=out_in_map.device)
+        - half_starts[offsets]
+        + mirrored_starts[offsets]
+    )
+    mirrored = torch.empty_like(half[:num_mirrored])
+    mirrored[positions] = half[:num_mirrored].flip(1)
+    return torch.cat([half, mirrored]), nbsizes
+
+
+def derive_fetch_on_demand_maps(kmap: Dict) -> Dict:
+    # per-offset neighbor lists and (quantified) addresses of the out_in_map
     results = torch.t(kmap["out_in_map"]).contiguous()
     nbsizes = torch.sum(results != -1, dim=1).to(torch.int)
     nbmaps = torch.nonzero(results != -1)
@@ -0,0 +1,98 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from torchsparse import SparseTensor
+from torchsparse.utils import make_ntuple
+
+from .build_kmap import build_kernel_map
+
+__all__ = ["prebuild_kernel_maps"]
+
+
+def _normalize_signature(signature: Sequence) -> Tuple[Tuple[int, ...], ...]:
+    # (input stride, kernel size, stride, dilation[, padding]); the padding
+    # is resolved the way spnn.Conv3d resolves it
+    from torchsparse.nn.modules.conv import _get_padding
+
+    input_stride, kernel_size, stride, dilation = [
+        make_ntuple(x, ndim=3) for x in signature[:4]
+    ]
+    padding = signature[4] if len(signature) > 4 else 0
+    padding = _get_padding(kernel_size, stride, padding)
+    return input_stride, kernel_size, stride, dilation, padding
+
+
+def prebuild_kernel_maps(
+    input: SparseTensor,
+    signatures: List[Sequence],
+    config: Dict = None,
+    training: bool = False,
+) -> SparseTensor:
+    r"""
+    builds the kernel maps of the given convolution signatures, i.e. the
+    (input stride, kernel size, stride, dilation) keys used by conv3d, into
+    input._caches, so that the convolutions of the model only look them up.
+    Downsampling signatures also populate the coordinates of the next stride.
+    Meant to run inside DataLoader workers (see sparse_collate_fn).
+    """
+    from torchsparse.nn.functional.conv.conv import _get_conv_config
+
+    config, kmap_mode = _get_conv_config(config, input.coords.device, training)
+
+    _caches = input._caches
+    _caches.cmaps.setdefault(input.stride, (input.coords, input.spatial_range))
+
+    signatures = [_normalize_signature(s) for s in signatures]
+    # coarser strides depend on the coordinates produced by finer ones
+    signatures = sorted(signatures, key=lambda s: int(np.prod(s[0])))
+    for input_stride, kernel_size, stride, dilation, padding in signatures:
+        if (
+            kernel_size == (1, 1, 1)
+            and stride == (1, 1, 1)
+            and dilation == (1, 1, 1)
+        ):
+            continue
+        key = (input_stride, kernel_size, stride, dilation)
+        if key in _caches.kmaps:
+            continue
+        if input_stride not in _caches.cmaps:
+            raise ValueError(
+                f"Cannot build kernel map {key}: "
+                f"no coordinates at stride {input_stride}."
+            )
+        coords, spatial_range = _caches.cmaps[input_stride]
+
+        hashmap = _caches.hashmaps.get(input_stride)
+        if hashmap is None:
+            hashmap_keys, hashmap_vals = None, None
+        else:
+            hashmap_keys, hashmap_vals = hashmap
+
+        kmap = build_kernel_map(
+            coords,
+            coords.shape[0],
+            kernel_size,
+            stride,
+            padding,
+            hashmap_keys,
+            hashmap_vals,
+            spatial_range,
+            kmap_mode,
+            config.dataflow,
+            downsample_mode=config.downsample_mode,
+            training=training,
+            ifsort=config.ifsort,
+            split_mask_num=config.split_mask_num,
+            split_mask_num_bwd=config.split_mask_num_bwd,
+            kmap_format=config.kmap_format,
+            curve=_caches.curve,
+        )
+        _caches.kmaps[key] = kmap
+        _caches.hashmaps[input_stride] = [kmap["hashmap_keys"], kmap["hashmap_vals"]]
+
+        output_stride = tuple(input_stride[k] * stride[k] for k in range(3))
+        _caches.cmaps.setdefault(
+            output_stride, (kmap["coords"], kmap["spatial_range"])
+        )
+    return input
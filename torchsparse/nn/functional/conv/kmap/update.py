@@ -0,0 +1,410 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+
+import torchsparse.backend
+from torchsparse.utils import make_divisible, make_tensor
+from torchsparse.utils.tensor_cache import TensorCache
+
+from .build_kmap import _bwd_keys, cta_M
+from .compact import compact_out_in_map, decode_out_in_map
+from .downsample import _downsample_bounds
+from .func import derive_fetch_on_demand_maps, derive_gather_scatter_maps
+
+__all__ = ["update_kernel_maps"]
+
+# hash tables are rebuilt (at twice the number of coordinates) instead of
+# patched once this fraction of their slots is used; removed keys keep their
+# slot until then
+max_load_factor = 0.75
+
+# derived maps that are dropped (and rebuilt on demand) when a kmap is patched
+_derived_keys = (
+    "reorder_out_in_map",
+    "reduced_sorted_mask",
+    "reorder_loc",
+    "sorted_mask",
+    "out_in_map_t",
+    "reorder_out_in_map_t",
+    "reduced_sorted_mask_t",
+    "reorder_loc_t",
+) + _bwd_keys + tuple(key + "_t" for key in _bwd_keys)
+
+
+def update_kernel_maps(
+    caches: TensorCache,
+    coords: torch.Tensor,
+    stride: Tuple[int, ...],
+    inserted_coords: torch.Tensor,
+    deleted_coords: torch.Tensor,
+    spatial_range: Optional[Tuple[int, ...]] = None,
+) -> Dict[Tuple[int, ...], Dict[str, Any]]:
+    r"""
+    patches the hash tables, coordinate maps and kernel maps in caches for
+    removing deleted_coords from, and appending inserted_coords to, the
+    coordinates of the given stride. Rows are compacted by moving rows from
+    the tail into the holes left by deletions, and the changes are carried
+    to every stride reached by a cached downsampling map. Only the kmap rows
+    around changed coordinates are looked up again, so the cost scales with
+    the size of the delta rather than the scene. Maps that cannot be patched
+    (built on the fly, or downsampled within a range that depends on the
+    scene extent, which changed) are dropped and rebuilt on demand.
+
+    Returns, for every updated stride, the previous and new coordinates
+    ("old_coords", "coords"), the number of rows kept in place
+    ("num_kept"), the rows those were filled with ("holes", "movers") and
+    the coordinates removed, moved or added ("touched"). The deltas are also
+    kept in caches.deltas, and caches.version counts the updates.
+    """
+    inserted_coords = inserted_coords.int()
+    deleted_coords = deleted_coords.int()
+
+    foreign = [
+        key for key, kmap in caches.kmaps.items() if kmap.get("kmap_mode") != "hashmap"
+    ]
+    for key in foreign:
+        del caches.kmaps[key]
+    if foreign:
+        # on-the-fly tables have a different layout
+        caches.hashmaps.clear()
+        caches.hashmap_slots.clear()
+
+    deltas = {}
+    patched = set()
+    # (stride, coords, spatial range, the downsampling map producing the level)
+    queue: List[Tuple[Any, ...]] = [(stride, coords, spatial_range, None)]
+    while queue:
+        level, old_coords, level_range, source = queue.pop(0)
+        hashmap = _get_hashmap(caches, level, old_coords)
+        if source is None:
+            delta = _compact(
+                caches, level, hashmap, old_coords, deleted_coords, inserted_coords
+            )
+        else:
+            key, kmap, in_delta, in_hashmap, in_coords = source
+            changes = _downsample_delta(
+                kmap, key, in_delta, in_hashmap, in_coords, hashmap
+            )
+            if changes is None:
+                continue
+            delta = _compact(caches, level, hashmap, old_coords, *changes)
+            _patch_kmap(
+                kmap,
+                in_delta,
+                caches.hashmaps[key[0]],
+                delta,
+                caches.hashmaps[level],
+                key[1],
+                key[2],
+            )
+            caches.kmaps[key] = kmap
+            patched.add(key)
+        deltas[level] = delta
+        caches.cmaps[level] = (delta["coords"], level_range)
+
+        for key, kmap in list(caches.kmaps.items()):
+            if key[0] != level:
+                continue
+            if all(s == 1 for s in key[2]):
+                _patch_kmap(
+                    kmap,
+                    delta,
+                    caches.hashmaps[level],
+                    delta,
+                    caches.hashmaps[level],
+                    key[1],
+                    key[2],
+                )
+                caches.kmaps[key] = kmap
+                patched.add(key)
+                continue
+            out_level = tuple(level[k] * key[2][k] for k in range(3))
+            cmap = dict.get(caches.cmaps, out_level)
+            if (
+                cmap is None
+                or kmap["coords"] is not cmap[0]
+                or out_level in deltas
+                or any(item[0] == out_level for item in queue)
+            ):
+                # not the map that produced the cached coordinates
+                continue
+            queue.append(
+                (
+                    out_level,
+                    cmap[0],
+                    cmap[1],
+                    (key, kmap, delta, caches.hashmaps[level], old_coords),
+                )
+            )
+
+    # everything not reached is stale: rebuilt on demand
+    for key in [key for key in caches.kmaps if key not in patched]:
+        del caches.kmaps[key]
+    for maps in (caches.cmaps, caches.hashmaps, caches.hashmap_slots):
+        for level in [level for level in maps if level not in deltas]:
+            del maps[level]
+    if foreign:
+        caches.hashmaps.clear()
+        caches.hashmap_slots.clear()
+    caches.deltas = deltas
+    caches.version += 1
+    return deltas
+
+
+def _hash_table(hashmap: List[torch.Tensor]):
+    if hashmap[0].device.type == "cuda":
+        return torchsparse.backend.GPUHashTable(hashmap[0], hashmap[1])
+    return torchsparse.backend.CPUHashTable(hashmap[0], hashmap[1])
+
+
+def _build_hashmap(coords: torch.Tensor, capacity: int) -> List[torch.Tensor]:
+    hashmap = [
+        torch.zeros(capacity, dtype=torch.int64, device=coords.device),
+        torch.zeros(capacity, dtype=torch.int32, device=coords.device),
+    ]
+    _hash_table(hashmap).insert_coords(coords[:, [1, 2, 3, 0]].contiguous())
+    return hashmap
+
+
+def _get_hashmap(
+    caches: TensorCache, level: Tuple[int, ...], coords: torch.Tensor
+) -> List[torch.Tensor]:
+    hashmap = dict.get(caches.hashmaps, level)
+    if hashmap is None:
+        hashmap = _build_hashmap(coords, max(2 * coords.shape[0], 2))
+        caches.hashmaps[level] = hashmap
+        caches.hashmap_slots[level] = coords.shape[0]
+    elif level not in caches.hashmap_slots:
+        caches.hashmap_slots[level] = int((hashmap[0] != 0).sum())
+    return hashmap
+
+
+def _lookup(
+    hashmap: List[torch.Tensor],
+    coords: torch.Tensor,
+    kernel_size: Tuple[int, ...] = (1, 1, 1),
+    stride: Tuple[int, ...] = (1, 1, 1),
+) -> torch.Tensor:
+    # rows of the kernel neighbors of coords (N, K), -1 where missing
+    kernel_volume = kernel_size[0] * kernel_size[1] * kernel_size[2]
+    if coords.shape[0] == 0:
+        return coords.new_full((0, kernel_volume), -1)
+    results = _hash_table(hashmap).lookup_coords(
+        coords[:, [1, 2, 3, 0]].contiguous(),
+        make_tensor(kernel_size, dtype=torch.int, device=coords.device),
+        make_tensor(stride, dtype=torch.int, device=coords.device),
+        kernel_volume,
+    )
+    return results[: coords.shape[0]] - 1
+
+
+def _update(hashmap: List[torch.Tensor], coords: torch.Tensor, rows: torch.Tensor):
+    if coords.shape[0] > 0:
+        _hash_table(hashmap).update_coords(
+            coords[:, [1, 2, 3, 0]].contiguous(), rows.long().contiguous()
+        )
+
+
+def _compact(
+    caches: TensorCache,
+    level: Tuple[int, ...],
+    hashmap: List[torch.Tensor],
+    coords: torch.Tensor,
+    deleted_coords: torch.Tensor,
+    inserted_coords: torch.Tensor,
+) -> Dict[str, Any]:
+    num_rows = coords.shape[0]
+    deleted = _lookup(hashmap, deleted_coords)[:, 0].long()
+    if (deleted < 0).any():
+        raise ValueError("Deleted coordinates are not in the tensor")
+    deleted = torch.unique(deleted)
+    # coordinates may be deleted and inserted again in the same update
+    found = _lookup(hashmap, inserted_coords)[:, 0].long()
+    if (
+        torch.unique(inserted_coords, dim=0).shape[0] != inserted_coords.shape[0]
+        or ((found >= 0) & ~torch.isin(found, deleted)).any()
+    ):
+        raise ValueError("Inserted coordinates must be distinct and new")
+
+    # rows past num_kept that survive fill the holes left by deletions
+    num_kept = num_rows - deleted.shape[0]
+    holes = deleted[deleted < num_kept]
+    tail = torch.ones(num_rows - num_kept, dtype=torch.bool, device=coords.device)
+    tail[deleted[deleted >= num_kept] - num_kept] = False
+    movers = torch.nonzero(tail).view(-1) + num_kept
+
+    new_coords = torch.cat([coords[:num_kept], inserted_coords])
+    new_coords[holes] = coords[movers]
+    inserted = torch.arange(
+        num_kept, new_coords.shape[0], dtype=torch.long, device=coords.device
+    )
+
+    _update(hashmap, coords[deleted], torch.full_like(deleted, -1))
+    slots = caches.hashmap_slots[level] + inserted_coords.shape[0]
+    if slots > max_load_factor * hashmap[0].shape[0]:
+        hashmap = _build_hashmap(new_coords, max(2 * new_coords.shape[0], 2))
+        slots = new_coords.shape[0]
+    else:
+        _update(hashmap, coords[movers], holes)
+        _update(hashmap, inserted_coords, inserted)
+    caches.hashmaps[level] = hashmap
+    caches.hashmap_slots[level] = slots
+
+    return {
+        "old_coords": coords,
+        "coords": new_coords,
+        "num_kept": num_kept,
+        "holes": holes,
+        "movers": movers,
+        "touched": torch.cat([coords[deleted], coords[movers], inserted_coords]),
+    }
+
+
+def _offsets(sizes: Tuple[int, ...], device) -> torch.Tensor:
+    # (prod(sizes), 3) grid of offsets in [0, sizes)
+    return torch.cartesian_prod(
+        *[torch.arange(size, dtype=torch.int, device=device) for size in sizes]
+    ).view(-1, 3)
+
+
+def _downsample_delta(
+    kmap: Dict,
+    key: Tuple[Any, ...],
+    in_delta: Dict[str, Any],
+    in_hashmap: List[torch.Tensor],
+    in_coords: torch.Tensor,
+    hashmap: List[torch.Tensor],
+) -> Optional[Tuple[torch.Tensor, torch.Tensor]]:
+    # output coordinates removed and added by a downsampling step: candidates
+    # are generated from the touched inputs with the rule of spdownsample,
+    # and exist when any input is left in their generation window
+    _, kernel_size, stride, _ = key
+    device = in_coords.device
+    touched = in_delta["touched"]
+    stride_t = make_tensor(stride, dtype=torch.int, device=device)
+    if (
+        all(stride[k] in [1, kernel_size[k]] for k in range(3))
+        or kmap["downsample_mode"] == "minkowski"
+    ):
+        candidates = touched.clone()
+        candidates[:, 1:] = torch.div(touched[:, 1:], stride_t, rounding_mode="floor")
+        padding_t = torch.zeros_like(stride_t)
+        window = _offsets(stride, device)
+    else:
+        if kmap["padding"] is None:
+            return None
+        kernel_size_t = make_tensor(kernel_size, dtype=torch.int, device=device)
+        padding_t = make_tensor(kmap["padding"], dtype=torch.int, device=device)
+        # the output range follows the scene extent without a spatial range
+        bounds = _downsample_bounds(
+            in_coords, kernel_size_t, stride_t, padding_t, kmap["spatial_range"]
+        )
+        new_bounds = _downsample_bounds(
+            in_delta["coords"],
+            kernel_size_t,
+            stride_t,
+            padding_t,
+            kmap["spatial_range"],
+        )
+        if not all(torch.equal(x, y) for x, y in zip(bounds, new_bounds)):
+            return None
+        window = _offsets(kernel_size, device)
+        shifted = touched[:, None, 1:] + padding_t - window
+        valid = (torch.remainder(shifted, stride_t) == 0).all(-1)
+        candidates = torch.cat(
+            [
+                touched[:, None, :1].expand(-1, window.shape[0], 1),
+                torch.div(shifted, stride_t, rounding_mode="floor"),
+            ],
+            -1,
+        )[valid]
+        inside = ((candidates >= bounds[0]) & (candidates <= bounds[1])).all(1)
+        candidates = candidates[inside]
+    candidates = torch.unique(candidates, dim=0)
+
+    sources = candidates[:, None, 1:] * stride_t - padding_t + window
+    sources = torch.cat(
+        [candidates[:, None, :1].expand(-1, window.shape[0], 1), sources], -1
+    )
+    exists = (_lookup(in_hashmap, sources.view(-1, 4))[:, 0] >= 0).view(
+        candidates.shape[0], window.shape[0]
+    )
+    exists = exists.any(1)
+    existed = _lookup(hashmap, candidates)[:, 0] >= 0
+    return candidates[existed & ~exists], candidates[~existed & exists]
+
+
+def _window_outputs(
+    coords: torch.Tensor,
+    kernel_size: Tuple[int, ...],
+    stride: Tuple[int, ...],
+    transposed: bool = False,
+) -> torch.Tensor:
+    # coordinates of the outputs whose kernel window holds coords (which may
+    # not exist); the outputs are at the finer stride when transposed
+    device = coords.device
+    stride_t = make_tensor(stride, dtype=torch.int, device=device)
+    offsets = _offsets(kernel_size, device) - make_tensor(
+        tuple((k - 1) // 2 for k in kernel_size), dtype=torch.int, device=device
+    )
+    batch = coords[:, None, :1].expand(-1, offsets.shape[0], 1)
+    if transposed:
+        outputs = torch.cat([batch, coords[:, None, 1:] * stride_t + offsets], -1)
+        return outputs.view(-1, 4)
+    shifted = coords[:, None, 1:] - offsets
+    valid = (torch.remainder(shifted, stride_t) == 0).all(-1)
+    return torch.cat(
+        [batch, torch.div(shifted, stride_t, rounding_mode="floor")], -1
+    )[valid]
+
+
+def _patch_kmap(
+    kmap: Dict,
+    in_delta: Dict[str, Any],
+    in_hashmap: List[torch.Tensor],
+    out_delta: Dict[str, Any],
+    out_hashmap: List[torch.Tensor],
+    kernel_size: Tuple[int, ...],
+    stride: Tuple[int, ...],
+) -> None:
+    # looks up the outputs whose kernel window holds a touched input, or
+    # which were touched themselves, again
+    out_coords = out_delta["coords"]
+    candidates = torch.cat(
+        [
+            _window_outputs(in_delta["touched"], kernel_size, stride),
+            out_delta["touched"],
+        ]
+    )
+    rows = _lookup(out_hashmap, candidates)[:, 0].long()
+    rows = torch.unique(rows[rows >= 0])
+
+    num_inputs = in_delta["coords"].shape[0]
+    num_outputs = out_coords.shape[0]
+    out_in_map = decode_out_in_map(kmap["out_in_map"])
+    num_padded = make_divisible(num_outputs, cta_M)
+    if out_in_map.shape[0] != num_padded:
+        resized = out_in_map.new_full((num_padded, out_in_map.shape[1]), -1)
+        num_copied = min(num_padded, out_in_map.shape[0])
+        resized[:num_copied] = out_in_map[:num_copied]
+        out_in_map = resized
+    out_in_map[num_outputs : kmap["sizes"][1]] = -1
+    out_in_map[rows] = _lookup(in_hashmap, out_coords[rows], kernel_size, stride).to(
+        out_in_map.dtype
+    )
+
+    if kmap.get("kmap_format") == "compact":
+        out_in_map = compact_out_in_map(out_in_map)
+    kmap["out_in_map"] = out_in_map
+    kmap["coords"] = out_coords
+    kmap["sizes"] = (num_inputs, num_outputs)
+    kmap["hashmap_keys"], kmap["hashmap_vals"] = in_hashmap
+    # rows of out_in_map that were looked up again
+    kmap["updated_rows"] = rows
+    for key in _derived_keys:
+        if kmap.get(key) is not None:
+            kmap[key] = None
+    if kmap.get("nbaddrs") is not None:
+        derive_fetch_on_demand_maps(kmap)
+    elif kmap.get("nbmaps") is not None:
+        derive_gather_scatter_maps(kmap)
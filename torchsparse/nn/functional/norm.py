@@ -0,0 +1,122 @@
+from typing import Any, Dict, Optional
+
+import torch
+from torch.autograd import Function
+
+import torchsparse.backend
+from torchsparse.nn.functional.segment import segment_sum
+
+__all__ = ["group_norm", "instance_norm"]
+
+
+class GroupNormFunction(Function):
+    @staticmethod
+    def forward(
+        ctx,
+        feats: torch.Tensor,
+        weight: Optional[torch.Tensor],
+        bias: Optional[torch.Tensor],
+        batch: torch.Tensor,
+        batch_size: int,
+        num_groups: int,
+        eps: float,
+    ) -> torch.Tensor:
+        feats = feats.contiguous()
+        empty = feats.new_empty(0)
+        output, mean, rstd = torchsparse.backend.group_norm_forward_cpu(
+            feats,
+            batch,
+            weight if weight is not None else empty,
+            bias if bias is not None else empty,
+            batch_size,
+            num_groups,
+            eps,
+        )
+        ctx.for_backwards = (feats, weight, batch, mean, rstd, batch_size, num_groups)
+        return output
+
+    @staticmethod
+    def backward(ctx, grad_output: torch.Tensor):
+        feats, weight, batch, mean, rstd, batch_size, num_groups = ctx.for_backwards
+        grads = torchsparse.backend.group_norm_backward_cpu(
+            grad_output.contiguous().to(feats.dtype),
+            feats,
+            batch,
+            mean,
+            rstd,
+            weight if weight is not None else feats.new_empty(0),
+            batch_size,
+            num_groups,
+        )
+        grad_feats, grad_weight, grad_bias = grads
+        if weight is None:
+            grad_weight = grad_bias = None
+        return grad_feats, grad_weight, grad_bias, None, None, None, None
+
+
+def _group_norm_segments(
+    feats: torch.Tensor,
+    segments: Dict[str, Any],
+    num_groups: int,
+    weight: Optional[torch.Tensor],
+    bias: Optional[torch.Tensor],
+    eps: float,
+) -> torch.Tensor:
+    # composite of segment reductions, for devices without a fused kernel
+    batch = segments["batch"]
+    num_channels = feats.shape[1]
+    group_size = num_channels // num_groups
+
+    x = feats
+    if x.dtype in [torch.float16, torch.bfloat16]:
+        x = x.float()
+    x = x.view(-1, num_groups, group_size)
+    counts = segments["counts"].to(x.dtype).unsqueeze(1) * group_size
+    mean = segment_sum(x.sum(2), segments) / counts
+    x = x - mean[batch].unsqueeze(2)
+    var = segment_sum(x.pow(2).sum(2), segments) / counts
+    x = x * torch.rsqrt(var + eps)[batch].unsqueeze(2)
+    output = x.reshape(-1, num_channels)
+    if weight is not None:
+        output = output * weight + bias
+    return output.to(feats.dtype)
+
+
+def group_norm(
+    feats: torch.Tensor,
+    segments: Dict[str, Any],
+    num_groups: int,
+    weight: Optional[torch.Tensor] = None,
+    bias: Optional[torch.Tensor] = None,
+    eps: float = 1e-5,
+) -> torch.Tensor:
+    """Group normalization of every sample of a sparse batch.
+
+    The mean and variance of each (sample, group) pair are segment reductions
+    over the rows of the sample (``segments`` is
+    ``SparseTensor.batch_segments()``). On CPU, the statistics, normalization
+    and backward run in fused single-pass kernels.
+    """
+    assert feats.shape[1] % num_groups == 0
+    if feats.device.type == "cpu":
+        return GroupNormFunction.apply(
+            feats,
+            weight,
+            bias,
+            segments["batch"],
+            segments["batch_size"],
+            num_groups,
+            eps,
+        )
+    return _group_norm_segments(feats, segments, num_groups, weight, bias, eps)
+
+
+def instance_norm(
+    feats: torch.Tensor,
+    segments: Dict[str, Any],
+    weight: Optional[torch.Tensor] = None,
+    bias: Optional[torch.Tensor] = None,
+    eps: float = 1e-5,
+) -> torch.Tensor:
+    """Instance normalization: every channel of every sample on its own."""
+    return group_norm(feats, segments, feats.shape[1], weight, bias, eps)
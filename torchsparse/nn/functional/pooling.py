@@ -1,27 +1,187 @@
+from typing import Dict, List, Tuple, Union
+
 import torch
+from torch.autograd import Function
 
+import torchsparse.backend
 from torchsparse import SparseTensor
+from torchsparse.nn.functional.segment import segment_max, segment_mean
+from torchsparse.utils import make_ntuple
 
-__all__ = ["global_avg_pool", "global_max_pool"]
+__all__ = ["global_avg_pool", "global_max_pool", "max_pool3d", "avg_pool3d"]
 
 
 def global_avg_pool(inputs: SparseTensor) -> torch.Tensor:
-    batch_size = torch.max(inputs.coords[:, 0]).item() + 1
-    outputs = []
-    for k in range(batch_size):
-        input = inputs.feats[inputs.coords[:, 0] == k]
-        output = torch.mean(input, dim=0)
-        outputs.append(output)
-    outputs = torch.stack(outputs, dim=0)
-    return outputs
+    return segment_mean(inputs.feats, inputs.batch_segments())
 
 
 def global_max_pool(inputs: SparseTensor) -> torch.Tensor:
-    batch_size = torch.max(inputs.coords[:, 0]).item() + 1
-    outputs = []
-    for k in range(batch_size):
-        input = inputs.feats[inputs.coords[:, 0] == k]
-        output = torch.max(input, dim=0)[0]
-        outputs.append(output)
-    outputs = torch.stack(outputs, dim=0)
-    return outputs
+    return segment_max(inputs.feats, inputs.batch_segments())
+
+
+class MaxPoolFunction(Function):
+    @staticmethod
+    def forward(
+        ctx, feats: torch.Tensor, out_in_map: torch.Tensor, num_out: int
+    ) -> torch.Tensor:
+        feats = feats.contiguous()
+        if feats.device.type == "cpu":
+            output, argmax = torchsparse.backend.max_pool_forward_cpu(
+                feats, out_in_map, num_out
+            )
+        else:
+            in_map = out_in_map.long()
+            neighbors = feats[in_map.clamp(min=0)]
+            neighbors.masked_fill_((in_map < 0).unsqueeze(-1), float("-inf"))
+            output, index = neighbors.max(dim=1)
+            argmax = in_map.gather(1, index).int()
+            output.masked_fill_(argmax < 0, 0)
+        ctx.for_backwards = (out_in_map, argmax, feats.shape[0])
+        return output
+
+    @staticmethod
+    def backward(ctx, grad_output: torch.Tensor):
+        out_in_map, argmax, num_in = ctx.for_backwards
+        grad_output = grad_output.contiguous()
+        if grad_output.device.type == "cpu":
+            grad_input = torchsparse.backend.max_pool_backward_cpu(
+                grad_output, out_in_map, argmax, num_in
+            )
+        else:
+            grad_input = grad_output.new_zeros(num_in + 1, grad_output.shape[1])
+            # outputs without any input write into the spare last row
+            index = torch.where(argmax < 0, num_in, argmax).long()
+            grad_input.scatter_add_(0, index, grad_output)
+            grad_input = grad_input[:num_in]
+        return grad_input, None, None
+
+
+class AvgPoolFunction(Function):
+    @staticmethod
+    def forward(
+        ctx, feats: torch.Tensor, out_in_map: torch.Tensor, num_out: int
+    ) -> torch.Tensor:
+        feats = feats.contiguous()
+        if feats.device.type == "cpu":
+            output, counts = torchsparse.backend.avg_pool_forward_cpu(
+                feats, out_in_map, num_out
+            )
+        else:
+            in_map = out_in_map.long()
+            mask = (in_map >= 0).unsqueeze(-1).to(feats.dtype)
+            counts = mask.sum(1).clamp(min=1)
+            output = (feats[in_map.clamp(min=0)] * mask).sum(1) / counts
+            counts = counts.squeeze(-1).int()
+        ctx.for_backwards = (out_in_map, counts, feats.shape[0])
+        return output
+
+    @staticmethod
+    def backward(ctx, grad_output: torch.Tensor):
+        out_in_map, counts, num_in = ctx.for_backwards
+        grad_output = grad_output.contiguous()
+        if grad_output.device.type == "cpu":
+            grad_input = torchsparse.backend.avg_pool_backward_cpu(
+                grad_output, out_in_map, counts, num_in
+            )
+        else:
+            in_map = out_in_map.long()
+            out_index, offsets = torch.nonzero(in_map >= 0, as_tuple=True)
+            grad_output = grad_output / counts.unsqueeze(-1).to(grad_output.dtype)
+            grad_input = grad_output.new_zeros(num_in, grad_output.shape[1])
+            grad_input.index_add_(
+                0, in_map[out_index, offsets], grad_output[out_index]
+            )
+        return grad_input, None, None
+
+
+def _pool3d(
+    PoolFunction,
+    input: SparseTensor,
+    kernel_size: Union[int, List[int], Tuple[int, ...]],
+    stride: Union[int, List[int], Tuple[int, ...], None],
+    padding: Union[int, Tuple[int, ...]],
+    dilation: Union[int, Tuple[int, ...]],
+    config: Dict,
+    training: bool,
+) -> SparseTensor:
+    from torchsparse.nn import functional as F
+    from torchsparse.nn.functional.conv.conv import _get_conv_config, _get_kernel_map
+
+    kernel_size = make_ntuple(kernel_size, ndim=3)
+    stride = kernel_size if stride is None else make_ntuple(stride, ndim=3)
+    dilation = make_ntuple(dilation, ndim=3)
+
+    config, kmap_mode = _get_conv_config(config, input.coords.device, training)
+
+    # the same kernel map (and output coordinates) as a Conv3d of this shape
+    kmap = _get_kernel_map(
+        input, kernel_size, stride, padding, dilation, config, kmap_mode, training
+    )
+    num_out = kmap["sizes"][1]
+    out_in_map = F.decode_out_in_map(kmap["out_in_map"])
+    out_in_map = out_in_map[:num_out].int().contiguous()
+    feats = PoolFunction.apply(input.feats, out_in_map, num_out)
+
+    output = SparseTensor(
+        coords=kmap["coords"],
+        feats=feats,
+        stride=tuple(input.stride[k] * stride[k] for k in range(3)),
+        spatial_range=kmap["spatial_range"],
+    )
+    output._caches = input._caches
+    output._caches.cmaps.setdefault(
+        output.stride, (output.coords, output.spatial_range)
+    )
+    return output
+
+
+def max_pool3d(
+    input: SparseTensor,
+    kernel_size: Union[int, List[int], Tuple[int, ...]],
+    stride: Union[int, List[int], Tuple[int, ...], None] = None,
+    padding: Union[int, Tuple[int, ...]] = 0,
+    dilation: Union[int, Tuple[int, ...]] = 1,
+    config: Dict = None,
+    training: bool = False,
+) -> SparseTensor:
+    r"""
+    sparse 3D max pooling: every output takes the channel-wise maximum over
+    its valid neighbors. The kernel map is shared with (and cached like) a
+    Conv3d of the same kernel size and stride, so the output coordinates
+    match those of spdownsample. stride defaults to kernel_size.
+    """
+    return _pool3d(
+        MaxPoolFunction,
+        input,
+        kernel_size,
+        stride,
+        padding,
+        dilation,
+        config,
+        training,
+    )
+
+
+def avg_pool3d(
+    input: SparseTensor,
+    kernel_size: Union[int, List[int], Tuple[int, ...]],
+    stride: Union[int, List[int], Tuple[int, ...], None] = None,
+    padding: Union[int, Tuple[int, ...]] = 0,
+    dilation: Union[int, Tuple[int, ...]] = 1,
+    config: Dict = None,
+    training: bool = False,
+) -> SparseTensor:
+    r"""
+    sparse 3D average pooling: every output takes the mean over its valid
+    neighbors (empty sites are not counted), see max_pool3d.
+    """
+    return _pool3d(
+        AvgPoolFunction,
+        input,
+        kernel_size,
+        stride,
+        padding,
+        dilation,
+        config,
+        training,
+    )
@@ -0,0 +1,30 @@
+from typing import Any, Dict
+
+import torch
+
+__all__ = ["segment_sum", "segment_mean", "segment_max"]
+
+
+def _acc_dtype(dtype: torch.dtype) -> torch.dtype:
+    # half precision sums accumulate in fp32, as torch.mean does
+    return torch.float32 if dtype in [torch.float16, torch.bfloat16] else dtype
+
+
+def segment_sum(feats: torch.Tensor, segments: Dict[str, Any]) -> torch.Tensor:
+    outputs = feats.new_zeros(segments["batch_size"], *feats.shape[1:])
+    return outputs.index_add_(0, segments["batch"], feats)
+
+
+def segment_mean(feats: torch.Tensor, segments: Dict[str, Any]) -> torch.Tensor:
+    outputs = segment_sum(feats.to(_acc_dtype(feats.dtype)), segments)
+    counts = segments["counts"].to(outputs.dtype)
+    outputs = outputs / counts.view(-1, *([1] * (feats.dim() - 1)))
+    return outputs.to(feats.dtype)
+
+
+def segment_max(feats: torch.Tensor, segments: Dict[str, Any]) -> torch.Tensor:
+    if segments["perm"] is not None:
+        feats = feats[segments["perm"]]
+    return torch.segment_reduce(
+        feats, "max", lengths=segments["counts"], unsafe=True
+    )
@@ -5,6 +5,8 @@ import torch
 from torch import nn
 
 from torchsparse import SparseTensor
+from torchsparse.nn import functional as F
+from torchsparse.utils.segment import build_coord_segments
 
 __all__ = [
     "ToBEVConvolution",
@@ -14,6 +16,21 @@ __all__ = [
 ]
 
 
+def _height_matmul(
+    feats: torch.Tensor, heights: torch.Tensor, kernel: torch.Tensor
+) -> torch.Tensor:
+    # feats[i] @ kernel[heights[i]] as one matmul per height bucket, without
+    # gathering an (N, Cin, Cout) kernel per row
+    heights = heights.long()
+    counts = torch.bincount(heights, minlength=kernel.shape[0]).tolist()
+    rows = torch.split(torch.sort(heights, stable=True)[1], counts)
+    output = feats.new_empty(feats.shape[0], kernel.shape[-1])
+    for height, index in enumerate(rows):
+        if index.numel() > 0:
+            output[index] = feats[index].matmul(kernel[height])
+    return output
+
+
 class ToBEVReduction(nn.Module):
     def __init__(self, dim: int = 1) -> None:
         super().__init__()
@@ -27,11 +44,9 @@ class ToBEVReduction(nn.Module):
 
         coords = coords.clone()
         coords[:, self.dim] = 0
-        feats = torch.cat([torch.ones_like(feats[:, :1]), feats], axis=1)
-        tensor = torch.sparse_coo_tensor(coords.t().long(), feats).to_dense()
-        coords = tensor.indices().t().int()
-        feats = tensor.values()[:, 1:] / tensor.values()[:, :1]
-        return SparseTensor(coords=coords, feats=feats, stride=stride)
+        segments = build_coord_segments(coords)
+        feats = F.segment_mean(feats, segments)
+        return SparseTensor(coords=segments["coords"], feats=feats, stride=stride)
 
 
 class ToDenseBEVConvolution(nn.Module):
@@ -87,25 +102,22 @@ class ToDenseBEVConvolution(nn.Module):
 
     def forward(self, input: SparseTensor) -> torch.Tensor:
         coords, feats, stride = input.coords, input.feats, input.stride
-        stride = torch.tensor(stride).unsqueeze(dim=0).to(feats)[:, self.dim]
+        stride = stride[self.dim - 1]
 
-        kernel = torch.index_select(
-            self.kernel, 0, torch.div(coords[:, self.dim], stride).trunc().long()
-        )
-        feats = (feats.unsqueeze(dim=-1) * kernel).sum(1) + self.bias
+        heights = torch.div(coords[:, self.dim], stride, rounding_mode="trunc")
+        feats = _height_matmul(feats, heights, self.kernel) + self.bias
         coords = (coords - self.offset).t()[[0] + self.bev_dims].long()
-        coords[1:] = torch.div(coords[1:], stride).trunc().long()
+        coords[1:] = torch.div(coords[1:], stride, rounding_mode="trunc")
         indices = (
             coords[0] * int(self.bev_shape.prod())
             + coords[1] * int(self.bev_shape[1])
             + coords[2]
         )
         batch_size = coords[0].max().item() + 1
-        output = torch.sparse_coo_tensor(
-            indices.unsqueeze(dim=0),
-            feats,
-            torch.Size([batch_size * int(self.bev_shape.prod()), feats.size(-1)]),
-        ).to_dense()
+        output = feats.new_zeros(
+            batch_size * int(self.bev_shape.prod()), feats.size(-1)
+        )
+        output.index_add_(0, indices, feats)
         output = output.view(batch_size, *self.bev_shape, -1)
         output = output.permute(0, 3, 1, 2).contiguous()
         return output
@@ -144,20 +156,21 @@ class ToBEVConvolution(nn.Module):
 
     def forward(self, input: SparseTensor) -> torch.Tensor:
         coords, feats, stride = input.coords, input.feats, input.stride
-        ratio = stride * self.stride
-        stride = torch.tensor(stride).unsqueeze(dim=0).to(feats)[:, self.dim]
+        ratio = tuple(s * self.stride for s in stride)
 
-        kernels = torch.index_select(
-            self.kernel, 0, torch.div(coords[:, self.dim].long(), stride).trunc()
+        heights = torch.div(
+            coords[:, self.dim], stride[self.dim - 1], rounding_mode="trunc"
         )
-        feats = (feats.unsqueeze(dim=-1) * kernels).sum(1) + self.bias
-        coords = coords.t().long()
-        coords[self.dim, :] = 0
+        feats = _height_matmul(feats, heights, self.kernel) + self.bias
+        coords = coords.clone()
+        coords[:, self.dim] = 0
         if self.stride > 1:
-            coords[:3] /= ratio
-            coords[:3] *= ratio
-        flatten = torch.sparse_coo_tensor(coords, feats).to_dense()
-        return SparseTensor(flatten.values(), flatten.indices().t().int(), ratio)
+            coords[:, 1:] = torch.div(
+                coords[:, 1:], self.stride, rounding_mode="floor"
+            )
+        segments = build_coord_segments(coords)
+        feats = F.segment_sum(feats, segments)
+        return SparseTensor(feats, segments["coords"], ratio)
 
 
 class ToBEVHeightCompression(nn.Module):
@@ -212,11 +225,8 @@ class ToBEVHeightCompression(nn.Module):
             + coords[3]
         )
         batch_size = coords[0].max().item() + 1
-        output = torch.sparse_coo_tensor(
-            indices.unsqueeze(dim=0),
-            feats,
-            torch.Size([batch_size * int(self.shape.prod()), feats.size(-1)]),
-        ).to_dense()
+        output = feats.new_zeros(batch_size * int(self.shape.prod()), feats.size(-1))
+        output.index_add_(0, indices, feats)
         output = output.view(batch_size, *self.bev_shape.cpu().numpy(), -1)
         output = output.permute(0, 3, 1, 2).contiguous()
         return output
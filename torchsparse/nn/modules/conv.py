@@ -19,6 +19,21 @@ from torchsparse.utils import make_ntuple
 __all__ = ["Conv3d"]
 
 
+def _get_padding(
+    kernel_size: Tuple[int, ...],
+    stride: Tuple[int, ...],
+    padding: Union[int, Tuple[int, ...]],
+) -> Tuple[int, ...]:
+    # odd kernels with unit stride keep the coordinates ("same" padding)
+    _padding = make_ntuple(padding, 3)
+    return tuple(
+        (kernel_size[i] - 1) // 2
+        if kernel_size[i] % 2 == 1 and stride[i] == 1
+        else _padding[i]
+        for i in range(3)
+    )
+
+
 class Conv3d(nn.Module):
     def __init__(
         self,
@@ -32,26 +47,28 @@ class Conv3d(nn.Module):
         transposed: bool = False,
         generative: bool = False,
         config: Dict = None,
+        groups: int = 1,
     ) -> None:
         super().__init__()
+        if in_channels % groups != 0 or out_channels % groups != 0:
+            raise ValueError("in_channels and out_channels must be divisible by groups")
         self.in_channels = in_channels
         self.out_channels = out_channels
+        self.groups = groups
         self.kernel_size = make_ntuple(kernel_size, ndim=3)
         self.stride = make_ntuple(stride, ndim=3)
         self.dilation = dilation
-        _padding = make_ntuple(padding, 3)
-        self.padding = ()
-        for i in range(3):
-            if self.kernel_size[i] % 2 == 1 and self.stride[i] == 1:
-                self.padding += ((self.kernel_size[i] - 1) // 2,)
-            else:
-                self.padding += (_padding[i],)
+        self.padding = _get_padding(self.kernel_size, self.stride, padding)
         self.transposed = transposed
         self.generative = generative
         if self.generative:
             assert self.transposed
 
         self._config = config
+        # elementwise activation fused into the output (see fuse_modules)
+        self.activation = None
+        # previous features in incremental mode (see incremental_conv3d)
+        self._incremental_state = {}
 
         self.kernel_volume = int(np.prod(self.kernel_size))
         if (
@@ -60,10 +77,12 @@ class Conv3d(nn.Module):
             and self.stride != (1, 1, 1)
         ):
             self.kernel = nn.Parameter(
-                torch.zeros(self.kernel_volume, in_channels, out_channels)
+                torch.zeros(self.kernel_volume, in_channels // groups, out_channels)
             )
         else:
-            self.kernel = nn.Parameter(torch.zeros(in_channels, out_channels))
+            self.kernel = nn.Parameter(
+                torch.zeros(in_channels // groups, out_channels)
+            )
         if bias:
             self.bias = nn.Parameter(torch.Tensor(out_channels))
         else:
@@ -82,11 +101,14 @@ class Conv3d(nn.Module):
             s += ", transposed=True"
         if self.generative:
             s += ", generative=True"
+        if self.groups != 1:
+            s += ", groups={groups}"
         return s.format(**self.__dict__)
 
     def reset_parameters(self) -> None:
         std = 1 / math.sqrt(
             (self.out_channels if self.transposed else self.in_channels)
+            // self.groups
             * self.kernel_volume
         )
         self.kernel.data.uniform_(-std, std)
@@ -94,17 +116,40 @@ class Conv3d(nn.Module):
             self.bias.data.uniform_(-std, std)
 
     def forward(self, input: SparseTensor) -> SparseTensor:
-
-        return F.conv3d(
-            input,
-            weight=self.kernel,
-            kernel_size=self.kernel_size,
-            bias=self.bias,
-            stride=self.stride,
-            padding=self.padding,
-            dilation=self.dilation,
-            transposed=self.transposed,
-            generative=self.generative,
-            config=self._config,
-            training=self.training,
-        )
+        if F.get_incremental_mode() and not self.training:
+            output = F.incremental_conv3d(
+                self._incremental_state,
+                input,
+                weight=self.kernel,
+                kernel_size=self.kernel_size,
+                bias=self.bias,
+                stride=self.stride,
+                padding=self.padding,
+                dilation=self.dilation,
+                config=self._config,
+                transposed=self.transposed,
+                generative=self.generative,
+                groups=self.groups,
+            )
+        else:
+            output = F.conv3d(
+                input,
+                weight=self.kernel,
+                kernel_size=self.kernel_size,
+                bias=self.bias,
+                stride=self.stride,
+                padding=self.padding,
+                dilation=self.dilation,
+                transposed=self.transposed,
+                generative=self.generative,
+                config=self._config,
+                training=self.training,
+                groups=self.groups,
+            )
+        if self.activation is not None:
+            feats = output.feats
+            if self._incremental_state.get("out_feats") is feats:
+                # kept for the next frame by incremental_conv3d
+                feats = feats.clone()
+            output.feats = self.activation(feats)
+        return output
@@ -2,6 +2,7 @@ import torch
 from torch import nn
 
 from torchsparse import SparseTensor
+from torchsparse.nn import functional as F
 from torchsparse.nn.utils import fapply
 
 __all__ = ["BatchNorm", "GroupNorm", "InstanceNorm"]
@@ -9,7 +10,46 @@ __all__ = ["BatchNorm", "GroupNorm", "InstanceNorm"]
 
 class InstanceNorm(nn.InstanceNorm1d):
     def forward(self, input: SparseTensor) -> SparseTensor:
-        return fapply(input, super().forward)
+        if self.track_running_stats and not self.training:
+            return fapply(
+                input,
+                nn.functional.batch_norm,
+                self.running_mean,
+                self.running_var,
+                self.weight,
+                self.bias,
+                False,
+                0.0,
+                self.eps,
+            )
+
+        # every sample is normalized on its own, over its own rows
+        segments = input.batch_segments()
+        if self.track_running_stats:
+            self._update_running_stats(input.feats, segments)
+        return fapply(
+            input, F.instance_norm, segments, self.weight, self.bias, self.eps
+        )
+
+    @torch.no_grad()
+    def _update_running_stats(self, feats: torch.Tensor, segments) -> None:
+        # as in nn.InstanceNorm1d: average of the per-sample statistics
+        feats = feats.detach().to(self.running_mean.dtype)
+        mean = F.segment_mean(feats, segments)
+        var = F.segment_mean(feats.pow(2), segments) - mean.pow(2)
+        counts = segments["counts"].unsqueeze(1).to(var.dtype)
+        var = var * counts / (counts - 1).clamp(min=1)
+        # samples without rows have no statistics (segment_mean gives NaN)
+        valid = segments["counts"] > 0
+        mean, var = mean[valid], var[valid]
+
+        self.num_batches_tracked.add_(1)
+        if self.momentum is None:
+            factor = 1.0 / float(self.num_batches_tracked)
+        else:
+            factor = self.momentum
+        self.running_mean.mul_(1 - factor).add_(factor * mean.mean(0))
+        self.running_var.mul_(1 - factor).add_(factor * var.mean(0))
 
 
 class BatchNorm(nn.BatchNorm1d):
@@ -19,30 +59,14 @@ class BatchNorm(nn.BatchNorm1d):
 
 class GroupNorm(nn.GroupNorm):
     def forward(self, input: SparseTensor) -> SparseTensor:
-        coords, feats, stride = input.coords, input.feats, input.stride
-
-        batch_size = torch.max(coords[:, 0]).item() + 1
-        num_channels = feats.shape[1]
-
-        # PyTorch's GroupNorm function expects the input to be in (N, C, *)
-        # format where N is batch size, and C is number of channels. "feats"
-        # is not in that format. So, we extract the feats corresponding to
-        # each sample, bring it to the format expected by PyTorch's GroupNorm
-        # function, and invoke it.
-        nfeats = torch.zeros_like(feats)
-        for k in range(batch_size):
-            indices = coords[:, 0] == k
-            bfeats = feats[indices]
-            bfeats = bfeats.transpose(0, 1).reshape(1, num_channels, -1)
-            bfeats = super().forward(bfeats)
-            bfeats = bfeats.reshape(num_channels, -1).transpose(0, 1)
-            nfeats[indices] = bfeats
-
-        output = SparseTensor(
-            coords=coords,
-            feats=nfeats,
-            stride=stride,
-            spatial_range=input.spatial_range,
+        # statistics of every (sample, group) pair are segment reductions
+        # over the rows of the sample, computed for all samples at once
+        return fapply(
+            input,
+            F.group_norm,
+            input.batch_segments(),
+            self.num_groups,
+            self.weight,
+            self.bias,
+            self.eps,
         )
-        output._caches = input._caches
-        return output
@@ -1,10 +1,15 @@
+from typing import Dict, List, Tuple, Union
+
 import torch
 from torch import nn
 
 from torchsparse import SparseTensor
 from torchsparse.nn import functional as F
+from torchsparse.utils import make_ntuple
+
+from .conv import _get_padding
 
-__all__ = ["GlobalAvgPool", "GlobalMaxPool"]
+__all__ = ["GlobalAvgPool", "GlobalMaxPool", "MaxPool3d", "AvgPool3d"]
 
 
 class GlobalAvgPool(nn.Module):
@@ -15,3 +20,55 @@ class GlobalAvgPool(nn.Module):
 class GlobalMaxPool(nn.Module):
     def forward(self, input: SparseTensor) -> torch.Tensor:
         return F.global_max_pool(input)
+
+
+class _Pool3d(nn.Module):
+    def __init__(
+        self,
+        kernel_size: Union[int, List[int], Tuple[int, ...]],
+        stride: Union[int, List[int], Tuple[int, ...], None] = None,
+        padding: Union[int, Tuple[int, ...]] = 0,
+        dilation: int = 1,
+        config: Dict = None,
+    ) -> None:
+        super().__init__()
+        self.kernel_size = make_ntuple(kernel_size, ndim=3)
+        self.stride = (
+            self.kernel_size if stride is None else make_ntuple(stride, ndim=3)
+        )
+        self.dilation = dilation
+        # same padding as Conv3d, so that both share kernel maps
+        self.padding = _get_padding(self.kernel_size, self.stride, padding)
+        self._config = config
+
+    def extra_repr(self) -> str:
+        s = "kernel_size={kernel_size}, stride={stride}"
+        if self.dilation != 1:
+            s += ", dilation={dilation}"
+        return s.format(**self.__dict__)
+
+
+class MaxPool3d(_Pool3d):
+    def forward(self, input: SparseTensor) -> SparseTensor:
+        return F.max_pool3d(
+            input,
+            kernel_size=self.kernel_size,
+            stride=self.stride,
+            padding=self.padding,
+            dilation=self.dilation,
+            config=self._config,
+            training=self.training,
+        )
+
+
+class AvgPool3d(_Pool3d):
+    def forward(self, input: SparseTensor) -> SparseTensor:
+        return F.avg_pool3d(
+            input,
+            kernel_size=self.kernel_size,
+            stride=self.stride,
+            padding=self.padding,
+            dilation=self.dilation,
+            config=self._config,
+            training=self.training,
+        )
@@ -1,2 +1,4 @@
 from .apply import *
+from .fuse import *
 from .kernel import *
+from .kmap import *
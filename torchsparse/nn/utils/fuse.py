@@ -0,0 +1,84 @@
+import copy
+from typing import Optional
+
+import torch
+from torch import nn
+
+__all__ = ["fuse_modules"]
+
+
+def _fused_activation(module: nn.Module) -> Optional[nn.Module]:
+    # elementwise activations applied in place to the conv output features
+    from torchsparse import nn as spnn
+
+    if isinstance(module, spnn.ReLU):
+        return nn.ReLU(inplace=True)
+    if isinstance(module, spnn.LeakyReLU):
+        return nn.LeakyReLU(module.negative_slope, inplace=True)
+    if isinstance(module, spnn.SiLU):
+        return nn.SiLU(inplace=True)
+    return None
+
+
+@torch.no_grad()
+def _fold_batch_norm(conv: nn.Module, bn: nn.Module) -> None:
+    scale = bn.weight if bn.affine else torch.ones_like(bn.running_var)
+    scale = scale / torch.sqrt(bn.running_var + bn.eps)
+    shift = bn.bias if bn.affine else torch.zeros_like(bn.running_mean)
+    bias = conv.bias if conv.bias is not None else torch.zeros_like(shift)
+
+    # the output channels are the last dimension of the kernel
+    conv.kernel.mul_(scale.to(conv.kernel.dtype))
+    bias = (bias - bn.running_mean) * scale + shift
+    conv.bias = nn.Parameter(bias.to(conv.kernel.dtype))
+
+
+def _fuse_sequential(sequential: nn.Sequential) -> None:
+    from torchsparse import nn as spnn
+
+    names = list(sequential._modules.keys())
+    k = 0
+    while k < len(names):
+        conv = sequential._modules[names[k]]
+        if not isinstance(conv, spnn.Conv3d) or conv.activation is not None:
+            k += 1
+            continue
+        k += 1
+        if k < len(names) and isinstance(
+            sequential._modules[names[k]], spnn.BatchNorm
+        ):
+            bn = sequential._modules[names[k]]
+            if bn.track_running_stats and bn.running_mean is not None:
+                _fold_batch_norm(conv, bn)
+                sequential._modules[names[k]] = nn.Identity()
+                k += 1
+            else:
+                continue
+        if k < len(names):
+            activation = _fused_activation(sequential._modules[names[k]])
+            if activation is not None:
+                conv.activation = activation
+                sequential._modules[names[k]] = nn.Identity()
+                k += 1
+
+
+def fuse_modules(model: nn.Module, inplace: bool = False) -> nn.Module:
+    r"""
+    folds Conv3d -> BatchNorm -> activation chains of every nn.Sequential in
+    model for inference: the batch norm statistics and affine parameters
+    are folded into the kernel and bias of the convolution, and ReLU,
+    LeakyReLU or SiLU is applied by the convolution module to its output.
+    The bias add and the activation run in place on the output features,
+    so no intermediate features or SparseTensors are allocated (except in
+    incremental mode, where the convolution keeps its output for the next
+    frame and the activation runs on a copy). The fused modules are
+    replaced by nn.Identity. The returned model is in eval mode and must not be
+    trained; model itself is left untouched unless inplace is set.
+    """
+    if not inplace:
+        model = copy.deepcopy(model)
+    model.eval()
+    for module in model.modules():
+        if isinstance(module, nn.Sequential):
+            _fuse_sequential(module)
+    return model
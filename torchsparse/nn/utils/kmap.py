@@ -0,0 +1,41 @@
+from typing import List, Tuple, Union
+
+from torch import nn
+
+from torchsparse.utils import make_ntuple
+
+__all__ = ["get_kmap_signatures"]
+
+
+def get_kmap_signatures(
+    model: nn.Module, input_stride: Union[int, Tuple[int, ...]] = 1
+) -> List[Tuple[Tuple[int, ...], ...]]:
+    r"""
+    lists the (input stride, kernel size, stride, dilation, padding)
+    signatures of the kernel maps built by the Conv3d layers of model, for
+    F.prebuild_kernel_maps. Layers are visited in registration order, which
+    is assumed to follow the order of execution; transposed convolutions
+    reuse the maps of the matching downsampling layer and add none.
+    """
+    from torchsparse.nn import Conv3d
+
+    tensor_stride = make_ntuple(input_stride, ndim=3)
+    signatures = []
+    for module in model.modules():
+        if not isinstance(module, Conv3d):
+            continue
+        stride = module.stride
+        if module.transposed:
+            tensor_stride = tuple(tensor_stride[k] // stride[k] for k in range(3))
+            continue
+        signature = (
+            tensor_stride,
+            module.kernel_size,
+            stride,
+            make_ntuple(module.dilation, ndim=3),
+            module.padding,
+        )
+        if signature not in signatures:
+            signatures.append(signature)
+        tensor_stride = tuple(tensor_stride[k] * stride[k] for k in range(3))
+    return signatures
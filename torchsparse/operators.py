@@ -1,12 +1,20 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 import torch
 
 from torchsparse.tensor import SparseTensor
+from torchsparse.utils.segment import build_coord_segments
+from torchsparse.utils.tensor_cache import TensorCache
 
 # from torch_scatter import scatter_sum
 
-__all__ = ["cat", "generative_add"]
+__all__ = [
+    "cat",
+    "generative_add",
+    "sparse_union",
+    "sparse_intersection",
+    "sparse_difference",
+]
 
 
 def cat(inputs: List[SparseTensor]) -> SparseTensor:
@@ -50,15 +58,115 @@ def scatter_sum(
         return out.scatter_add_(dim, index, src)
 
 
-def generative_add(a: SparseTensor, b: SparseTensor) -> SparseTensor:
-    input_a = a if a.F.size(0) >= b.F.size(0) else b
-    input_b = b if a.F.size(0) >= b.F.size(0) else a
-    union_coords = torch.cat([input_a.C, input_b.C], dim=0)
-    union_features = torch.cat([input_a.F, input_b.F], dim=0)
-    unique_coords, unique_idx = torch.unique(union_coords, dim=0, return_inverse=True)
-    out_feature = scatter_sum(union_features, unique_idx, dim=0)
-    out_tensor = SparseTensor(
-        out_feature, unique_coords, input_a.s, spatial_range=input_a.spatial_range
+def _join(
+    base: SparseTensor, other: SparseTensor
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    # hash join of two coordinate sets: coordinates are numbered by first
+    # occurrence, so the rows of base keep their index and the coordinates
+    # only found in other are appended in its order
+    segments = build_coord_segments(torch.cat([base.coords, other.coords], dim=0))
+    num_base = base.coords.shape[0]
+    base_map, other_map = segments["batch"][:num_base], segments["batch"][num_base:]
+    return segments["coords"], base_map, other_map, segments["counts"]
+
+
+def _output(
+    base: SparseTensor, feats: torch.Tensor, coords: Optional[torch.Tensor]
+) -> SparseTensor:
+    # coords is None if the output has exactly the coordinates of base
+    output = SparseTensor(
+        feats,
+        base.coords if coords is None else coords,
+        base.stride,
+        spatial_range=base.spatial_range,
     )
-    out_tensor._caches = input_a._caches
-    return out_tensor
+    if coords is None:
+        # same rows: the kernel maps of base stay valid
+        output._caches = base._caches
+    else:
+        # kernel maps and hash tables are rebuilt on demand; coordinates of
+        # the other strides are kept for transposed convolutions
+        output._caches = TensorCache()
+        for stride, cmap in dict.items(base._caches.cmaps):
+            if stride != output.stride:
+                output._caches.cmaps[stride] = cmap
+        output._caches.cmaps[output.stride] = (output.coords, output.spatial_range)
+    return output
+
+
+def _compact(keep: torch.Tensor) -> torch.Tensor:
+    # output row of every kept row, -1 for dropped rows
+    index = torch.cumsum(keep.long(), 0) - 1
+    return torch.where(keep, index, torch.full_like(index, -1))
+
+
+def sparse_union(
+    a: SparseTensor, b: SparseTensor
+) -> Tuple[SparseTensor, torch.Tensor, torch.Tensor]:
+    r"""
+    union of the coordinates of a and b, with the features of shared
+    coordinates summed. The rows of the larger input come first and keep
+    their order (and its tensor cache, if the other input adds no new
+    coordinates); new coordinates are appended in the order of the other
+    input. Also returns the output row of every row of a and of b.
+    """
+    swap = a.feats.shape[0] < b.feats.shape[0]
+    base, other = (b, a) if swap else (a, b)
+    coords, base_map, other_map, _ = _join(base, other)
+
+    feats = base.feats.new_zeros(coords.shape[0], base.feats.shape[1])
+    feats[: base.feats.shape[0]] = base.feats
+    feats = feats.index_add(0, other_map, other.feats.to(feats.dtype))
+    same = coords.shape[0] == base.coords.shape[0]
+    output = _output(base, feats, None if same else coords)
+    return (output, other_map, base_map) if swap else (output, base_map, other_map)
+
+
+def sparse_intersection(
+    a: SparseTensor, b: SparseTensor
+) -> Tuple[SparseTensor, torch.Tensor, torch.Tensor]:
+    r"""
+    coordinates shared by a and b, with their features summed, in the order
+    of the larger input. Also returns the output row of every row of a and
+    of b, or -1 for rows that are not in the output.
+    """
+    swap = a.feats.shape[0] < b.feats.shape[0]
+    base, other = (b, a) if swap else (a, b)
+    _, base_map, other_map, counts = _join(base, other)
+
+    keep = counts[base_map] > 1
+    base_out = _compact(keep)
+    # other rows map onto base rows, or onto coordinates appended after them
+    # (all sent to a trailing -1)
+    num_base = base.coords.shape[0]
+    other_out = torch.cat([base_out, base_out.new_full((1,), -1)])
+    other_out = other_out[other_map.clamp(max=num_base)]
+    matched = other_out >= 0
+
+    feats = base.feats[keep].index_add(
+        0, other_out[matched], other.feats[matched].to(base.feats.dtype)
+    )
+    same = bool(keep.all())
+    output = _output(base, feats, None if same else base.coords[keep])
+    return (output, other_out, base_out) if swap else (output, base_out, other_out)
+
+
+def sparse_difference(
+    a: SparseTensor, b: SparseTensor
+) -> Tuple[SparseTensor, torch.Tensor, torch.Tensor]:
+    r"""
+    rows of a whose coordinates are not in b, in the order of a. Also returns
+    the output row of every row of a and of b, or -1 for rows that are not in
+    the output (all rows of b).
+    """
+    _, a_map, b_map, counts = _join(a, b)
+
+    keep = counts[a_map] == 1
+    a_out = _compact(keep)
+    same = bool(keep.all())
+    output = _output(a, a.feats[keep], None if same else a.coords[keep])
+    return output, a_out, torch.full_like(b_map, -1)
+
+
+def generative_add(a: SparseTensor, b: SparseTensor) -> SparseTensor:
+    return sparse_union(a, b)[0]
@@ -3,12 +3,15 @@ from typing import Any, Dict, Tuple, Union, Optional, List
 import torch
 
 from torchsparse.utils import make_ntuple, to_dense
+from torchsparse.utils.curve import build_curve_permutation
+from torchsparse.utils.segment import build_batch_segments
 from torchsparse.utils.tensor_cache import (
     TensorCache,
     TensorCacheMode,
     get_global_tensor_cache,
     set_global_tensor_cache,
     get_tensor_cache_mode,
+    get_persistent_tensor_cache,
 )
 
 __all__ = ["SparseTensor"]
@@ -48,9 +51,25 @@ class SparseTensor:
                 _caches = TensorCache()
                 set_global_tensor_cache(_caches)
             self._caches = _caches
+        elif get_tensor_cache_mode() == TensorCacheMode.PERSISTENT_TENSOR_CACHE:
+            # resolved on first access: intermediate tensors get the caches
+            # of their input assigned and never need a lookup
+            self._tensor_cache = None
         else:
             self._caches = TensorCache()
 
+    @property
+    def _caches(self) -> TensorCache:
+        if self._tensor_cache is None:
+            self._tensor_cache = get_persistent_tensor_cache().lookup(
+                self.coords, self.stride
+            )
+        return self._tensor_cache
+
+    @_caches.setter
+    def _caches(self, _caches: TensorCache) -> None:
+        self._tensor_cache = _caches
+
     @property
     def F(self) -> torch.Tensor:
         return self.feats
@@ -78,11 +97,15 @@ class SparseTensor:
     def cpu(self):
         self.coords = self.coords.cpu()
         self.feats = self.feats.cpu()
+        if self._tensor_cache is not None:
+            self._tensor_cache.to(self.coords.device)
         return self
 
     def cuda(self):
         self.coords = self.coords.cuda()
         self.feats = self.feats.cuda()
+        if self._tensor_cache is not None:
+            self._tensor_cache.to(self.coords.device)
         return self
 
     def half(self):
@@ -97,11 +120,116 @@ class SparseTensor:
     def to(self, device, non_blocking: bool = True):
         self.coords = self.coords.to(device, non_blocking=non_blocking)
         self.feats = self.feats.to(device, non_blocking=non_blocking)
+        if self._tensor_cache is not None:
+            # e.g. kernel maps prebuilt by DataLoader workers
+            self._tensor_cache.to(device, non_blocking=non_blocking)
         return self
 
-    def dense(self):
+    def dense(self, channel_first: bool = False):
         assert self.spatial_range is not None
-        return to_dense(self.feats, self.coords, self.spatial_range)
+        return to_dense(self.feats, self.coords, self.spatial_range, channel_first)
+
+    def batch_segments(self) -> Dict[str, Any]:
+        r"""
+        CSR-style per-sample row index (see build_batch_segments), computed
+        once and shared by all tensors with the same coordinates
+        """
+        cached = self._caches.segments.get(self.stride)
+        if cached is not None and cached[0] is self.coords:
+            return cached[1]
+        segments = build_batch_segments(self.coords[:, 0])
+        self._caches.segments[self.stride] = (self.coords, segments)
+        return segments
+
+    def update(
+        self,
+        inserted_coords: Optional[torch.Tensor] = None,
+        inserted_feats: Optional[torch.Tensor] = None,
+        deleted_coords: Optional[torch.Tensor] = None,
+    ) -> "SparseTensor":
+        r"""
+        streaming update: the tensor without deleted_coords and with
+        inserted_coords and their inserted_feats (one row each) appended,
+        ValueError if only one of them is given. Rows from the tail
+        fill the holes left by deletions, all other rows keep their place.
+        The hash tables and kernel maps cached for this tensor are patched
+        around the changed coordinates instead of being rebuilt (see
+        update_kernel_maps); the returned tensor takes over the caches, so
+        this tensor must not be convolved again.
+        """
+        from torchsparse.nn import functional as F
+
+        if (inserted_coords is None) != (inserted_feats is None):
+            raise ValueError(
+                "inserted_coords and inserted_feats must be given together."
+            )
+        if inserted_coords is None:
+            inserted_coords = self.coords[:0]
+            inserted_feats = self.feats[:0]
+        if inserted_coords.shape[0] != inserted_feats.shape[0]:
+            raise ValueError(
+                f"Got {inserted_coords.shape[0]} inserted coordinates "
+                f"but {inserted_feats.shape[0]} rows of inserted features."
+            )
+        if inserted_feats.shape[1:] != self.feats.shape[1:]:
+            raise ValueError(
+                f"Inserted features of shape {tuple(inserted_feats.shape)} "
+                f"do not match features of shape {tuple(self.feats.shape)}."
+            )
+        if deleted_coords is None:
+            deleted_coords = self.coords[:0]
+
+        _caches = self._caches
+        deltas = F.update_kernel_maps(
+            _caches,
+            self.coords,
+            self.stride,
+            inserted_coords.to(self.coords.device),
+            deleted_coords.to(self.coords.device),
+            self.spatial_range,
+        )
+        delta = deltas[self.stride]
+        feats = torch.cat(
+            [self.feats[: delta["num_kept"]], inserted_feats.to(self.feats)]
+        )
+        feats[delta["holes"]] = self.feats[delta["movers"]]
+
+        output = SparseTensor(
+            coords=delta["coords"],
+            feats=feats,
+            stride=self.stride,
+            spatial_range=self.spatial_range,
+        )
+        output._caches = _caches
+        if get_tensor_cache_mode() == TensorCacheMode.PERSISTENT_TENSOR_CACHE:
+            get_persistent_tensor_cache().rekey(
+                self.coords, output.coords, self.stride
+            )
+        return output
+
+    def reorder(self, curve: str = "morton") -> Tuple["SparseTensor", torch.Tensor]:
+        r"""
+        the tensor with its rows sorted by batch and along a space-filling
+        curve ("morton" or "hilbert", see curve_codes), so that neighbors
+        are close in memory, and the permutation perm: row i of the output
+        is row perm[i] of this tensor, and out[perm] = y maps rows y of the
+        output back. Coordinates downsampled from the output are kept in
+        curve order (see spdownsample). Meant for input tensors, before the
+        first convolution: the output gets fresh caches, the kernel maps
+        cached for this tensor are not used.
+        """
+        perm = build_curve_permutation(self.coords, curve)
+        output = SparseTensor(
+            coords=self.coords[perm],
+            feats=self.feats[perm],
+            stride=self.stride,
+            spatial_range=self.spatial_range,
+        )
+        # the rows moved, so the caches of this tensor (or the global
+        # cache shared with other tensors) do not apply
+        output._caches = TensorCache()
+        output._caches.curve = curve
+        return output, perm
 
     def __add__(self, other):
         output = SparseTensor(
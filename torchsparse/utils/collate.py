@@ -1,4 +1,4 @@
-from typing import Any, List
+from typing import Any, Dict, List, Optional, Sequence
 
 import numpy as np
 import torch
@@ -8,7 +8,12 @@ from torchsparse import SparseTensor
 __all__ = ["sparse_collate", "sparse_collate_fn"]
 
 
-def sparse_collate(inputs: List[SparseTensor]) -> SparseTensor:
+def sparse_collate(
+    inputs: List[SparseTensor],
+    kmap_signatures: Optional[List[Sequence]] = None,
+    kmap_config: Optional[Dict] = None,
+    training: bool = False,
+) -> SparseTensor:
     coords, feats = [], []
     stride = inputs[0].stride
 
@@ -30,15 +35,37 @@ def sparse_collate(inputs: List[SparseTensor]) -> SparseTensor:
     coords = torch.cat(coords, dim=0)
     feats = torch.cat(feats, dim=0)
     output = SparseTensor(coords=coords, feats=feats, stride=stride)
+    if kmap_signatures:
+        from torchsparse.nn import functional as F
+
+        output = F.prebuild_kernel_maps(
+            output, kmap_signatures, config=kmap_config, training=training
+        )
     return output
 
 
-def sparse_collate_fn(inputs: List[Any]) -> Any:
+def sparse_collate_fn(
+    inputs: List[Any],
+    kmap_signatures: Optional[List[Sequence]] = None,
+    kmap_config: Optional[Dict] = None,
+    training: bool = False,
+) -> Any:
+    r"""
+    collates a list of samples; with kmap_signatures (see
+    torchsparse.nn.utils.get_kmap_signatures) the kernel maps of every
+    SparseTensor are built here, i.e. inside the DataLoader workers, e.g.
+    collate_fn=functools.partial(sparse_collate_fn, kmap_signatures=...)
+    """
+    kwargs = dict(
+        kmap_signatures=kmap_signatures, kmap_config=kmap_config, training=training
+    )
     if isinstance(inputs[0], dict):
         output = {}
         for name in inputs[0].keys():
             if isinstance(inputs[0][name], dict):
-                output[name] = sparse_collate_fn([input[name] for input in inputs])
+                output[name] = sparse_collate_fn(
+                    [input[name] for input in inputs], **kwargs
+                )
             elif isinstance(inputs[0][name], np.ndarray):
                 output[name] = torch.stack(
                     [torch.tensor(input[name]) for input in inputs], dim=0
@@ -46,7 +73,9 @@ def sparse_collate_fn(inputs: List[Any]) -> Any:
             elif isinstance(inputs[0][name], torch.Tensor):
                 output[name] = torch.stack([input[name] for input in inputs], dim=0)
             elif isinstance(inputs[0][name], SparseTensor):
-                output[name] = sparse_collate([input[name] for input in inputs])
+                output[name] = sparse_collate(
+                    [input[name] for input in inputs], **kwargs
+                )
             else:
                 output[name] = [input[name] for input in inputs]
         return output
@@ -0,0 +1,79 @@
+from typing import Optional
+
+import torch
+
+__all__ = ["curve_codes", "build_curve_permutation"]
+
+_curves = ("morton", "hilbert")
+
+# bits per dimension of the 63-bit curve codes
+_max_bits = 21
+
+
+def curve_codes(
+    coords: torch.Tensor, curve: str = "morton", num_bits: Optional[int] = None
+) -> torch.Tensor:
+    r"""
+    int64 position of every (x, y, z) row of coords along a space-filling
+    curve ("morton" or "hilbert") over the bounding box of coords, using
+    num_bits bits per dimension (enough for the box by default)
+    """
+    if curve not in _curves:
+        raise ValueError(f"Unknown curve: {curve} (expected one of {_curves}).")
+    coords = coords.long()
+    if coords.shape[0] == 0:
+        return coords.new_zeros(0)
+    coords = coords - coords.min(0).values
+    if num_bits is None:
+        num_bits = max(int(coords.max()).bit_length(), 1)
+    if num_bits > _max_bits:
+        raise ValueError(
+            f"Coordinates span {num_bits} bits, curve codes support {_max_bits}."
+        )
+
+    axes = [coords[:, k].clone() for k in range(coords.shape[1])]
+    if curve == "hilbert":
+        _hilbert_transpose(axes, num_bits)
+
+    # interleaves the bits, the first axis being the most significant
+    codes = torch.zeros_like(axes[0])
+    for bit in reversed(range(num_bits)):
+        for x in axes:
+            codes = (codes << 1) | ((x >> bit) & 1)
+    return codes
+
+
+def _hilbert_transpose(axes, num_bits: int) -> None:
+    # in place, the "transposed" Hilbert index of the points (J. Skilling,
+    # Programming the Hilbert curve, 2004), vectorized over the points
+    q = 1 << (num_bits - 1)
+    while q > 1:
+        p = q - 1
+        for k in range(len(axes)):
+            high = (axes[k] & q) != 0
+            t = (axes[0] ^ axes[k]) & p
+            axes[0] = torch.where(high, axes[0] ^ p, axes[0] ^ t)
+            if k > 0:
+                axes[k] = torch.where(high, axes[k], axes[k] ^ t)
+        q >>= 1
+    # Gray encoding
+    for k in range(1, len(axes)):
+        axes[k] ^= axes[k - 1]
+    t = torch.zeros_like(axes[0])
+    q = 1 << (num_bits - 1)
+    while q > 1:
+        t = torch.where((axes[-1] & q) != 0, t ^ (q - 1), t)
+        q >>= 1
+    for k in range(len(axes)):
+        axes[k] ^= t
+
+
+def build_curve_permutation(coords: torch.Tensor, curve: str = "morton"):
+    r"""
+    stable permutation that sorts the (b, x, y, z) rows of coords by batch,
+    then by their position along a space-filling curve (see curve_codes)
+    """
+    codes = curve_codes(coords[:, 1:], curve)
+    perm = torch.sort(codes, stable=True)[1]
+    perm = perm[torch.sort(coords[perm, 0], stable=True)[1]]
+    return perm
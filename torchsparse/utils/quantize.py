@@ -1,10 +1,13 @@
 from itertools import repeat
-from typing import List, Tuple, Union
+from typing import List, Optional, Tuple, Union
 
 import numpy as np
+import torch
 
 __all__ = ["sparse_quantize"]
 
+_REDUCTIONS = {"mean": 1, "max": 2, "sum": 3}
+
 
 def ravel_hash(x: np.ndarray) -> np.ndarray:
     assert x.ndim == 2, x.shape
@@ -22,27 +25,80 @@ def ravel_hash(x: np.ndarray) -> np.ndarray:
 
 
 def sparse_quantize(
-    coords,
+    coords: Union[np.ndarray, torch.Tensor],
     voxel_size: Union[float, Tuple[float, ...]] = 1,
     *,
+    features: Optional[Union[np.ndarray, torch.Tensor]] = None,
+    reduction: str = "mean",
     return_index: bool = False,
-    return_inverse: bool = False
-) -> List[np.ndarray]:
+    return_inverse: bool = False,
+    return_counts: bool = False
+) -> Union[np.ndarray, torch.Tensor, List]:
+    """Quantizes points into voxels with a single pass over a hash table.
+
+    Voxels are numbered in the order of their first point. Earlier versions,
+    built on ``np.unique``, returned them sorted by their ravel hash; sort
+    the outputs if that order is needed. The outputs are, in order: the
+    voxel coordinates, the reduced ``features`` (if given), the index of the
+    first point of every voxel, the voxel of every point and the number of
+    points per voxel. Outputs are numpy arrays for numpy inputs and tensors
+    (on the input device) for tensor inputs.
+    """
     if isinstance(voxel_size, (float, int)):
         voxel_size = tuple(repeat(voxel_size, 3))
     assert isinstance(voxel_size, tuple) and len(voxel_size) == 3
+    if features is not None and reduction not in _REDUCTIONS:
+        raise ValueError(f"Unsupported reduction: {reduction}")
+
+    is_numpy = isinstance(coords, np.ndarray)
+    if is_numpy:
+        coords = np.floor(coords / np.array(voxel_size)).astype(np.int32)
+        coords_t = torch.from_numpy(coords)
+        device = None
+    else:
+        device = coords.device
+        voxel_size_t = torch.tensor(voxel_size, dtype=torch.float64, device=device)
+        coords_t = torch.floor(coords.double() / voxel_size_t).int().cpu()
 
-    voxel_size = np.array(voxel_size)
-    coords = np.floor(coords / voxel_size).astype(np.int32)
+    if features is None:
+        feats_t = torch.empty(0)
+    elif isinstance(features, np.ndarray):
+        feats_t = torch.from_numpy(np.ascontiguousarray(features))
+    else:
+        feats_t = features.cpu()
+    if feats_t.dim() == 1:
+        feats_t = feats_t.view(-1, 1)
 
-    _, indices, inverse_indices = np.unique(
-        ravel_hash(coords), return_index=True, return_inverse=True
+    # the extension is only needed once points are quantized, so that
+    # data pipelines can import torchsparse.utils without loading it
+    import torchsparse.backend
+
+    (
+        coords_t,
+        indices,
+        inverse_indices,
+        counts,
+        feats_t,
+    ) = torchsparse.backend.sparse_quantize_cpu(
+        coords_t.contiguous(),
+        feats_t.contiguous(),
+        _REDUCTIONS[reduction] if features is not None else 0,
     )
-    coords = coords[indices]
+    if features is not None and features.ndim == 1:
+        feats_t = feats_t.view(-1)
 
-    outputs = [coords]
+    outputs = [coords_t]
+    if features is not None:
+        outputs += [feats_t]
     if return_index:
         outputs += [indices]
     if return_inverse:
         outputs += [inverse_indices]
+    if return_counts:
+        outputs += [counts]
+
+    if is_numpy:
+        outputs = [x.numpy() for x in outputs]
+    else:
+        outputs = [x.to(device) for x in outputs]
     return outputs[0] if len(outputs) == 1 else outputs
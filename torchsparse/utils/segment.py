@@ -0,0 +1,83 @@
+from typing import Any, Dict
+
+import torch
+
+__all__ = ["build_batch_segments", "build_coord_segments"]
+
+
+def build_batch_segments(batch: torch.Tensor) -> Dict[str, Any]:
+    r"""
+    CSR-style index of the rows of every sample in a batch: "ptr" holds the
+    (batch_size + 1) row pointers and "counts" the rows per sample, both in
+    batch-sorted order. "perm" is the stable permutation that makes the rows
+    batch-contiguous, or None if they already are. "batch" is the batch index
+    of every row, in the original order. Costs a single host sync.
+    """
+    batch = batch.long()
+    if batch.numel() == 0:
+        batch_size, unsorted = 0, False
+    else:
+        batch_size, unsorted = torch.stack(
+            [batch.max(), (batch[1:] < batch[:-1]).any().long()]
+        ).tolist()
+        batch_size += 1
+
+    counts = torch.bincount(batch, minlength=batch_size)
+    ptr = torch.zeros(batch_size + 1, dtype=torch.long, device=batch.device)
+    ptr[1:] = torch.cumsum(counts, 0)
+    perm = torch.sort(batch, stable=True)[1] if unsorted else None
+    return {
+        "batch_size": batch_size,
+        "batch": batch,
+        "counts": counts,
+        "ptr": ptr,
+        "perm": perm,
+    }
+
+
+def build_coord_segments(coords: torch.Tensor) -> Dict[str, Any]:
+    r"""
+    Index of the rows sharing a coordinate, in the layout of
+    build_batch_segments (so that F.segment_* reduce over equal coordinates):
+    "batch" holds the segment of every row. Segments are numbered in the order
+    of their first row, whose index is in "index", and "coords" holds their
+    coordinates. Rows are grouped through a hash of packed 64-bit keys rather
+    than a lexicographic sort of the coordinates.
+    """
+    if coords.device.type == "cpu":
+        import torchsparse.backend
+
+        coords, index, inverse, counts, _ = torchsparse.backend.sparse_quantize_cpu(
+            coords.int().contiguous(), torch.empty(0), 0
+        )
+    else:
+        keys = torch.zeros(coords.shape[0], dtype=torch.long, device=coords.device)
+        if coords.shape[0] > 0:
+            coords_min = coords.min(0).values.long()
+            sizes = coords.max(0).values.long() - coords_min + 1
+            for k in range(coords.shape[1]):
+                keys = keys * sizes[k] + (coords[:, k].long() - coords_min[k])
+        keys, inverse, counts = torch.unique(
+            keys, return_inverse=True, return_counts=True
+        )
+        rows = torch.arange(coords.shape[0], device=coords.device)
+        index = torch.full_like(keys, coords.shape[0])
+        index = index.scatter_reduce_(0, inverse, rows, "amin")
+        # number segments by their first row, as on CPU
+        order = torch.argsort(index)
+        index = index[order]
+        counts = counts[order]
+        inverse = torch.argsort(order)[inverse]
+        coords = coords[index]
+
+    ptr = torch.zeros(counts.shape[0] + 1, dtype=torch.long, device=counts.device)
+    ptr[1:] = torch.cumsum(counts, 0)
+    return {
+        "batch_size": counts.shape[0],
+        "batch": inverse,
+        "counts": counts,
+        "ptr": ptr,
+        "perm": torch.sort(inverse, stable=True)[1],
+        "coords": coords,
+        "index": index,
+    }
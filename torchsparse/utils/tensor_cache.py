@@ -1,22 +1,36 @@
-from typing import Any, Dict, Tuple, Union
+from typing import Any, Dict, Optional, Tuple, Union
+from collections import OrderedDict
 from enum import Enum
 import copy
+import weakref
+
+import torch
 
 
 class TensorCacheMode(Enum):
     SEPARATE_TENSOR_CACHE = 0
     GLOBAL_TENSOR_CACHE = 1
+    PERSISTENT_TENSOR_CACHE = 2
 
 
 _tensor_cache_mode = TensorCacheMode.SEPARATE_TENSOR_CACHE
 _global_tensor_cache = None
+_persistent_tensor_cache = None
+_tensor_cache_max_bytes = None
+# id of a cached kmap -> (weak reference to the TensorCache, key) of the
+# entries holding it, see resize_cached_kmap
+_kmap_owners: Dict[int, list] = {}
 
 
 def set_tensor_cache_mode(mode: TensorCacheMode):
     r"""
     _tensor_cache_mode is set SEPARATE_TENSOR_CACHE by default
     if _tensor_cache_mode is set to GLOBAL_TENSOR_CACHE
-    the _global_tensor_cache must be cleared after each forward/backward
+    the _global_tensor_cache must be cleared after each forward/backward,
+    unless a memory ceiling is set with set_tensor_cache_max_bytes
+    if _tensor_cache_mode is set to PERSISTENT_TENSOR_CACHE
+    input tensors with a known coordinate set reuse the caches of a previous
+    iteration (see PersistentTensorCache)
     """
     assert isinstance(
         mode, TensorCacheMode
@@ -30,13 +44,289 @@ def get_tensor_cache_mode() -> TensorCacheMode:
     return copy.deepcopy(_tensor_cache_mode)
 
 
+def set_tensor_cache_max_bytes(max_bytes: Optional[int]):
+    r"""
+    default memory ceiling of newly created TensorCache objects
+    None (the default) disables eviction
+    """
+    global _tensor_cache_max_bytes
+    _tensor_cache_max_bytes = max_bytes
+
+
+def get_tensor_cache_max_bytes() -> Optional[int]:
+    global _tensor_cache_max_bytes
+    return _tensor_cache_max_bytes
+
+
+class _CacheDict(dict):
+    r"""
+    dict that reports every entry to its owning TensorCache, which keeps
+    the byte size, the last use and the hit/miss counters of the entry
+    """
+
+    def __init__(self, owner: "TensorCache", name: str) -> None:
+        super().__init__()
+        self.owner = owner
+        self.name = name
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            self.owner._touch(self.name, key, hit=True)
+            return dict.__getitem__(self, key)
+        self.owner._miss(self.name, key)
+        return default
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        self.owner._touch(self.name, key, hit=True)
+        return value
+
+    def __setitem__(self, key, value) -> None:
+        self.owner._forget(self.name, key)
+        dict.__setitem__(self, key, value)
+        self.owner._add(self.name, key)
+        self.owner._touch(self.name, key, hit=False)
+        self.owner._evict()
+
+    def setdefault(self, key, default=None):
+        if not dict.__contains__(self, key):
+            self[key] = default
+        return self[key]
+
+    def __delitem__(self, key) -> None:
+        self.owner._forget(self.name, key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *args):
+        self.owner._forget(self.name, key)
+        return dict.pop(self, key, *args)
+
+    def clear(self) -> None:
+        for key in list(self.keys()):
+            self.owner._forget(self.name, key)
+        dict.clear(self)
+
+
 class TensorCache:
+    r"""
+    per-input store of coordinate maps (cmaps), kernel maps (kmaps), hash
+    tables (hashmaps) and batch segment indices (segments). The byte size of every entry is tracked, and
+    once the total exceeds max_bytes the least recently used kmaps and
+    hashmaps are evicted (they are rebuilt on demand). cmaps are needed by
+    transposed convolutions and are never evicted. Tensors shared between
+    entries (e.g. the hash tables held by kmaps) are counted once, and only
+    freed once no entry holds them.
+    """
+
+    _evictable = ("hashmaps", "kmaps")
+
     def __init__(
         self,
+        max_bytes: Optional[int] = None,
     ) -> None:
-        self.cmaps: Dict[Tuple[int, ...], Tuple[torch.Tensor, Tuple[int, ...]]] = {}
-        self.kmaps: Dict[Tuple[Any, ...], Any] = {}
-        self.hashmaps: Dict[Tuple[int, ...], Tuple[Any, ...]] = {}
+        if max_bytes is None:
+            max_bytes = get_tensor_cache_max_bytes()
+        self.max_bytes = max_bytes
+        self._clock = 0
+        # (name, key) -> [tensor keys, last use]
+        self._entries: Dict[Tuple[str, Any], list] = {}
+        # tensor key -> [nbytes, number of entries holding the tensor]
+        self._tensors: Dict[Tuple[Any, int], list] = {}
+        self._nbytes = 0
+        self._ref = weakref.ref(self, _forget_dead_cache)
+        # (name, stride) -> {"hits": ..., "misses": ..., "evictions": ...}
+        self._counters: Dict[Tuple[str, Tuple[int, ...]], Dict[str, int]] = {}
+        self.cmaps: Dict[Tuple[int, ...], Tuple[torch.Tensor, Tuple[int, ...]]] = (
+            _CacheDict(self, "cmaps")
+        )
+        self.kmaps: Dict[Tuple[Any, ...], Any] = _CacheDict(self, "kmaps")
+        self.hashmaps: Dict[Tuple[int, ...], Tuple[Any, ...]] = _CacheDict(
+            self, "hashmaps"
+        )
+        # stride -> (coords, batch segments of coords); tiny, not tracked
+        self.segments: Dict[Tuple[int, ...], Tuple[torch.Tensor, Dict]] = {}
+        # stride -> used slots of hashmaps[stride], removed keys included;
+        # kept by streaming updates (see update_kernel_maps), not tracked
+        self.hashmap_slots: Dict[Tuple[int, ...], int] = {}
+        # stride -> changes of the last streaming update and the number of
+        # updates so far (see update_kernel_maps), not tracked
+        self.deltas: Dict[Tuple[int, ...], Dict[str, Any]] = {}
+        self.version = 0
+        # space-filling curve that orders the rows of every stride, or None
+        # (see SparseTensor.reorder)
+        self.curve: Optional[str] = None
+
+    @staticmethod
+    def _stride(name: str, key: Any) -> Tuple[int, ...]:
+        # kmaps are keyed by (input stride, kernel size, stride, dilation)
+        return key[0] if name == "kmaps" else key
+
+    def _counter(self, name: str, key: Any) -> Dict[str, int]:
+        return self._counters.setdefault(
+            (name, self._stride(name, key)), {"hits": 0, "misses": 0, "evictions": 0}
+        )
+
+    def _touch(self, name: str, key: Any, hit: bool) -> None:
+        self._clock += 1
+        self._entries[(name, key)][1] = self._clock
+        if hit:
+            self._counter(name, key)["hits"] += 1
+
+    def _miss(self, name: str, key: Any) -> None:
+        self._counter(name, key)["misses"] += 1
+
+    def _add(self, name: str, key: Any) -> None:
+        # sizes a new or changed entry; its tensors are counted once across
+        # all entries
+        entry = self._entries.get((name, key))
+        use = self._clock if entry is None else entry[1]
+        self._forget(name, key)
+        value = dict.__getitem__(getattr(self, name), key)
+        tensors = _get_tensors(value, {})
+        for tensor_key, nbytes in tensors.items():
+            if tensor_key not in self._tensors:
+                self._tensors[tensor_key] = [nbytes, 0]
+                self._nbytes += nbytes
+            self._tensors[tensor_key][1] += 1
+        self._entries[(name, key)] = [list(tensors), use]
+        if name == "kmaps":
+            _kmap_owners.setdefault(id(value), []).append((self._ref, key))
+
+    def _forget(self, name: str, key: Any) -> None:
+        entry = self._entries.pop((name, key), None)
+        if entry is None:
+            return
+        for tensor_key in entry[0]:
+            tensor = self._tensors[tensor_key]
+            tensor[1] -= 1
+            if tensor[1] == 0:
+                self._nbytes -= tensor[0]
+                del self._tensors[tensor_key]
+        if name == "kmaps":
+            _forget_kmap_owner(self, key)
+
+    def _resize(self) -> None:
+        # sizes every entry again, e.g. after its tensors were replaced
+        for name, key in list(self._entries):
+            self._add(name, key)
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        while self._nbytes > self.max_bytes:
+            candidates = [
+                (use, name, key)
+                for (name, key), (_, use) in self._entries.items()
+                if name in self._evictable and use < self._clock
+            ]
+            if not candidates:
+                return
+            _, name, key = min(candidates, key=lambda x: x[0])
+            self._forget(name, key)
+            dict.__delitem__(getattr(self, name), key)
+            self._counter(name, key)["evictions"] += 1
+
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def to(self, device, non_blocking: bool = True) -> "TensorCache":
+        r"""
+        moves every cached tensor to device in place, e.g. kernel maps that
+        were built by DataLoader workers
+        """
+        memo = {}
+        # segments are keyed by coords identity, they are rebuilt on demand
+        self.segments.clear()
+        self.deltas = {}
+        for name in ("cmaps", "kmaps", "hashmaps"):
+            maps = getattr(self, name)
+            for key, value in maps.items():
+                value = _to_device(value, device, non_blocking, memo)
+                dict.__setitem__(maps, key, value)
+        self._resize()
+        return self
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the cache dicts refer back to their owner; pickle them as plain
+        # dicts so that caches can be shipped from DataLoader workers.
+        # tensors are keyed by address, they are sized again on unpickling
+        state = self.__dict__.copy()
+        for name in ("cmaps", "kmaps", "hashmaps"):
+            state[name] = dict(state[name])
+        del state["_ref"]
+        state["_tensors"] = {}
+        state["_nbytes"] = 0
+        state["_entries"] = {
+            entry: [[], use] for entry, (_, use) in self._entries.items()
+        }
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._ref = weakref.ref(self, _forget_dead_cache)
+        for name in ("cmaps", "kmaps", "hashmaps"):
+            maps = _CacheDict(self, name)
+            dict.update(maps, state[name])
+            setattr(self, name, maps)
+        self._resize()
+
+    def stats(self) -> Dict[str, Any]:
+        r"""
+        total entries and bytes, plus entries, bytes, hits, misses and
+        evictions per (map type, stride). Tensors shared between entries
+        count toward the bytes of each of them
+        """
+        per_stride: Dict[Tuple[str, Tuple[int, ...]], Dict[str, int]] = {}
+        for (name, stride), counters in self._counters.items():
+            per_stride[(name, stride)] = dict(entries=0, nbytes=0, **counters)
+        for (name, key), (tensor_keys, _) in self._entries.items():
+            stats = per_stride.setdefault(
+                (name, self._stride(name, key)),
+                dict(entries=0, nbytes=0, hits=0, misses=0, evictions=0),
+            )
+            stats["entries"] += 1
+            stats["nbytes"] += sum(self._tensors[k][0] for k in tensor_keys)
+        return {
+            "entries": len(self._entries),
+            "nbytes": self.nbytes(),
+            "max_bytes": self.max_bytes,
+            "per_stride": per_stride,
+        }
+
+
+def resize_cached_kmap(kmap: Dict) -> None:
+    r"""
+    sizes the TensorCache entries holding kmap again after fields were added
+    to it in place (transposed and backward maps), and evicts least recently
+    used entries if that exceeds their max_bytes
+    """
+    for ref, key in list(_kmap_owners.get(id(kmap), ())):
+        _caches = ref()
+        if _caches is None or dict.get(_caches.kmaps, key) is not kmap:
+            continue
+        _caches._add("kmaps", key)
+        _caches._touch("kmaps", key, hit=False)
+        _caches._evict()
+
+
+def _forget_kmap_owner(_caches: TensorCache, key: Any) -> None:
+    kmap = dict.get(_caches.kmaps, key)
+    owners = [
+        (ref, k)
+        for ref, k in _kmap_owners.pop(id(kmap), ())
+        if ref() is not None and (ref is not _caches._ref or k != key)
+    ]
+    if owners:
+        _kmap_owners[id(kmap)] = owners
+
+
+def _forget_dead_cache(ref: "weakref.ref[TensorCache]") -> None:
+    for kmap_id in list(_kmap_owners):
+        owners = [owner for owner in _kmap_owners[kmap_id] if owner[0] is not ref]
+        if owners:
+            _kmap_owners[kmap_id] = owners
+        else:
+            del _kmap_owners[kmap_id]
 
 
 def get_global_tensor_cache():
@@ -52,7 +342,201 @@ def set_global_tensor_cache(tensor_cache):
 def clear_global_tensor_cache():
     r"""
     if _tensor_cache_mode is set to GLOBAL_TENSOR_CACHE
-    the _global_tensor_cache must be cleared after each forward/backward
+    the _global_tensor_cache must be cleared after each forward/backward,
+    unless a memory ceiling is set with set_tensor_cache_max_bytes
     """
     global _global_tensor_cache
     _global_tensor_cache = None
+
+
+# odd 64-bit multipliers for the coordinate fingerprint (one per column)
+_FINGERPRINT_WEIGHTS = (
+    0x9E3779B97F4A7C15 - (1 << 64),
+    0x632BE59BD9B4E019,
+    0x85EBCA77C2B2AE63 - (1 << 64),
+    0x27D4EB2F165667C5,
+    0x165667B19E3779F9,
+)
+
+
+def fingerprint_coords(coords: torch.Tensor) -> Tuple[Any, ...]:
+    r"""
+    cheap content hash of a coordinate tensor: a few wrapping int64
+    reductions, computed on the tensor's device with a single sync
+    """
+    weights = torch.tensor(
+        _FINGERPRINT_WEIGHTS[: coords.shape[1]],
+        dtype=torch.int64,
+        device=coords.device,
+    )
+    h = (coords.long() * weights).sum(1)
+    sums = torch.stack([h.sum(), (h * h).sum(), (h ^ (h >> 29)).sum()])
+    return (tuple(coords.shape), coords.dtype, str(coords.device)) + tuple(
+        sums.tolist()
+    )
+
+
+def _to_device(obj: Any, device, non_blocking: bool, memo: Dict[int, Any]) -> Any:
+    # memo keeps tensors shared between maps (e.g. coordinates) shared
+    if isinstance(obj, torch.Tensor):
+        if id(obj) not in memo:
+            memo[id(obj)] = (obj, obj.to(device, non_blocking=non_blocking))
+        return memo[id(obj)][1]
+    if isinstance(obj, dict):
+        # kmaps are updated in place, the same dict may be held elsewhere
+        for key, value in obj.items():
+            obj[key] = _to_device(value, device, non_blocking, memo)
+        return obj
+    if isinstance(obj, list):
+        return [_to_device(x, device, non_blocking, memo) for x in obj]
+    if isinstance(obj, tuple):
+        return tuple(_to_device(x, device, non_blocking, memo) for x in obj)
+    return obj
+
+
+def get_tensor_nbytes(obj: Any, seen: Optional[set] = None) -> int:
+    r"""
+    total size of the tensors reachable from obj through dicts, lists and
+    tuples; tensors sharing the same memory are only counted once
+    """
+    if seen is None:
+        seen = set()
+    tensors = _get_tensors(obj, {})
+    nbytes = sum(n for key, n in tensors.items() if key not in seen)
+    seen.update(tensors)
+    return nbytes
+
+
+def _get_tensors(obj: Any, tensors: Dict[Tuple[Any, int], int]) -> Dict:
+    # (device, address) -> size of the tensors reachable from obj
+    if isinstance(obj, torch.Tensor):
+        key = (obj.device, obj.data_ptr())
+        tensors.setdefault(key, obj.numel() * obj.element_size())
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            _get_tensors(v, tensors)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            _get_tensors(v, tensors)
+    return tensors
+
+
+class PersistentTensorCache:
+    r"""
+    cross-iteration store of TensorCache objects, keyed by the coordinate
+    fingerprint and stride of the input SparseTensor. Least recently used
+    entries are evicted once the cached tensors exceed max_bytes (or the
+    number of entries exceeds max_entries). With verify=True a fingerprint
+    match is confirmed with an exact comparison of the coordinates.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 1 << 30,
+        max_entries: Optional[int] = None,
+        verify: bool = True,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.verify = verify
+        # (fingerprint, stride) -> (coords, TensorCache), oldest first
+        self.entries: Dict[Tuple[Any, ...], Tuple[torch.Tensor, TensorCache]] = (
+            OrderedDict()
+        )
+        # size of every entry when it was last used, and their sum
+        self._sizes: Dict[Tuple[Any, ...], int] = {}
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, coords: torch.Tensor, stride: Tuple[int, ...]) -> TensorCache:
+        # the caches of the previous lookup have been filled since
+        if self.entries:
+            self._resize(next(reversed(self.entries)))
+
+        key = (fingerprint_coords(coords), stride)
+        entry = self.entries.get(key)
+        if entry is not None and (
+            not self.verify
+            or entry[0] is coords
+            or torch.equal(entry[0], coords)
+        ):
+            self.hits += 1
+            self.entries.move_to_end(key)
+            self._resize(key)
+            self.evict()
+            return entry[1]
+
+        self.misses += 1
+        _caches = TensorCache()
+        self._remove(key)
+        self.entries[key] = (coords, _caches)
+        self._resize(key)
+        self.evict()
+        return _caches
+
+    def _resize(self, key: Tuple[Any, ...]) -> None:
+        coords, _caches = self.entries[key]
+        nbytes = get_tensor_nbytes(coords) + _caches.nbytes()
+        self._nbytes += nbytes - self._sizes.get(key, 0)
+        self._sizes[key] = nbytes
+
+    def _remove(self, key: Tuple[Any, ...]) -> Optional[Tuple[Any, ...]]:
+        self._nbytes -= self._sizes.pop(key, 0)
+        return self.entries.pop(key, None)
+
+    def rekey(
+        self, coords: torch.Tensor, new_coords: torch.Tensor, stride: Tuple[int, ...]
+    ) -> None:
+        r"""
+        moves the entry of coords to new_coords, e.g. after its caches were
+        patched by a streaming update (see SparseTensor.update)
+        """
+        entry = self._remove((fingerprint_coords(coords), stride))
+        if entry is not None:
+            key = (fingerprint_coords(new_coords), stride)
+            self._remove(key)
+            self.entries[key] = (new_coords, entry[1])
+            self._resize(key)
+
+    def nbytes(self) -> int:
+        # caches are filled after their lookup: size the latest one again
+        if self.entries:
+            self._resize(next(reversed(self.entries)))
+        return self._nbytes
+
+    def evict(self) -> None:
+        # never evict the most recently used entry
+        while len(self.entries) > 1 and (
+            (self.max_entries is not None and len(self.entries) > self.max_entries)
+            or self._nbytes > self.max_bytes
+        ):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self._sizes.clear()
+        self._nbytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "nbytes": self.nbytes(),
+        }
+
+
+def get_persistent_tensor_cache() -> PersistentTensorCache:
+    global _persistent_tensor_cache
+    if _persistent_tensor_cache is None:
+        _persistent_tensor_cache = PersistentTensorCache()
+    return _persistent_tensor_cache
+
+
+def set_persistent_tensor_cache(tensor_cache: Optional[PersistentTensorCache]):
+    global _persistent_tensor_cache
+    _persistent_tensor_cache = tensor_cache
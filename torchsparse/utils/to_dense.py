@@ -4,7 +4,6 @@ from torch.autograd import Function
 # from torch.cuda.amp import custom_bwd, custom_fwd
 from typing import Tuple
 
-import torchsparse.backend
 from torchsparse.utils.utils import make_tensor
 
 __all__ = ["to_dense"]
@@ -18,47 +17,78 @@ class ToDenseFunction(Function):
         feats: torch.Tensor,
         coords: torch.Tensor,
         spatial_range: Tuple[int],
+        channel_first: bool = False,
     ) -> torch.Tensor:
+        import torchsparse.backend
+
         feats = feats.contiguous()
         coords = coords.contiguous().int()
-        outputs = torch.zeros(
-            spatial_range + (feats.size(1),), dtype=feats.dtype, device=feats.device
-        )
+        if channel_first and feats.device.type == "cpu":
+            shape = spatial_range[:1] + (feats.size(1),) + spatial_range[1:]
+        else:
+            shape = spatial_range + (feats.size(1),)
+        outputs = torch.zeros(shape, dtype=feats.dtype, device=feats.device)
         spatial_range = make_tensor(spatial_range, dtype=torch.int, device=feats.device)
 
         if feats.device.type == "cuda":
             torchsparse.backend.to_dense_forward_cuda(
                 feats, coords, spatial_range, outputs
             )
+            if channel_first:
+                outputs = outputs.permute(0, 4, 1, 2, 3).contiguous()
+        elif feats.device.type == "cpu":
+            torchsparse.backend.to_dense_forward_cpu(
+                feats, coords, spatial_range, outputs, channel_first
+            )
         else:
             raise NotImplementedError
 
-        ctx.for_backwards = (coords, spatial_range)
+        ctx.for_backwards = (coords, spatial_range, channel_first)
         return outputs.to(feats.dtype)
 
     @staticmethod
     # @custom_bwd
     def backward(ctx, grad_output: torch.Tensor):
-        coords, spatial_range = ctx.for_backwards
-        grad_output = grad_output.contiguous()
+        import torchsparse.backend
+
+        coords, spatial_range, channel_first = ctx.for_backwards
+        channels = grad_output.size(1) if channel_first else grad_output.size(-1)
         grad_feats = torch.zeros(
             coords.size(0),
-            grad_output.size(-1),
+            channels,
             dtype=grad_output.dtype,
             device=grad_output.device,
         )
 
         if grad_output.device.type == "cuda":
+            if channel_first:
+                grad_output = grad_output.permute(0, 2, 3, 4, 1)
             torchsparse.backend.to_dense_backward_cuda(
-                grad_output, coords, spatial_range, grad_feats
+                grad_output.contiguous(), coords, spatial_range, grad_feats
+            )
+        elif grad_output.device.type == "cpu":
+            torchsparse.backend.to_dense_backward_cpu(
+                grad_output.contiguous(),
+                coords,
+                spatial_range,
+                grad_feats,
+                channel_first,
             )
         else:
             raise NotImplementedError
 
-        return grad_feats, None, None
+        return grad_feats, None, None, None
 
 
 def to_dense(
-    feats: torch.Tensor, coords: torch.Tensor, spatial_range: Tuple[int]
+    feats: torch.Tensor,
+    coords: torch.Tensor,
+    spatial_range: Tuple[int],
+    channel_first: bool = False,
 ) -> torch.Tensor:
-    return ToDenseFunction.apply(feats, coords, spatial_range)
+    """Scatters sparse features into a dense (B, H, W, D, C) tensor.
+
+    With ``channel_first``, the output is laid out as (B, C, H, W, D) instead;
+    on CPU it is written in that layout directly, without a permuted copy.
+    """
+    return ToDenseFunction.apply(feats, coords, tuple(spatial_range), channel_first)